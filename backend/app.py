@@ -1,36 +1,304 @@
-from flask import Flask, request, jsonify
+import time
+APP_STARTED = time.perf_counter()
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import os
-from datetime import datetime
-from app.image_preprocessing import preprocess_image_nlp
-from app.ocr_service import detect_text_regions_nlp, extract_text_by_region_nlp
-from app.ner_service import extract_fields_nlp
-from app.logger import app_logger
-import difflib
-import easyocr
-import re
-import cv2
-from ultralytics import YOLO
-
-reader = easyocr.Reader(['en'])
+from werkzeug.serving import make_server
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.image_preprocessing import decode_image_bytes, check_image_pixels, ImageTooLarge
+from app.yolo_service import (extract_text_from_yolo, extract_text_from_yolo_batch, yolo_batcher,
+                              YOLO_MAX_BATCH_SIZE)
+from app.pipelines import extract_fields, extract_fields_from_images_nlp, PIPELINE_MODELS, boot_models
+from app.validation import validate_data__nlp, validate_data_yolo, VALIDATORS
+from app import workers
+from app.workers import PoolClosed, WorkerError
+from app.jobs import job_manager, QueueFull, FINISHED_STATES
+from app.metrics import (metrics, begin_request, end_request, server_timing_header,
+                         REQUESTS, REQUEST_ERRORS, REQUEST_LATENCY, STARTUP_SECONDS,
+                         ADMISSION_REJECTED)
+from app.admission import (limiters, set_deadline, check_deadline, Overloaded,
+                           DeadlineExceeded, REQUEST_TIMEOUT)
+from app.logger import app_logger, set_request_id
+from app.profiles import PROFILES, PROFILE, profile_name, set_profile, use_profile
+from app.model_registry import registry
+from app.storage import save_upload_async, flush as flush_storage
+from app.result_cache import result_cache, cache_key
+from app.roster import roster, ROSTER_PATH
+from app.video import extract_fields_from_video_bytes
+from app.utils import IMAGE_EXTENSIONS
+import json
+import math
+import uuid
+import functools
+import signal
+import threading
+import zipfile
+import csv
+import io
+
 app = Flask(__name__)
 CORS(app)
 app.config['CORS_HEADERS'] = 'Content-Type'
 
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['MAX_BATCH_IMAGES'] = 64
+app.config['MAX_ARCHIVE_ENTRY_SIZE'] = 16 * 1024 * 1024
+# Uncompressed bytes read from one batch archive, across all entries
+app.config['MAX_ARCHIVE_TOTAL_SIZE'] = 256 * 1024 * 1024
+app.config['WORKER_PROCESSES'] = workers.WORKER_PROCESSES
+# Add a Server-Timing stage breakdown to every response; clients can also
+# ask for it per request with an X-Debug-Timing header
+app.config['TIMING_HEADER'] = os.environ.get('TIMING_HEADER', '0') == '1'
 
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
+# Seconds spent in each startup phase, reported by /readyz
+startup = {"imports": round(time.perf_counter() - APP_STARTED, 3)}
+STARTUP_SECONDS.set(startup["imports"], component='imports')
+warm_up_done = threading.Event()
+_warm_up_started = False
+_warm_up_lock = threading.Lock()
+
+
+def warm_up():
+    # Load and warm the BOOT_PIPELINES models (in worker mode the workers
+    # do that themselves) and the roster. Runs in the background so the
+    # server answers /healthz while models load; /readyz waits for it.
+    started = time.perf_counter()
+    try:
+        if not app.config['WORKER_PROCESSES']:
+            registry.preload(boot_models())
+        if ROSTER_PATH:
+            roster.load(ROSTER_PATH)
+    except Exception as e:
+        app_logger.error("Warm-up failed: %s", e)
+        startup["error"] = str(e)
+        return
+    startup["warm_up"] = round(time.perf_counter() - started, 3)
+    STARTUP_SECONDS.set(startup["warm_up"], component='warm_up')
+    app_logger.info("Warm-up finished in %ss", startup['warm_up'])
+    warm_up_done.set()
+
+
+def start_warm_up():
+    # Once per process, whichever way the app was started
+    global _warm_up_started
+    with _warm_up_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    # Every log record of this request carries its id; clients may pass one
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    set_request_id(g.request_id)
+    begin_request()
+    # Clients say how long they will wait; past that the work is dropped
+    try:
+        set_deadline(float(request.headers.get('X-Request-Timeout', REQUEST_TIMEOUT)))
+    except ValueError:
+        set_deadline(REQUEST_TIMEOUT)
+    # Probes do not use a profile, so a bad one must not fail them
+    if request.endpoint in ('healthz', 'readyz'):
+        return
+    # Speed/accuracy profile, from a header or the query string so that
+    # the body is not read before admission
+    try:
+        set_profile(request.headers.get('X-Profile') or request.args.get('profile') or PROFILE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+    endpoint = request.endpoint or 'unknown'
+    REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    REQUEST_LATENCY.observe(elapsed, endpoint=endpoint)
+    if response.status_code >= 500:
+        REQUEST_ERRORS.inc(endpoint=endpoint)
+    timings = end_request()
+    if timings and (app.config['TIMING_HEADER'] or request.headers.get('X-Debug-Timing')):
+        response.headers['Server-Timing'] = server_timing_header(
+            timings + [('total', elapsed)])
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    response.headers['X-Profile'] = profile_name()
+    # One structured record per request with its stage breakdown
+    app_logger.info("%s %s %s", request.method, request.path, response.status_code, extra={
+        "endpoint": endpoint,
+        "status": response.status_code,
+        "duration_ms": round(elapsed * 1000, 2),
+        "stages": {stage: round(seconds * 1000, 2) for stage, seconds in timings},
+    })
+    return response
+
+
+metrics.gauge('idcard_scheduler_queue_depth', 'Requests waiting in the YOLO micro-batcher',
+              collect=lambda: {(): yolo_batcher.stats()['queue_depth']})
+metrics.gauge('idcard_cache_entries', 'Entries in the result cache',
+              collect=lambda: {(): result_cache.stats()['entries']})
+metrics.gauge('idcard_cache_lookups', 'Result cache lookups by outcome', ('outcome',),
+              collect=lambda: {('hit',): result_cache.hits, ('miss',): result_cache.misses})
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    return jsonify({"error": f"Upload exceeds {app.config['MAX_CONTENT_LENGTH']} bytes"}), 413
+
+
+def admitted(group):
+    # Admission control for an inference endpoint. The size check and the
+    # wait for a slot both happen before the upload body is read.
+    limiter = limiters[group]
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if (request.content_length or 0) > app.config['MAX_CONTENT_LENGTH']:
+                ADMISSION_REJECTED.inc(endpoint=group, reason='too_large')
+                return upload_too_large(None)
+            try:
+                with limiter.admit():
+                    return view(*args, **kwargs)
+            except Overloaded as e:
+                return jsonify({"error": str(e)}), e.status, {'Retry-After': str(e.retry_after)}
+            except DeadlineExceeded as e:
+                return jsonify({"error": str(e)}), 504
+        return wrapper
+    return decorator
+
+
+def read_image_upload(file, group):
+    # The pixel count comes from the header, so an oversized image is
+    # refused before it is decoded or written to disk
+    data = file.read()
+    try:
+        check_image_pixels(data)
+    except ImageTooLarge as e:
+        ADMISSION_REJECTED.inc(endpoint=group, reason='too_many_pixels')
+        return None, (jsonify({"error": str(e)}), 413)
+    return data, None
+
+
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    return jsonify({"default": PROFILE, "profiles": PROFILES})
+
+
+@app.route('/admission/stats', methods=['GET'])
+def admission_stats():
+    return jsonify({name: limiter.stats() for name, limiter in limiters.items()})
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 
 @app.route("/")
 def server_test():
     return jsonify({"message": "Server is running"})
 
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness: the process serves requests, whether or not models are loaded
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # Readiness: boot models are loaded and warmed (in every worker)
+    ready = warm_up_done.is_set() and (
+        workers.worker_pool is None or workers.worker_pool.ready())
+    body = {"ready": ready, "startup": startup, "models": registry.status()}
+    if workers.worker_pool is not None:
+        body["workers"] = workers.worker_pool.stats()
+    return jsonify(body), 200 if ready else 503
+
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    return jsonify(registry.status()), 200
+
+
+@app.route('/models/<name>/reload', methods=['POST'])
+def reload_model(name):
+    # Hot-swap weights without restarting, e.g. {"source": "runs/detect/train3/weights/best.pt"},
+    # {"source": "en_core_web_md"} or {"source": ["en", "bn"]}
+    payload = request.get_json(silent=True) or {}
+    source = payload.get('source')
+    try:
+        if source is not None:
+            source = registry.check_source(name, source)
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        if workers.worker_pool is not None:
+            version = workers.worker_pool.reload(name, source)
+            if source is not None:
+                registry.set_source(name, source)
+        else:
+            version = registry.reload(name, source)
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        app_logger.error("Model reload failed for %s: %s", name, e)
+        return jsonify({"error": f"Failed to reload model: {str(e)}"}), 500
+    return jsonify({"model": name, "version": version}), 200
+
+
+@app.route('/scheduler/stats', methods=['GET'])
+def scheduler_stats():
+    stats = {"yolo": yolo_batcher.stats()}
+    if workers.worker_pool is not None:
+        stats["workers"] = workers.worker_pool.stats()
+    return jsonify(stats), 200
+
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats()), 200
+
+
+def pipeline_cache_key(data, pipeline):
+    # Swapping any model of the pipeline changes the key, so stale fields
+    # from old weights are never served; profiles read differently too
+    version = '+'.join(registry.version(name) for name in PIPELINE_MODELS[pipeline])
+    return cache_key(data, pipeline, f"{profile_name()}:{version}")
+
+
+def run_extraction(pipeline, data, save_image_path=None):
+    # In worker mode the upload bytes go to a worker process through shared
+    # memory; otherwise decode here and run in-process
+    if workers.worker_pool is not None:
+        check_deadline()
+        return workers.worker_pool.run(pipeline, data, save_image_path)
+    return extract_fields(pipeline, decode_image_bytes(data), save_image_path)
+
+
+def extract_fields_cached(pipeline, data, save_image_path=None):
+    # Retries of the same image reuse the extracted fields
+    key = pipeline_cache_key(data, pipeline)
+    fields = result_cache.get(key)
+    if fields is not None:
+        return fields, 'HIT'
+    fields = run_extraction(pipeline, data, save_image_path)
+    result_cache.set(key, fields)
+    return fields, 'MISS'
+
+
 @app.route('/process-image-nlp', methods=['POST'])
+@admitted('nlp')
 def process_image_nlp():
     if 'image' not in request.files:
         app_logger.error('No image part')
@@ -47,166 +315,33 @@ def process_image_nlp():
     if file:
         filename = secure_filename(file.filename)
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        app_logger.info(f'Image saved to {file_path}')
+        data, error = read_image_upload(file, 'nlp')
+        if error:
+            return error
+        save_upload_async(file_path, data)
 
         try:
-            _, original_image = preprocess_image_nlp(file_path)
-            regions = detect_text_regions_nlp(original_image)
-            lines = extract_text_by_region_nlp(regions)
-            fields = extract_fields_nlp(lines)
+            fields, cache_status = extract_fields_cached('nlp', data)
 
             # Validate input data against extracted data
             validation_results = validate_data__nlp(
                 fields, name_input, university_input)
             app_logger.info("Extraction and validation successful")
-            return jsonify(validation_results), 200
+            return jsonify(validation_results), 200, {'X-Cache': cache_status}
+        except PoolClosed:
+            return jsonify({"error": "Server is shutting down"}), 503
+        except DeadlineExceeded as e:
+            return jsonify({"error": str(e)}), 504
         except Exception as e:
-            app_logger.error(f"Processing error: {str(e)}")
+            app_logger.error("Processing error: %s", e)
             return jsonify({"error": "Failed to process image"}), 500
 
 
-def validate_data__nlp(extracted_fields, name_input, university_input):
-    name_extracted = extracted_fields.get('Name') or "Not Recognised"
-    university_extracted = extracted_fields.get(
-        'University') or "Not Recognised"
-    expiration_extracted = extracted_fields.get(
-        'Expiration') or "Not Recognised"
-
-    name_similarity = (
-        calculate_similarity_nlp(name_input, name_extracted)
-        if name_extracted != "Not Recognised" else "Not Recognised"
-    )
-    university_similarity = (
-        calculate_similarity_nlp(university_input, university_extracted)
-        if university_extracted != "Not Recognised" else "Not Recognised"
-    )
-    expiration_status = check_expiration_nlp(expiration_extracted)
-
-    # Determine if the overall card is valid based on these results
-    results = {
-        "fields": {
-            "Name": name_extracted,
-            "University": university_extracted,
-            "Expiration": expiration_extracted
-        },
-        "name_match": name_similarity,
-        "university_match": university_similarity,
-        "is_expired": expiration_status,
-        "is_valid_card": determine_overall_validity_nlp({
-            "name_match": name_similarity,
-            "university_match": university_similarity,
-            "is_expired": expiration_status
-        })
-    }
-    return results
-
-
-def calculate_similarity_nlp(input_text, extracted_text):
-    similarity = difflib.SequenceMatcher(
-        None, input_text.lower(), extracted_text.lower()).ratio()
-    return round(similarity * 100, 2)
-
-
-def check_expiration_nlp(expiration_date_str):
-    if expiration_date_str == "Not Recognised":
-        return True
-    try:
-        expiration_date = datetime.strptime(expiration_date_str, "%m/%d/%Y")
-        return expiration_date < datetime.now()
-    except ValueError:
-        return True  # If the expiration date is invalid or unrecognized, mark as expired
-
-
-def determine_overall_validity_nlp(validation_results):
-    if validation_results['name_match'] == "Not Recognised" or validation_results['university_match'] == "Not Recognised" or validation_results['is_expired']:
-        return False
-
-    name_threshold = 70
-    university_threshold = 70
-
-    name_valid = validation_results['name_match'] >= name_threshold
-    university_valid = validation_results['university_match'] >= university_threshold
-    expiration_valid = not validation_results['is_expired']
-
-    return name_valid and university_valid and expiration_valid
-
 # YOLO
 
 
-def remove_special_characters_yolo(text):
-    return re.sub(r'[^A-Za-z0-9\s/]', '', text)
-
-
-# Function to correct common OCR mistakes
-def correct_ocr_mistakes_yolo(text):
-    corrections = {'0': 'O', '1': 'I', '5': 'S'}
-    for incorrect, correct in corrections.items():
-        text = text.replace(incorrect, correct)
-    return text
-
-
-# Function to clean date formats
-def clean_date_format_yolo(text):
-    return re.sub(r'(\d{1,2})/(\d{1,2})/(\d{4})', lambda m: f'{int(m.group(1)):02}/{int(m.group(2)):02}/{m.group(3)}', text)
-
-
-# Function to clean OCR text (combining all steps)
-def clean_ocr_text_yolo(text):
-    text = remove_special_characters_yolo(text)
-    text = correct_ocr_mistakes_yolo(text)
-    text = clean_date_format_yolo(text)
-    return text
-
-
-# Function to crop regions detected by YOLO, apply OCR, and clean text
-def extract_text_from_yolo(image_path, model, save_image_path):
-    # Load the image using OpenCV
-    image = cv2.imread(image_path)
-    if image is None:
-        print(f"Error loading image {image_path}")
-        return None
-
-    # Run YOLO inference to detect text regions
-    results = model.predict(source=image_path, save=False)
-
-    # Dictionary to store texts class-wise
-    detected_text = {
-        "Expiration": [],
-        "Name": [],
-        "University": []
-    }
-
-    # Iterate through each detected object (bounding boxes + class)
-    for box, cls in zip(results[0].boxes.xyxy, results[0].boxes.cls):
-        x1, y1, x2, y2 = map(int, box)
-        class_id = int(cls)
-
-        # Crop the region from the image based on bounding box
-        cropped_image = image[y1:y2, x1:x2]
-
-        # Use EasyOCR to extract text from the cropped region
-        result = reader.readtext(cropped_image, detail=0)
-        if result:
-            # Clean the OCR output
-            result = [clean_ocr_text_yolo(text) for text in result]
-
-            # Store cleaned text based on detected class
-            if class_id == 0:  # 'Expiration'
-                detected_text["Expiration"].extend(result)
-            elif class_id == 1:  # 'Name'
-                detected_text["Name"].extend(result)
-            elif class_id == 2:  # 'University'
-                detected_text["University"].extend(result)
-
-    # Save the image with bounding boxes
-    cv2.imwrite(save_image_path, image)
-    print(f"Image saved with bounding boxes at {save_image_path}")
-
-    return detected_text
-
-
 @app.route('/process-image-yolo', methods=['POST'])
+@admitted('yolo')
 def process_image_yolo():
     if 'image' not in request.files:
         return jsonify({"error": "No image part"}), 400
@@ -221,101 +356,553 @@ def process_image_yolo():
     if file:
         filename = secure_filename(file.filename)
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        data, error = read_image_upload(file, 'yolo')
+        if error:
+            return error
+        save_upload_async(file_path, data)
 
         # Path to save the image with bounding boxes
         save_image_path = os.path.join(
             app.config['UPLOAD_FOLDER'], 'detected_' + filename)
 
-        # Initialize the YOLO model
-        model = YOLO(r'runs/detect/train2/weights/best.pt')
-
         try:
-            # Detect text regions using YOLO, extract text using OCR, and save image
-            extracted_texts = extract_text_from_yolo(
-                file_path, model, save_image_path)
+            # Decode once, then detect text regions using YOLO and extract text using OCR
+            extracted_texts, cache_status = extract_fields_cached(
+                'yolo', data, save_image_path)
 
             # Validate input data against extracted data
             validation_results = validate_data_yolo(
                 extracted_texts, name_input, university_input)
 
-            return jsonify(validation_results), 200
+            return jsonify(validation_results), 200, {'X-Cache': cache_status}
+        except PoolClosed:
+            return jsonify({"error": "Server is shutting down"}), 503
+        except DeadlineExceeded as e:
+            return jsonify({"error": str(e)}), 504
         except Exception as e:
             return jsonify({"error": f"Failed to process image: {str(e)}"}), 500
 
 
-def validate_data_yolo(extracted_fields, name_input, university_input):
-    # Handle null values for extracted fields
-    name_extracted = ' '.join(
-        extracted_fields.get('Name', [])) or "Not Recognised"
-    university_extracted = ' '.join(
-        extracted_fields.get('University', [])) or "Not Recognised"
-    expiration_extracted = ' '.join(
-        extracted_fields.get('Expiration', [])) or "Not Recognised"
-
-    name_similarity = (
-        calculate_similarity_yolo(name_input, name_extracted)
-        if name_extracted != "Not Recognised" else "Not Recognised"
-    )
-    university_similarity = (
-        calculate_similarity_yolo(university_input, university_extracted)
-        if university_extracted != "Not Recognised" else "Not Recognised"
-    )
-    expiration_status = check_expiration_yolo(expiration_extracted)
-
-    # Determine if the overall card is valid based on these results
-    results = {
-        "fields": {
-            "Name": name_extracted,
-            "University": university_extracted,
-            "Expiration": expiration_extracted
-        },
-        "name_match": name_similarity,
-        "university_match": university_similarity,
-        "is_expired": expiration_status,
-        "is_valid_card": determine_overall_validity_yolo({
-            "name_match": name_similarity,
-            "university_match": university_similarity,
-            "is_expired": expiration_status
-        })
-    }
-    return results
-
-
-def calculate_similarity_yolo(input_text, extracted_text):
-    if input_text and extracted_text != "Not Recognised":
-        similarity = difflib.SequenceMatcher(
-            None, input_text.lower(), extracted_text.lower()).ratio()
-        return round(similarity * 100, 2)
-    return "Not Recognised"
-
-
-def check_expiration_yolo(expiration_date_str):
-    # Mark as expired (True) if expiration is "Not Recognised"
-    if expiration_date_str == "Not Recognised":
-        return True
+# Auto
+
+
+@app.route('/process-image', methods=['POST'])
+@admitted('auto')
+def process_image():
+    # pipeline=auto (default) runs YOLO first and the NLP path only for the
+    # fields YOLO is unsure about; yolo or nlp force a single pipeline
+    if 'image' not in request.files:
+        return jsonify({"error": "No image part"}), 400
+
+    file = request.files['image']
+    name_input = request.form.get('name', '')
+    university_input = request.form.get('university', '')
+    pipeline = request.form.get('pipeline', 'auto')
+    if pipeline not in VALIDATORS:
+        return jsonify({"error": f"Unknown pipeline '{pipeline}'"}), 400
+
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+
+    filename = secure_filename(file.filename)
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    data, error = read_image_upload(file, 'auto')
+    if error:
+        return error
+    save_upload_async(file_path, data)
+    save_image_path = os.path.join(
+        app.config['UPLOAD_FOLDER'], 'detected_' + filename)
+
     try:
-        expiration_date = datetime.strptime(expiration_date_str, "%m/%d/%Y")
-        return expiration_date < datetime.now()
-    except ValueError:
-        return True  # If the expiration date is invalid or unrecognized, mark as expired
+        fields, cache_status = extract_fields_cached(pipeline, data, save_image_path)
+        validation_results = VALIDATORS[pipeline](
+            fields, name_input, university_input)
+        return jsonify(validation_results), 200, {'X-Cache': cache_status}
+    except PoolClosed:
+        return jsonify({"error": "Server is shutting down"}), 503
+    except DeadlineExceeded as e:
+        return jsonify({"error": str(e)}), 504
+    except Exception as e:
+        app_logger.error("Processing error: %s", e)
+        return jsonify({"error": "Failed to process image"}), 500
+
+
+# Batch
+
+
+class BatchTooLarge(ValueError):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def read_batch_archive(archive):
+    # Images inside a zip, with optional manifest.csv (filename,name,university).
+    # Limits are checked against the sizes in the zip directory before any
+    # entry is decompressed; zipfile never inflates past an entry's stated size.
+    items, inputs = [], {}
+    with zipfile.ZipFile(archive) as zf:
+        entries = [info for info in zf.infolist() if not info.is_dir()]
+        images = [info for info in entries
+                  if os.path.basename(info.filename).lower().endswith(IMAGE_EXTENSIONS)]
+        if len(images) > app.config['MAX_BATCH_IMAGES']:
+            raise BatchTooLarge(f"Batch exceeds {app.config['MAX_BATCH_IMAGES']} images", 400)
+        manifests = [info for info in entries if os.path.basename(info.filename).lower() == 'manifest.csv']
+        total = sum(info.file_size for info in images + manifests
+                    if info.file_size <= app.config['MAX_ARCHIVE_ENTRY_SIZE'])
+        if total > app.config['MAX_ARCHIVE_TOTAL_SIZE']:
+            raise BatchTooLarge(
+                f"Archive expands to more than {app.config['MAX_ARCHIVE_TOTAL_SIZE']} bytes", 413)
+        for info in manifests:
+            if info.file_size <= app.config['MAX_ARCHIVE_ENTRY_SIZE']:
+                text = zf.read(info).decode('utf-8-sig')
+                for row in csv.DictReader(io.StringIO(text)):
+                    inputs[os.path.basename(row.get('filename', ''))] = row
+        for info in images:
+            filename = os.path.basename(info.filename)
+            if info.file_size > app.config['MAX_ARCHIVE_ENTRY_SIZE']:
+                items.append({"filename": filename, "error": "Image too large"})
+                continue
+            row = inputs.get(filename, {})
+            items.append({
+                "filename": filename,
+                "data": zf.read(info),
+                "name": row.get('name', ''),
+                "university": row.get('university', ''),
+            })
+    return items
+
+
+def read_batch_files():
+    # Repeated 'images' parts; 'name'/'university' either repeat in the same
+    # order or are given once and shared by every image
+    files = request.files.getlist('images')
+    names = request.form.getlist('name')
+    universities = request.form.getlist('university')
+
+    def input_for(values, index):
+        if len(values) == len(files):
+            return values[index]
+        return values[0] if len(values) == 1 else ''
+
+    return [{
+        "filename": secure_filename(file.filename) or f"image_{index}",
+        "data": file.read(),
+        "name": input_for(names, index),
+        "university": input_for(universities, index),
+    } for index, file in enumerate(files)]
+
+
+def extract_in_workers(pipeline, items):
+    # Worker mode: each chunk of uploads goes to one worker as a single task,
+    # so it keeps the batched forward pass. Chunks are sized to spread the
+    # batch over every worker, at most YOLO_MAX_BATCH_SIZE images each.
+    # Returns the fields, or the exception, of each item.
+    size = max(1, min(YOLO_MAX_BATCH_SIZE, math.ceil(len(items) / app.config['WORKER_PROCESSES'])))
+    chunks = [items[start:start + size] for start in range(0, len(items), size)]
+    futures = []
+    for chunk in chunks:
+        try:
+            futures.append(workers.worker_pool.submit_batch(pipeline, [item.pop("data") for item in chunk]))
+        except Exception as e:
+            futures.append(e)
+
+    extracted = []
+    for chunk, future in zip(chunks, futures):
+        if isinstance(future, Exception):
+            extracted.extend([future] * len(chunk))
+            continue
+        try:
+            results = future.result()
+        except Exception as e:
+            extracted.extend([e] * len(chunk))
+            continue
+        extracted.extend(fields if error is None else WorkerError(error) for error, fields in results)
+    return extracted
+
+
+def process_batch_yolo(items):
+    # Cached images skip the model; decode failures are reported per image
+    # and never reach the model either
+    pending = []
+    for item in items:
+        if "error" in item:
+            continue
+        data = item.pop("data")
+        item["key"] = pipeline_cache_key(data, 'yolo')
+        fields = result_cache.get(item["key"])
+        if fields is not None:
+            item["result"] = validate_data_yolo(
+                fields, item["name"], item["university"])
+            continue
+        if workers.worker_pool is not None:
+            # Decoded in the worker that runs its chunk
+            item["data"] = data
+            pending.append(item)
+            continue
+        try:
+            item["image"] = decode_image_bytes(data)
+            pending.append(item)
+        except Exception as e:
+            item["error"] = str(e)
+
+    if workers.worker_pool is not None:
+        extracted = extract_in_workers('yolo', pending)
+    else:
+        try:
+            extracted = extract_text_from_yolo_batch(
+                [item["image"] for item in pending])
+        except Exception as e:
+            # Isolate the image that broke the batch by retrying one at a time
+            app_logger.error("Batch inference failed, retrying per image: %s", e)
+            extracted = []
+            for item in pending:
+                try:
+                    extracted.append(extract_text_from_yolo(item["image"]))
+                except Exception as item_error:
+                    extracted.append(item_error)
+
+    for item, fields in zip(pending, extracted):
+        if isinstance(fields, Exception):
+            item["error"] = str(fields)
+        else:
+            result_cache.set(item["key"], fields)
+            item["result"] = validate_data_yolo(
+                fields, item["name"], item["university"])
+
+
+def process_batch_nlp(items):
+    # Cached images skip extraction; the rest share one batched NER pass
+    pending = []
+    for item in items:
+        if "error" in item:
+            continue
+        data = item.pop("data")
+        item["key"] = pipeline_cache_key(data, 'nlp')
+        fields = result_cache.get(item["key"])
+        if fields is not None:
+            item["result"] = validate_data__nlp(
+                fields, item["name"], item["university"])
+            continue
+        if workers.worker_pool is not None:
+            # Decoded in the worker that runs its chunk
+            item["data"] = data
+            pending.append(item)
+            continue
+        try:
+            item["image"] = decode_image_bytes(data)
+            pending.append(item)
+        except Exception as e:
+            item["error"] = str(e)
+
+    if workers.worker_pool is not None:
+        for item, fields in zip(pending, extract_in_workers('nlp', pending)):
+            if isinstance(fields, Exception):
+                item["error"] = str(fields)
+            else:
+                item["fields"] = fields
+
+    decoded = [item for item in pending if "image" in item]
+    try:
+        for item, fields in zip(decoded, extract_fields_from_images_nlp(
+                [item["image"] for item in decoded])):
+            item["fields"] = fields
+    except Exception as e:
+        # Isolate the image that broke the batch by retrying one at a time
+        app_logger.error("Batch NLP extraction failed, retrying per image: %s", e)
+        for item in decoded:
+            try:
+                item["fields"] = extract_fields('nlp', item["image"])
+            except Exception as item_error:
+                item["error"] = str(item_error)
+
+    for item in pending:
+        if "fields" in item:
+            result_cache.set(item["key"], item["fields"])
+            item["result"] = validate_data__nlp(
+                item["fields"], item["name"], item["university"])
+
+
+def run_batch_request():
+    # Shared by /process-batch and /roster/verify: returns (pipeline, items)
+    # with a result or error on every item, or an error response
+    pipeline = request.form.get('pipeline', 'yolo')
+    if pipeline not in ('yolo', 'nlp'):
+        return None, (jsonify({"error": f"Unknown pipeline '{pipeline}'"}), 400)
 
+    try:
+        if 'archive' in request.files:
+            items = read_batch_archive(request.files['archive'])
+        else:
+            items = read_batch_files()
+    except zipfile.BadZipFile:
+        return None, (jsonify({"error": "Archive is not a valid zip file"}), 400)
+    except BatchTooLarge as e:
+        return None, (jsonify({"error": str(e)}), e.status)
+
+    if not items:
+        return None, (jsonify({"error": "No images in batch"}), 400)
+    if len(items) > app.config['MAX_BATCH_IMAGES']:
+        return None, (jsonify({"error": f"Batch exceeds {app.config['MAX_BATCH_IMAGES']} images"}), 400)
+
+    if pipeline == 'yolo':
+        process_batch_yolo(items)
+    else:
+        process_batch_nlp(items)
+    for item in items:
+        if "result" not in item:
+            app_logger.error("Batch image %s failed: %s", item['filename'], item['error'])
+    app_logger.info("Processed batch of %d images with %s", len(items), pipeline)
+    return (pipeline, items), None
+
+
+def batch_entry(item):
+    entry = {"filename": item["filename"]}
+    if "result" in item:
+        entry.update(item["result"])
+    else:
+        entry["error"] = item["error"]
+    return entry
+
+
+@app.route('/process-batch', methods=['POST'])
+@admitted('batch')
+def process_batch():
+    batch, error = run_batch_request()
+    if error:
+        return error
+    pipeline, items = batch
+    results = [batch_entry(item) for item in items]
+    return jsonify({"pipeline": pipeline, "count": len(results), "results": results}), 200
+
+
+# Roster
+
+
+@app.route('/roster', methods=['GET'])
+def roster_stats():
+    return jsonify(roster.stats()), 200
+
+
+@app.route('/roster', methods=['POST'])
+def load_roster():
+    # Replace the roster with an uploaded CSV or Parquet file
+    if 'roster' not in request.files:
+        return jsonify({"error": "No roster part"}), 400
+    file = request.files['roster']
+    filename = secure_filename(file.filename)
+    if not filename.lower().endswith(('.csv', '.parquet')):
+        return jsonify({"error": "Roster must be a .csv or .parquet file"}), 400
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'roster_' + filename)
+    file.save(file_path)
+    try:
+        count = roster.load(file_path)
+    except (ValueError, ImportError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"entries": count}), 200
+
+
+@app.route('/roster/entries', methods=['POST'])
+def add_roster_entries():
+    # {"entries": [{"id": ..., "name": ..., "university": ...}, ...]}
+    payload = request.get_json(silent=True) or {}
+    entries = payload.get('entries') or []
+    if not entries:
+        return jsonify({"error": "No entries"}), 400
+    try:
+        ids = roster.add_many(entries)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"ids": ids, "entries": len(roster)}), 200
+
+
+@app.route('/roster/entries/<entry_id>', methods=['DELETE'])
+def remove_roster_entry(entry_id):
+    if not roster.remove(entry_id):
+        return jsonify({"error": f"No roster entry '{entry_id}'"}), 404
+    return jsonify({"removed": entry_id, "entries": len(roster)}), 200
+
+
+@app.route('/roster/verify', methods=['POST'])
+@admitted('batch')
+def verify_against_roster():
+    # Either a batch of card images (same inputs as /process-batch) or
+    # already extracted fields as JSON {"cards": [{"name", "university"}]}
+    if not len(roster):
+        return jsonify({"error": "No roster loaded"}), 409
+
+    payload = request.get_json(silent=True)
+    if payload is not None:
+        cards = payload.get('cards') or []
+        if not cards:
+            return jsonify({"error": "No cards"}), 400
+        results = [dict(roster.verify(card.get('name'), card.get('university')),
+                        name=card.get('name'), university=card.get('university'))
+                   for card in cards]
+        return jsonify({"count": len(results), "results": results}), 200
+
+    batch, error = run_batch_request()
+    if error:
+        return error
+    pipeline, items = batch
+    results = []
+    for item in items:
+        entry = batch_entry(item)
+        if "result" in item:
+            fields = item["result"]["fields"]
+            name = fields["Name"] if fields["Name"] != "Not Recognised" else None
+            university = fields["University"] if fields["University"] != "Not Recognised" else None
+            entry["roster"] = roster.verify(name, university)
+        results.append(entry)
+    return jsonify({"pipeline": pipeline, "count": len(results), "results": results}), 200
+
+
+# Video
+
+
+@app.route('/process-video', methods=['POST'])
+@admitted('video')
+def process_video():
+    # A short clip of the card; frames are read until the fields agree
+    if 'video' not in request.files:
+        return jsonify({"error": "No video part"}), 400
+    file = request.files['video']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+
+    name_input = request.form.get('name', '')
+    university_input = request.form.get('university', '')
+    data = file.read()
+    try:
+        if workers.worker_pool is not None:
+            fields, summary = workers.worker_pool.run('video', data)
+        else:
+            fields, summary = extract_fields_from_video_bytes(data)
+    except PoolClosed:
+        return jsonify({"error": "Server is shutting down"}), 503
+    except DeadlineExceeded as e:
+        return jsonify({"error": str(e)}), 504
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        app_logger.error("Video processing error: %s", e)
+        return jsonify({"error": "Failed to process video"}), 500
+
+    validation_results = validate_data_yolo(fields, name_input, university_input)
+    validation_results["frames"] = summary
+    return jsonify(validation_results), 200
+
+
+# Async jobs
+
+
+def public_job(job):
+    return {key: job.get(key) for key in
+            ("id", "status", "pipeline", "filename", "result", "error", "created_at", "updated_at")}
 
-def determine_overall_validity_yolo(validation_results):
-    # Mark the card as invalid if any field is "Not Recognised" or expired
-    if validation_results['name_match'] == "Not Recognised" or validation_results['university_match'] == "Not Recognised" or validation_results['is_expired']:
-        return False
 
-    # Define thresholds for name and university matching
-    name_threshold = 70
-    university_threshold = 70
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    if 'image' not in request.files:
+        return jsonify({"error": "No image part"}), 400
+    file = request.files['image']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+    pipeline = request.form.get('pipeline', 'yolo')
+    if pipeline not in VALIDATORS:
+        return jsonify({"error": f"Unknown pipeline '{pipeline}'"}), 400
+
+    filename = secure_filename(file.filename)
+    name_input = request.form.get('name', '')
+    university_input = request.form.get('university', '')
+    data = file.read()
+    save_upload_async(os.path.join(app.config['UPLOAD_FOLDER'], filename), data)
+
+    # Job threads do not inherit the request's context
+    profile = profile_name()
+
+    def run_job():
+        with use_profile(profile):
+            fields, _ = extract_fields_cached(pipeline, data)
+            return VALIDATORS[pipeline](fields, name_input, university_input)
+
+    try:
+        job_id = job_manager.submit(run_job, pipeline=pipeline, filename=filename)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429, {'Retry-After': '5'}
+    return jsonify({"id": job_id, "status": "queued"}), 202, {'Location': f"/jobs/{job_id}"}
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(public_job(job)), 200
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job(job_id):
+    # Server-sent events: one event per status change, closed once finished
+    job = job_manager.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def event(job):
+        return f"event: {job['status']}\ndata: {json.dumps(public_job(job))}\n\n"
+
+    def events(job):
+        yield event(job)
+        while job["status"] not in FINISHED_STATES:
+            since = job["updated_at"]
+            job = job_manager.store.wait(job_id, since, timeout=15)
+            if job is None:
+                return
+            if job["updated_at"] == since:
+                yield ": keep-alive\n\n"
+                continue
+            yield event(job)
+
+    return Response(events(job), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
+def serve_with_workers(host='127.0.0.1', port=5000):
+    # Production mode: threaded front server handing work to pre-forked
+    # worker processes, with a graceful drain on SIGTERM/SIGINT
+    pool = workers.start_worker_pool(app.config['WORKER_PROCESSES'])
+    server = make_server(host, port, app, threaded=True)
+
+    def stop(signum, frame):
+        app_logger.info("Received signal %s, draining", signum)
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    app_logger.info("Serving on %s:%s with %s workers", host, port, app.config['WORKER_PROCESSES'])
+    start_warm_up()
+    try:
+        server.serve_forever()
+    finally:
+        job_manager.shutdown()
+        pool.shutdown()
+        flush_storage()
 
-    name_valid = validation_results['name_match'] >= name_threshold
-    university_valid = validation_results['university_match'] >= university_threshold
-    expiration_valid = not validation_results['is_expired']
 
-    return name_valid and university_valid and expiration_valid
+# Imported by a WSGI server: warm up now. Run as a script, the block below
+# starts it (after the worker pool, and not in the reloader's watcher), and
+# worker processes re-importing this file as __mp_main__ load their own.
+if __name__ not in ('__main__', '__mp_main__'):
+    start_warm_up()
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    if app.config['WORKER_PROCESSES']:
+        serve_with_workers(os.environ.get('HOST', '127.0.0.1'),
+                           int(os.environ.get('PORT', 5000)))
+    else:
+        # The debug reloader runs this file twice; only the child that
+        # serves requests loads models
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_warm_up()
+        app.run(debug=True)
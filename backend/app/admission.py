@@ -0,0 +1,160 @@
+import os
+import math
+import time
+import threading
+import contextlib
+import contextvars
+from app.logger import app_logger
+from app.metrics import metrics, ADMISSION_WAIT, ADMISSION_REJECTED
+
+""" Admission control in front of the inference pipelines
+
+Each endpoint group has a limit on requests in flight and a bounded queue
+of requests waiting for a slot. A request that finds the queue full is
+turned away at once with 429; one that waits longer than
+ADMISSION_MAX_WAIT gets 503. Both carry a Retry-After estimated from how
+long requests of that group have been taking. Requests also carry a
+deadline, and one whose client has given up is dropped before OCR starts.
+"""
+
+# Per endpoint group: in flight per worker process (or for the single
+# process) / waiting. Override some or all as "nlp=2/8,yolo=8/32".
+DEFAULT_LIMITS = {'nlp': (2, 8), 'yolo': (8, 32), 'auto': (4, 16), 'batch': (1, 2), 'video': (1, 2)}
+ADMISSION_LIMITS = os.environ.get('ADMISSION_LIMITS', '')
+ADMISSION_MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', 10))
+# Deadline for requests that do not send X-Request-Timeout; 0 means none
+REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', 30))
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class Overloaded(Exception):
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def set_deadline(timeout):
+    # timeout in seconds from now; None or 0 clears the deadline
+    _deadline.set(time.monotonic() + timeout if timeout else None)
+
+
+def current_deadline():
+    # As a monotonic timestamp, which worker processes on the same host share
+    return _deadline.get()
+
+
+def set_deadline_at(deadline):
+    _deadline.set(deadline)
+
+
+def remaining():
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline(endpoint='pipeline'):
+    # Called before expensive stages; a no-op outside a request
+    left = remaining()
+    if left is not None and left <= 0:
+        ADMISSION_REJECTED.inc(endpoint=endpoint, reason='deadline')
+        raise DeadlineExceeded("Request deadline exceeded")
+
+
+class AdmissionLimiter:
+
+    def __init__(self, name, max_inflight, max_queue, max_wait=ADMISSION_MAX_WAIT):
+        self.name = name
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.inflight = 0
+        self.waiting = 0
+        # Moving average of seconds per admitted request, for Retry-After
+        self._service_time = 1.0
+        self._lock = threading.Lock()
+        self._slot_free = threading.Condition(self._lock)
+
+    def _retry_after(self):
+        # Time for everyone ahead to be served at the observed rate
+        backlog = self.inflight + self.waiting
+        return max(1, min(60, math.ceil(self._service_time * backlog / self.max_inflight)))
+
+    def _reject(self, reason, status, message):
+        ADMISSION_REJECTED.inc(endpoint=self.name, reason=reason)
+        app_logger.warning("Rejected %s request: %s", self.name, reason)
+        return Overloaded(message, status, self._retry_after())
+
+    def acquire(self):
+        started = time.monotonic()
+        with self._lock:
+            if self.inflight >= self.max_inflight:
+                if self.waiting >= self.max_queue:
+                    raise self._reject('queue_full', 429, "Too many requests, try again later")
+                left = remaining()
+                wait_until = started + (self.max_wait if left is None else min(self.max_wait, left))
+                self.waiting += 1
+                try:
+                    while self.inflight >= self.max_inflight and time.monotonic() < wait_until:
+                        self._slot_free.wait(wait_until - time.monotonic())
+                finally:
+                    self.waiting -= 1
+                if self.inflight >= self.max_inflight:
+                    if remaining() is not None and remaining() <= 0:
+                        ADMISSION_REJECTED.inc(endpoint=self.name, reason='deadline')
+                        raise DeadlineExceeded("Request deadline exceeded while queued")
+                    raise self._reject('wait_timeout', 503, "Server is busy, try again later")
+            self.inflight += 1
+        ADMISSION_WAIT.observe(time.monotonic() - started, endpoint=self.name)
+        try:
+            check_deadline(self.name)
+        except DeadlineExceeded:
+            self.release(None)
+            raise
+        return time.monotonic()
+
+    def release(self, admitted_at):
+        with self._lock:
+            self.inflight -= 1
+            if admitted_at is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * (time.monotonic() - admitted_at)
+            self._slot_free.notify()
+
+    @contextlib.contextmanager
+    def admit(self):
+        admitted_at = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
+
+    def stats(self):
+        with self._lock:
+            return {"inflight": self.inflight, "waiting": self.waiting,
+                    "max_inflight": self.max_inflight, "max_queue": self.max_queue,
+                    "service_seconds": round(self._service_time, 3)}
+
+
+def build_limiters(spec=ADMISSION_LIMITS, scale=1):
+    limits = dict(DEFAULT_LIMITS)
+    for part in filter(None, (item.strip() for item in spec.split(','))):
+        name, _, value = part.partition('=')
+        inflight, _, queue = value.partition('/')
+        default_inflight, default_queue = limits.get(name.strip(), (1, 0))
+        limits[name.strip()] = (int(inflight or default_inflight), int(queue or default_queue))
+    # In-flight limits are per process doing inference
+    return {name: AdmissionLimiter(name, inflight * scale, queue * scale)
+            for name, (inflight, queue) in limits.items()}
+
+
+limiters = build_limiters(scale=max(1, int(os.environ.get('WORKER_PROCESSES', 0))))
+
+metrics.gauge('idcard_admission_inflight', 'Admitted requests in flight per endpoint group', ('endpoint',),
+              collect=lambda: {(name,): limiter.inflight for name, limiter in limiters.items()})
+metrics.gauge('idcard_admission_waiting', 'Requests waiting for admission per endpoint group', ('endpoint',),
+              collect=lambda: {(name,): limiter.waiting for name, limiter in limiters.items()})
@@ -0,0 +1,438 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import platform
+from contextlib import contextmanager
+from app.utils import IMAGE_EXTENSIONS, label_path_for
+
+""" Reproducible benchmark of both pipelines over data/{test,valid}
+
+Run from backend/:
+    python -m app.benchmark --output bench.json
+    python -m app.benchmark --compare bench.json
+    python -m app.benchmark --splits test --profiles fast balanced accurate
+"""
+
+DATA_DIR = 'data'
+IOU_THRESHOLD = 0.5
+FIELDS = ('Name', 'University', 'Expiration')
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = {}
+        self.counts = {}
+
+    def add(self, name, amount):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(name, []).append(time.perf_counter() - started)
+
+    def summary(self):
+        return {name: summarize(values) for name, values in self.samples.items()}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "total_ms": round(sum(values) * 1000, 3),
+    }
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    except ImportError:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / (1024 * 1024), 1)
+
+
+def list_images(split, limit=None):
+    image_dir = os.path.join(DATA_DIR, split, 'images')
+    paths = sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir)
+                   if name.lower().endswith(IMAGE_EXTENSIONS))
+    return paths[:limit] if limit else paths
+
+
+def load_labels(path, width, height):
+    # Roboflow exports either "cls cx cy w h" or polygon "cls x1 y1 x2 y2 ...",
+    # all normalized; both become pixel xyxy boxes
+    boxes = []
+    if not os.path.exists(path):
+        return boxes
+    with open(path) as f:
+        for line in f:
+            values = line.split()
+            if len(values) < 5:
+                continue
+            class_id, coords = int(values[0]), [float(v) for v in values[1:]]
+            if len(coords) == 4:
+                cx, cy, w, h = coords
+                box = (cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2)
+            else:
+                xs, ys = coords[0::2], coords[1::2]
+                box = (min(xs), min(ys), max(xs), max(ys))
+            boxes.append((class_id, (box[0] * width, box[1] * height,
+                                     box[2] * width, box[3] * height)))
+    return boxes
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_detections(predictions, truths, counts):
+    # Greedy matching by confidence, one truth per prediction, per class
+    unmatched = list(truths)
+    for class_id, box, _ in sorted(predictions, key=lambda p: -p[2]):
+        stats = counts.setdefault(class_id, {"tp": 0, "fp": 0, "fn": 0})
+        best, best_iou = None, IOU_THRESHOLD
+        for truth in unmatched:
+            if truth[0] == class_id and iou(box, truth[1]) >= best_iou:
+                best, best_iou = truth, iou(box, truth[1])
+        if best is None:
+            stats["fp"] += 1
+        else:
+            stats["tp"] += 1
+            unmatched.remove(best)
+    for class_id, _ in unmatched:
+        counts.setdefault(class_id, {"tp": 0, "fp": 0, "fn": 0})["fn"] += 1
+
+
+def detection_report(counts, class_names):
+    def scores(tp, fp, fn):
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        return {"precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4)}
+
+    report = {class_names.get(class_id, str(class_id)): dict(stats, **scores(**stats))
+              for class_id, stats in sorted(counts.items())}
+    totals = {key: sum(stats[key] for stats in counts.values()) for key in ("tp", "fp", "fn")}
+    report["overall"] = dict(totals, **scores(**totals))
+    return report
+
+
+def load_truth(path):
+    # CSV with a filename column and any of name, university, expiration
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return {os.path.basename(row['filename']): row for row in csv.DictReader(f)}
+
+
+def score_fields(path, validation, truths, scores):
+    # How often each field is extracted at all and, for images in the truth
+    # file, how close it is to the expected text
+    from app.similarity import ratio
+
+    truth = (truths or {}).get(os.path.basename(path), {})
+    for field in FIELDS:
+        value = validation["fields"].get(field)
+        found = bool(value) and value != "Not Recognised"
+        stats = scores.setdefault(field, {"images": 0, "found": 0, "labelled": 0,
+                                          "similarity": 0.0, "exact": 0})
+        stats["images"] += 1
+        stats["found"] += found
+        expected = (truth.get(field.lower()) or '').strip()
+        if expected:
+            stats["labelled"] += 1
+            stats["similarity"] += ratio(expected, value) if found else 0.0
+            stats["exact"] += found and expected.lower() == value.strip().lower()
+
+
+def accuracy_report(scores):
+    report = {}
+    for field, stats in scores.items():
+        entry = {"found_rate": round(stats["found"] / stats["images"], 4)}
+        if stats["labelled"]:
+            entry["mean_similarity"] = round(stats["similarity"] / stats["labelled"], 2)
+            entry["exact_rate"] = round(stats["exact"] / stats["labelled"], 4)
+        report[field] = entry
+    return report
+
+
+def run_yolo(path, timer, counts, scores=None, truths=None):
+    from app.image_preprocessing import decode_image_bytes
+    from app.yolo_service import (detect_fields_yolo, crop_detections_yolo,
+                                  assemble_fields_yolo, YOLO_MIN_CONFIDENCE)
+    from app.profiles import setting
+    from app.ocr_service import recognize_crops
+    from app.validation import validate_data_yolo
+
+    with timer.stage('read'):
+        with open(path, 'rb') as f:
+            data = f.read()
+    with timer.stage('decode'):
+        image = decode_image_bytes(data)
+    with timer.stage('detection'):
+        result = detect_fields_yolo([image])[0]
+    with timer.stage('crop'):
+        crops = crop_detections_yolo(image, result)
+    # Detections are scored at the profile's confidence threshold, as the
+    # pipeline uses them; predict itself keeps weaker boxes
+    min_confidence = setting('yolo_min_confidence', YOLO_MIN_CONFIDENCE)
+    predictions = [(int(cls), tuple(float(v) for v in box), float(conf))
+                   for box, cls, conf in zip(result.boxes.xyxy, result.boxes.cls, result.boxes.conf)
+                   if float(conf) >= min_confidence]
+    # Boxes left out by the selection stage are OCR calls saved
+    timer.add('detected_boxes', len(predictions))
+    timer.add('ocr_crops', len(crops))
+    with timer.stage('ocr'):
+        recognized = recognize_crops([crop for _, crop, _, _ in crops])
+    with timer.stage('postprocess'):
+        fields = assemble_fields_yolo(crops, recognized)
+    with timer.stage('validation'):
+        validation = validate_data_yolo(fields, '', '')
+
+    if scores is not None:
+        score_fields(path, validation, truths, scores)
+    if counts is not None:
+        height, width = image.shape[:2]
+        match_detections(predictions, load_labels(label_path_for(path), width, height), counts)
+
+
+def run_nlp(path, timer, counts, scores=None, truths=None):
+    from app.image_preprocessing import (decode_image_bytes, downscale_image, crop_card,
+                                         NLP_MAX_SIDE, NLP_CARD_CROP)
+    from app.profiles import setting
+    from app.ocr_service import detect_text_regions_nlp, extract_text_by_region_nlp
+    from app.ner_service import extract_fields_nlp
+    from app.validation import validate_data__nlp
+
+    with timer.stage('read'):
+        with open(path, 'rb') as f:
+            data = f.read()
+    with timer.stage('decode'):
+        image = decode_image_bytes(data)
+    # The preprocessing steps of preprocess_image_nlp, timed one by one
+    with timer.stage('resize'):
+        ocr_image, scale = downscale_image(image, setting('nlp_max_side', NLP_MAX_SIDE))
+    offset = (0, 0)
+    if NLP_CARD_CROP:
+        with timer.stage('card_crop'):
+            ocr_image, offset = crop_card(ocr_image)
+    timer.add('source_megapixels', image.shape[0] * image.shape[1] / 1e6)
+    timer.add('ocr_megapixels', ocr_image.shape[0] * ocr_image.shape[1] / 1e6)
+    with timer.stage('ocr'):
+        regions = detect_text_regions_nlp(ocr_image, {"scale": scale, "offset": offset})
+    with timer.stage('postprocess'):
+        lines = extract_text_by_region_nlp(regions)
+    with timer.stage('ner'):
+        fields = extract_fields_nlp(lines)
+    with timer.stage('validation'):
+        validation = validate_data__nlp(fields, '', '')
+    if scores is not None:
+        score_fields(path, validation, truths, scores)
+
+
+PIPELINES = {'yolo': run_yolo, 'nlp': run_nlp}
+
+
+def load_models(pipelines):
+    from app.model_registry import registry
+    from app.pipelines import PIPELINE_MODELS
+
+    load_times = {}
+    for pipeline in pipelines:
+        for name in PIPELINE_MODELS[pipeline]:
+            if name not in load_times:
+                started = time.perf_counter()
+                registry.get(name)
+                load_times[name] = round(time.perf_counter() - started, 3)
+    return load_times
+
+
+def run_benchmark(pipelines, splits, limit=None, warmup=1, repeat=1, profiles=None, truths=None):
+    # With profiles, every pipeline/split runs once per profile and the run
+    # is named pipeline/split@profile
+    from app.image_preprocessing import NLP_MAX_SIDE, NLP_CARD_CROP
+    from app.profiles import PROFILES, profile_name, use_profile
+
+    try:
+        import torch
+        torch.manual_seed(0)
+        threads = torch.get_num_threads()
+    except ImportError:
+        threads = None
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch_threads": threads,
+        },
+        # Knobs that change the work done per image, so reports compare like for like
+        "settings": {"nlp_max_side": NLP_MAX_SIDE, "nlp_card_crop": NLP_CARD_CROP,
+                     "profile": profile_name()},
+        "model_load_s": load_models(pipelines),
+        "runs": {},
+    }
+    if profiles:
+        report["profiles"] = {name: PROFILES[name] for name in profiles}
+    for profile in profiles or [None]:
+        with use_profile(profile):
+            for pipeline in pipelines:
+                for split in splits:
+                    run_name = f"{pipeline}/{split}" + (f"@{profile}" if profile else '')
+                    result = run_split(pipeline, run_name, split, limit, warmup, repeat, truths)
+                    if result is not None:
+                        report["runs"][run_name] = result
+    if profiles:
+        report["tradeoff"] = tradeoff_table(report["runs"])
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def run_split(pipeline, run_name, split, limit, warmup, repeat, truths):
+    from app.yolo_service import YOLO_CLASSES
+
+    run = PIPELINES[pipeline]
+    paths = list_images(split, limit)
+    if not paths:
+        return None
+    for path in paths[:warmup]:
+        run(path, StageTimer(), None)
+
+    timer, counts, scores, errors = StageTimer(), {}, {}, 0
+    started = time.perf_counter()
+    for attempt in range(repeat):
+        for path in paths:
+            try:
+                with timer.stage('total'):
+                    # Detection and field quality are scored on the first pass only
+                    first = attempt == 0
+                    run(path, timer, counts if first else None, scores if first else None, truths)
+            except Exception as e:
+                errors += 1
+                print(f"{run_name}: {path} failed: {e}", file=sys.stderr)
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "images": len(paths) * repeat,
+        "errors": errors,
+        "wall_s": round(elapsed, 3),
+        "images_per_sec": round(len(paths) * repeat / elapsed, 3) if elapsed else 0,
+        "stages": timer.summary(),
+    }
+    if timer.counts:
+        result["counts"] = {name: round(value, 3) for name, value in timer.counts.items()}
+    if pipeline == 'yolo':
+        result["detection"] = detection_report(counts, YOLO_CLASSES)
+    if scores:
+        result["fields"] = accuracy_report(scores)
+    return result
+
+
+def tradeoff_table(runs):
+    # One line per run: what it costs against what it gets right
+    rows = []
+    for run_name, run in runs.items():
+        fields = run.get("fields", {})
+        similarities = [entry["mean_similarity"] for entry in fields.values() if "mean_similarity" in entry]
+        rows.append({
+            "run": run_name,
+            "p50_ms": run["stages"].get("total", {}).get("p50_ms"),
+            "p95_ms": run["stages"].get("total", {}).get("p95_ms"),
+            "images_per_sec": run["images_per_sec"],
+            "detection_f1": run.get("detection", {}).get("overall", {}).get("f1"),
+            "found_rate": round(sum(entry["found_rate"] for entry in fields.values()) / len(fields), 4)
+            if fields else None,
+            "mean_similarity": round(sum(similarities) / len(similarities), 2) if similarities else None,
+        })
+    return rows
+
+
+def compare_reports(current, baseline, tolerance=0.1, f1_tolerance=0.02):
+    # Flag slower stages, lower throughput and worse detection than baseline
+    regressions = []
+    for run_name, run in current["runs"].items():
+        base = baseline.get("runs", {}).get(run_name)
+        if base is None:
+            continue
+        for stage, stats in run["stages"].items():
+            base_stats = base["stages"].get(stage)
+            if base_stats and base_stats["p50_ms"] > 0 and \
+                    stats["p50_ms"] > base_stats["p50_ms"] * (1 + tolerance):
+                regressions.append(f"{run_name} {stage} p50 {base_stats['p50_ms']}ms -> {stats['p50_ms']}ms")
+        if run["images_per_sec"] < base["images_per_sec"] * (1 - tolerance):
+            regressions.append(f"{run_name} throughput {base['images_per_sec']} -> {run['images_per_sec']} img/s")
+        if "detection" in run and "detection" in base:
+            old_f1 = base["detection"]["overall"]["f1"]
+            new_f1 = run["detection"]["overall"]["f1"]
+            if new_f1 < old_f1 - f1_tolerance:
+                regressions.append(f"{run_name} detection F1 {old_f1} -> {new_f1}")
+    base_rss = baseline.get("peak_rss_mb")
+    if base_rss and current["peak_rss_mb"] > base_rss * (1 + tolerance):
+        regressions.append(f"peak RSS {base_rss}MB -> {current['peak_rss_mb']}MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reproducible benchmark of both pipelines over data/{test,valid}')
+    parser.add_argument('--pipelines', nargs='+', choices=sorted(PIPELINES), default=['yolo', 'nlp'])
+    parser.add_argument('--splits', nargs='+', default=['test', 'valid'])
+    parser.add_argument('--limit', type=int, default=None, help='images per split')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed images per run')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--profiles', nargs='+', default=None,
+                        help='run every pipeline under each of these profiles')
+    parser.add_argument('--truth', help='CSV of filename,name,university,expiration to score fields against')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--compare', help='baseline JSON report to check against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed relative slowdown before flagging a regression')
+    args = parser.parse_args(argv)
+
+    from app.profiles import PROFILES
+
+    unknown = [name for name in args.profiles or [] if name not in PROFILES]
+    if unknown:
+        parser.error(f"unknown profile(s): {', '.join(unknown)}")
+    truths = load_truth(args.truth) if args.truth else None
+    report = run_benchmark(args.pipelines, args.splits, args.limit, args.warmup, args.repeat,
+                           args.profiles, truths)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import itertools
+import collections
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from app.utils import IMAGE_EXTENSIONS
+
+""" Resumable offline bulk processing of card images
+
+Run from backend/:
+    python -m app.bulk --input archive/ --output results.jsonl
+    python -m app.bulk --manifest cards.csv --output results.parquet --pipeline nlp
+
+Images are streamed in a stable order and processed in chunks by a pool
+of worker processes (YOLO batched per chunk). Results are written in input
+order, the paths of finished images are logged next to the output, and
+a checkpoint records how much of both is committed. A crashed or
+interrupted run picks up where it stopped, skipping exactly the images
+already done even if files were added or removed in between. Only a
+bounded number of chunks is ever in flight.
+"""
+
+FIELDS = ('Name', 'University', 'Expiration')
+
+
+def walk_images(directory):
+    # Sorted per directory so a resumed run sees the same order
+    entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk_images(entry.path)
+        elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            yield {"path": entry.path, "name": '', "university": ''}
+
+
+def read_manifest(path):
+    # CSV with a path (or filename) column and optional name/university;
+    # relative paths are taken from the manifest's directory
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            image_path = row.get('path') or row.get('filename') or ''
+            if not image_path:
+                continue
+            yield {
+                "path": os.path.join(base, image_path),
+                "name": row.get('name', ''),
+                "university": row.get('university', ''),
+            }
+
+
+def chunked(items, size):
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _init_worker(pipeline, threads):
+    from app.workers import _limit_threads
+    _limit_threads(threads, None)
+    import torch
+    torch.set_num_threads(threads)
+    from app.model_registry import registry
+    from app.pipelines import boot_models
+    registry.preload(boot_models([pipeline]))
+
+
+def _match_score(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _row(item, result=None, timings=None, error=None):
+    row = {"path": item["path"], "name_input": item["name"], "university_input": item["university"]}
+    fields = (result or {}).get("fields", {})
+    for field in FIELDS:
+        value = fields.get(field)
+        row[field.lower()] = value if value and value != "Not Recognised" else None
+    row["name_match"] = _match_score((result or {}).get("name_match"))
+    row["university_match"] = _match_score((result or {}).get("university_match"))
+    row["is_expired"] = (result or {}).get("is_expired")
+    row["is_valid_card"] = (result or {}).get("is_valid_card")
+    row["timings_ms"] = timings or {}
+    row["error"] = error
+    return row
+
+
+def process_chunk(items, pipeline, profile=None):
+    # Runs in a worker process. Decoding is per image; extraction is one
+    # batch for the chunk (YOLO detection and crop OCR, or batched NER),
+    # falling back to one image at a time if the batch fails.
+    from app.profiles import use_profile
+    with use_profile(profile):
+        return _process_chunk(items, pipeline)
+
+
+def _process_chunk(items, pipeline):
+    from app.image_preprocessing import decode_image_bytes
+    from app.pipelines import extract_fields, extract_fields_from_images_nlp
+    from app.yolo_service import extract_text_from_yolo_batch
+    from app.validation import VALIDATORS
+    from app.metrics import begin_request, end_request
+
+    rows, decoded = [None] * len(items), []
+    for index, item in enumerate(items):
+        begin_request()
+        try:
+            with open(item["path"], 'rb') as f:
+                image = decode_image_bytes(f.read())
+            decoded.append((index, image, end_request()))
+        except Exception as e:
+            end_request()
+            rows[index] = _row(item, error=str(e))
+
+    images = [image for _, image, _ in decoded]
+    begin_request()
+    try:
+        if pipeline == 'yolo':
+            extracted = extract_text_from_yolo_batch(images)
+        elif pipeline == 'nlp':
+            extracted = extract_fields_from_images_nlp(images)
+        else:
+            extracted = [extract_fields(pipeline, image, scheduled=False) for image in images]
+    except Exception:
+        extracted = []
+        for image in images:
+            try:
+                extracted.append(extract_fields(pipeline, image, scheduled=False))
+            except Exception as e:
+                extracted.append(e)
+    # Batch stages are shared by the chunk; each row gets its share
+    batch_timings = end_request()
+
+    validate = VALIDATORS[pipeline]
+    for (index, _, own_timings), fields in zip(decoded, extracted):
+        item = items[index]
+        timings = collections.defaultdict(float)
+        for stage, seconds in own_timings:
+            timings[stage] += seconds * 1000
+        for stage, seconds in batch_timings:
+            timings[stage] += seconds * 1000 / len(decoded)
+        timings = {stage: round(ms, 2) for stage, ms in timings.items()}
+        if isinstance(fields, Exception):
+            rows[index] = _row(item, timings=timings, error=str(fields))
+            continue
+        try:
+            result = validate(fields, item["name"], item["university"])
+            rows[index] = _row(item, result, timings)
+        except Exception as e:
+            rows[index] = _row(item, timings=timings, error=str(e))
+    return rows
+
+
+class JsonlWriter:
+    # One JSON object per line; the checkpoint records the byte size at
+    # each commit, and a resumed run truncates anything written after it
+    def __init__(self, path, resume_state=None):
+        self.path = path
+        mode = 'r+b' if resume_state and os.path.exists(path) else 'wb'
+        self._file = open(path, mode)
+        if mode == 'r+b':
+            self._file.truncate(resume_state.get("bytes", 0))
+            self._file.seek(0, os.SEEK_END)
+        self._size = self._file.tell()
+
+    def write(self, rows):
+        self._file.write(''.join(json.dumps(row) + '\n' for row in rows).encode('utf-8'))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._size = self._file.tell()
+
+    def pending(self):
+        return 0
+
+    def state(self):
+        return {"bytes": self._size}
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    # A directory of part files, one per written chunk group; a resumed run
+    # removes parts newer than the checkpoint
+    def __init__(self, path, resume_state=None, rows_per_part=5000):
+        import pyarrow
+        import pyarrow.parquet
+        self._pa, self._pq = pyarrow, pyarrow.parquet
+        self.path = path
+        self.rows_per_part = rows_per_part
+        self._parts = (resume_state or {}).get("parts", 0)
+        self._buffer = []
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.startswith('part-') and int(name[5:10]) >= self._parts:
+                os.remove(os.path.join(path, name))
+
+    def write(self, rows):
+        self._buffer.extend(dict(row, timings_ms=json.dumps(row["timings_ms"])) for row in rows)
+        if len(self._buffer) >= self.rows_per_part:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        table = self._pa.Table.from_pylist(self._buffer, schema=self._schema())
+        part_path = os.path.join(self.path, f"part-{self._parts:05d}.parquet")
+        self._pq.write_table(table, part_path + '.tmp')
+        os.replace(part_path + '.tmp', part_path)
+        self._parts += 1
+        self._buffer = []
+
+    def _schema(self):
+        pa = self._pa
+        text = [(name, pa.string()) for name in
+                ('path', 'name_input', 'university_input') + tuple(f.lower() for f in FIELDS)]
+        return pa.schema(text + [
+            ('name_match', pa.float64()), ('university_match', pa.float64()),
+            ('is_expired', pa.bool_()), ('is_valid_card', pa.bool_()),
+            ('timings_ms', pa.string()), ('error', pa.string()),
+        ])
+
+    def pending(self):
+        return len(self._buffer)
+
+    def state(self):
+        return {"parts": self._parts}
+
+    def close(self):
+        self._flush()
+
+
+def load_checkpoint(path, source, pipeline, profile=None):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("source") != source or checkpoint.get("pipeline") != pipeline \
+            or checkpoint.get("profile") != profile:
+        raise SystemExit(f"Checkpoint {path} belongs to another run; use --restart to overwrite it")
+    return checkpoint
+
+
+def read_done_paths(path):
+    # Paths logged by a JsonlWriter, one JSON string per line
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8') as f:
+        return {json.loads(line) for line in f if line.strip()}
+
+
+def save_checkpoint(path, checkpoint):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+
+def run_bulk(items, output, pipeline='yolo', processes=None, chunk_size=8,
+             max_inflight=None, source=None, restart=False, profile=None):
+    checkpoint_path = output.rstrip('/\\') + '.checkpoint'
+    checkpoint = None if restart else load_checkpoint(checkpoint_path, source, pipeline, profile)
+    if checkpoint and "paths" not in checkpoint:
+        raise SystemExit(f"Checkpoint {checkpoint_path} predates the done-path log; use --restart")
+    done = checkpoint["done"] if checkpoint else 0
+    writer_class = ParquetWriter if output.endswith('.parquet') else JsonlWriter
+    writer = writer_class(output, checkpoint["writer"] if checkpoint else None)
+    # Committed paths, so a resumed run skips by path rather than position
+    done_path = output.rstrip('/\\') + '.done'
+    done_log = JsonlWriter(done_path, checkpoint["paths"] if checkpoint else None)
+    finished = read_done_paths(done_path) if checkpoint else set()
+    counts = checkpoint["counts"] if checkpoint else {"valid": 0, "invalid": 0, "errors": 0}
+    if done:
+        print(f"Resuming after {done} images", file=sys.stderr)
+
+    processes = processes or max(1, (os.cpu_count() or 1) // 2)
+    threads = max(1, (os.cpu_count() or 1) // processes)
+    max_inflight = max_inflight or processes * 2
+    methods = mp.get_all_start_methods()
+    context = mp.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+    def save():
+        save_checkpoint(checkpoint_path, {
+            "source": source, "pipeline": pipeline, "profile": profile, "done": done,
+            "writer": writer.state(), "paths": done_log.state(), "counts": counts,
+        })
+
+    def drain(limit):
+        # Results are written in submission order, so the checkpoint is
+        # always a prefix of the input
+        nonlocal done, processed
+        while len(inflight) > limit:
+            rows = inflight.popleft().result()
+            writer.write(rows)
+            done_log.write([row["path"] for row in rows])
+            for row in rows:
+                key = "errors" if row["error"] else "valid" if row["is_valid_card"] else "invalid"
+                counts[key] += 1
+            done += len(rows)
+            processed += len(rows)
+            if not writer.pending():
+                save()
+            rate = processed / (time.perf_counter() - started)
+            print(f"\r{done} done, {rate:.1f} img/s, {counts}", end='', file=sys.stderr)
+
+    inflight = collections.deque()
+    started, processed = time.perf_counter(), 0
+    try:
+        with ProcessPoolExecutor(processes, mp_context=context, initializer=_init_worker,
+                                 initargs=(pipeline, threads)) as pool:
+            remaining = (item for item in items if item["path"] not in finished)
+            for chunk in chunked(remaining, chunk_size):
+                inflight.append(pool.submit(process_chunk, chunk, pipeline, profile))
+                drain(max_inflight - 1)
+            drain(0)
+    finally:
+        writer.close()
+        done_log.close()
+        save()
+    print(file=sys.stderr)
+    return {"done": done, "counts": counts}
+
+
+def main(argv=None):
+    from app.profiles import PROFILES
+
+    parser = argparse.ArgumentParser(description='Resumable offline bulk processing of card images')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='directory of card images, walked recursively')
+    source.add_argument('--manifest', help='CSV with path, name, university columns')
+    parser.add_argument('--output', required=True, help='.jsonl file or .parquet directory')
+    parser.add_argument('--pipeline', choices=('yolo', 'nlp', 'auto'), default='yolo')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=8, help='images per worker batch')
+    parser.add_argument('--profile', choices=list(PROFILES), default=None,
+                        help='speed/accuracy profile (default: PROFILE)')
+    parser.add_argument('--restart', action='store_true', help='ignore any checkpoint and start over')
+    args = parser.parse_args(argv)
+
+    items = walk_images(args.input) if args.input else read_manifest(args.manifest)
+    summary = run_bulk(items, args.output, args.pipeline, args.processes, args.chunk_size,
+                       source=os.path.abspath(args.input or args.manifest), restart=args.restart,
+                       profile=args.profile)
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,125 @@
+import io
+import os
 import cv2
+import numpy as np
 from app.logger import app_logger
+from app.metrics import timed
+from app.profiles import setting
+
+
+# Largest image decoded, in pixels; a small compressed file can expand to
+# gigabytes of pixels
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 40_000_000))
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def image_dimensions(data):
+    # (width, height) from the file header without decoding the pixels, or
+    # None when the format is not recognised (decoding will then fail)
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.size
+    except Image.DecompressionBombError:
+        raise ImageTooLarge("Image has too many pixels")
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+def check_image_pixels(data, max_pixels=MAX_IMAGE_PIXELS):
+    size = image_dimensions(data)
+    if size and size[0] * size[1] > max_pixels:
+        raise ImageTooLarge(f"Image is {size[0]}x{size[1]}, over the {max_pixels} pixel limit")
+
+
+@timed('decode')
+def decode_image_bytes(data):
+    # Decode an upload buffer straight from memory; np.frombuffer does not copy
+    check_image_pixels(data)
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Uploaded file is not a decodable image")
+    return image
+
+
+def load_image(image):
+    # Accept either an already decoded array or a path on disk
+    if isinstance(image, np.ndarray):
+        return image
+    img = cv2.imread(image)
+    if img is None:
+        raise ValueError(f"Error loading image {image}")
+    return img
+
 
 """ Image Preprocess for NLP """
 
 
-def preprocess_image_nlp(image_path):
+# Longest side the OCR detector sees; text detection cost grows with pixel
+# count, and card text stays legible well below phone-photo resolution.
+# 0 keeps the full resolution.
+NLP_MAX_SIDE = int(os.environ.get('NLP_MAX_SIDE', 1600))
+# Crop to the card's outline first, when one stands out from the background
+NLP_CARD_CROP = os.environ.get('NLP_CARD_CROP', '0') == '1'
+# Smallest share of the frame a contour must cover to be taken as the card
+CARD_MIN_AREA = 0.2
+
+
+@timed('nlp_resize')
+def downscale_image(image, max_side):
+    # Returns the image and the factor applied to it (1.0 when unchanged)
+    height, width = image.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return image, 1.0
+    scale = max_side / max(height, width)
+    resized = cv2.resize(image, (round(width * scale), round(height * scale)),
+                         interpolation=cv2.INTER_AREA)
+    return resized, scale
+
+
+@timed('nlp_card_crop')
+def crop_card(image):
+    # Bounding box of the largest outline in the frame; returns the crop and
+    # its (x, y) offset, or the image unchanged when no card stands out
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return image, (0, 0)
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    height, width = image.shape[:2]
+    if w * h < CARD_MIN_AREA * width * height or (w == width and h == height):
+        return image, (0, 0)
+    return image[y:y + h, x:x + w], (x, y)
+
+
+@timed('preprocess_image_nlp')
+def preprocess_image_nlp(image, max_side=None, card_crop=NLP_CARD_CROP):
+    # Only what OCR consumes: a (possibly) smaller, (possibly) cropped color
+    # image, plus the transform mapping its coordinates back to the upload
+    if max_side is None:
+        max_side = setting('nlp_max_side', NLP_MAX_SIDE)
     try:
-        app_logger.info(f"Starting preprocessing of image: {image_path}")
-        img = cv2.imread(image_path)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        thresh = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-        app_logger.info("Image preprocessing completed successfully.")
-        return thresh, img
+        img = load_image(image)
+        img, scale = downscale_image(img, max_side)
+        offset = (0, 0)
+        if card_crop:
+            img, offset = crop_card(img)
+        return img, {"scale": scale, "offset": offset}
     except Exception as e:
-        app_logger.error(f"Error during image preprocessing: {str(e)}")
+        app_logger.error("Error during image preprocessing: %s", e)
         raise
 
 
+def to_original_coordinates(points, transform):
+    # Undo preprocess_image_nlp for a list of (x, y) points
+    scale, (dx, dy) = transform["scale"], transform["offset"]
+    return [[(x + dx) / scale, (y + dy) / scale] for x, y in points]
+
+
 """ IMAGE PREPROCESS FOR YOLO """
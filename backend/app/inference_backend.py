@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from app.logger import app_logger
+
+""" CPU inference backends for the YOLO detector
+
+The trained best.pt can be exported once and then served through ONNX
+Runtime or OpenVINO instead of PyTorch eager mode, optionally quantized to
+INT8. Ultralytics loads every format behind the same predict() call, so
+the detection call sites do not change; only the weights path does.
+
+Run from backend/:
+    python -m app.inference_backend export --backend onnx --int8
+    python -m app.inference_backend parity --backend onnx --int8
+"""
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+YOLO_BACKEND = os.environ.get('YOLO_BACKEND', 'torch')
+YOLO_INT8 = os.environ.get('YOLO_INT8', '0') == '1'
+YOLO_IMAGE_SIZE = int(os.environ.get('YOLO_IMAGE_SIZE', 640))
+CALIBRATION_DIR = os.environ.get('YOLO_CALIBRATION_DIR', 'data/valid/images')
+CALIBRATION_IMAGES = int(os.environ.get('YOLO_CALIBRATION_IMAGES', 200))
+# The Detect head (layer 22 of YOLOv8s) regresses box coordinates and loses
+# too much precision in INT8, so it stays in float
+ONNX_INT8_EXCLUDED_PREFIXES = ('/model.22/',)
+
+if YOLO_BACKEND not in BACKENDS:
+    raise ValueError(f"YOLO_BACKEND must be one of {', '.join(BACKENDS)}, not '{YOLO_BACKEND}'")
+
+
+def backend_weights(weights, backend=YOLO_BACKEND, int8=YOLO_INT8):
+    # Where the export of a .pt file for this backend lives, next to it;
+    # names follow what ultralytics writes
+    if backend == 'torch':
+        return weights
+    stem = os.path.splitext(weights)[0]
+    if backend == 'onnx':
+        return stem + ('.int8.onnx' if int8 else '.onnx')
+    return stem + ('_int8_openvino_model' if int8 else '_openvino_model')
+
+
+def load_yolo(weights, backend=YOLO_BACKEND, int8=YOLO_INT8):
+    from ultralytics import YOLO
+
+    path = backend_weights(weights, backend, int8)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"No {backend}{' INT8' if int8 else ''} export of {weights}; run "
+            f"python -m app.inference_backend export --backend {backend}{' --int8' if int8 else ''}")
+    return YOLO(path, task='detect')
+
+
+def letterbox(image, size=YOLO_IMAGE_SIZE):
+    # Same resize-and-pad as the ultralytics predictor, as a 1x3xHxW RGB batch
+    import cv2
+
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    resized = cv2.resize(image, (round(width * scale), round(height * scale)),
+                         interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top = (size - resized.shape[0]) // 2
+    left = (size - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return np.ascontiguousarray(canvas[:, :, ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+
+def calibration_images(directory=CALIBRATION_DIR, limit=CALIBRATION_IMAGES):
+    from app.utils import IMAGE_EXTENSIONS
+
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+    return [os.path.join(directory, name) for name in names[:limit]]
+
+
+def quantize_onnx(fp32_path, int8_path, calibration_dir=CALIBRATION_DIR, image_size=YOLO_IMAGE_SIZE):
+    # Static post-training quantization, activations calibrated on real cards
+    import cv2
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod,
+                                          QuantFormat, QuantType, quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    input_name = onnxruntime.InferenceSession(
+        fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    paths = calibration_images(calibration_dir)
+    if not paths:
+        raise ValueError(f"No calibration images in {calibration_dir}")
+
+    class CardCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(paths)
+
+        def get_next(self):
+            path = next(self._paths, None)
+            if path is None:
+                return None
+            return {input_name: letterbox(cv2.imread(path), image_size)}
+
+    prepared_path = fp32_path.replace('.onnx', '.prep.onnx')
+    quant_pre_process(fp32_path, prepared_path)
+    excluded = [node.name for node in onnx.load(prepared_path).graph.node
+                if node.name.startswith(ONNX_INT8_EXCLUDED_PREFIXES)]
+    quantize_static(prepared_path, int8_path, CardCalibrationReader(),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    calibrate_method=CalibrationMethod.MinMax, nodes_to_exclude=excluded)
+    os.remove(prepared_path)
+    # Ultralytics reads class names, stride and image size from the model
+    # metadata, which quantization does not carry over
+    quantized = onnx.load(int8_path)
+    for prop in onnx.load(fp32_path).metadata_props:
+        entry = quantized.metadata_props.add()
+        entry.key, entry.value = prop.key, prop.value
+    onnx.save(quantized, int8_path)
+    app_logger.info("Quantized %s to %s on %d calibration images", fp32_path, int8_path, len(paths))
+    return int8_path
+
+
+def _calibration_yaml(calibration_dir):
+    # Ultralytics calibrates OpenVINO INT8 on the 'val' split of a dataset
+    # yaml; data/data.yaml points at the machine it was trained on
+    from app.yolo_service import YOLO_CLASSES
+
+    path = os.path.join('cache', 'calibration.yaml')
+    os.makedirs('cache', exist_ok=True)
+    images = os.path.abspath(calibration_dir)
+    with open(path, 'w') as f:
+        f.write(f"path: {os.path.dirname(images)}\n")
+        f.write(f"train: {os.path.basename(images)}\nval: {os.path.basename(images)}\n")
+        f.write("names:\n" + ''.join(f"  {k}: {v}\n" for k, v in sorted(YOLO_CLASSES.items())))
+    return path
+
+
+def export_yolo(weights, backend, int8=False, image_size=YOLO_IMAGE_SIZE, calibration_dir=CALIBRATION_DIR):
+    from ultralytics import YOLO
+
+    if backend == 'torch':
+        return weights
+    model = YOLO(weights)
+    target = backend_weights(weights, backend, int8)
+    if backend == 'onnx':
+        # Dynamic axes so the micro-batcher can send several images at once
+        fp32_path = model.export(format='onnx', imgsz=image_size, dynamic=True, simplify=True)
+        if int8:
+            quantize_onnx(fp32_path, target, calibration_dir, image_size)
+    else:
+        kwargs = {"int8": True, "data": _calibration_yaml(calibration_dir)} if int8 else {}
+        model.export(format='openvino', imgsz=image_size, dynamic=True, **kwargs)
+    app_logger.info("Exported %s for %s%s to %s", weights, backend, ' INT8' if int8 else '', target)
+    return target
+
+
+def _predictions(model, image):
+    started = time.perf_counter()
+    result = model.predict(source=image, imgsz=YOLO_IMAGE_SIZE, save=False, verbose=False)[0]
+    elapsed = time.perf_counter() - started
+    return [(int(cls), tuple(float(v) for v in box), float(conf))
+            for box, cls, conf in zip(result.boxes.xyxy, result.boxes.cls, result.boxes.conf)], elapsed
+
+
+def parity_check(weights, backend, int8=False, split='test', limit=None,
+                 min_iou=0.9, max_conf_diff=0.05, min_matched=0.98):
+    # Every PyTorch box should have an exported box of the same class that
+    # overlaps it by min_iou with a confidence within max_conf_diff, and the
+    # exported model should find nothing else
+    import cv2
+    from ultralytics import YOLO
+    from app.benchmark import list_images, iou, summarize
+
+    reference, exported = YOLO(weights), load_yolo(weights, backend, int8)
+    total = matched = extra = 0
+    worst_iou, worst_conf_diff = 1.0, 0.0
+    timings = {"torch": [], backend: []}
+    mismatched_images = []
+    for path in list_images(split, limit):
+        image = cv2.imread(path)
+        expected, torch_time = _predictions(reference, image)
+        actual, backend_time = _predictions(exported, image)
+        timings["torch"].append(torch_time)
+        timings[backend].append(backend_time)
+        remaining, image_ok = list(actual), True
+        for class_id, box, conf in expected:
+            total += 1
+            candidates = [p for p in remaining if p[0] == class_id]
+            best = max(candidates, key=lambda p: iou(box, p[1]), default=None)
+            if best is None or iou(box, best[1]) < min_iou or abs(best[2] - conf) > max_conf_diff:
+                image_ok = False
+                continue
+            matched += 1
+            remaining.remove(best)
+            worst_iou = min(worst_iou, iou(box, best[1]))
+            worst_conf_diff = max(worst_conf_diff, abs(best[2] - conf))
+        extra += len(remaining)
+        if not image_ok or remaining:
+            mismatched_images.append(os.path.basename(path))
+
+    matched_ratio = matched / total if total else 1.0
+    # Missed and extra boxes both count against the export
+    agreement = matched / (total + extra) if total + extra else 1.0
+    return {
+        "backend": backend,
+        "int8": int8,
+        "weights": backend_weights(weights, backend, int8),
+        "boxes": total,
+        "matched_ratio": round(matched_ratio, 4),
+        "extra_boxes": extra,
+        "agreement": round(agreement, 4),
+        "worst_matched_iou": round(worst_iou, 4),
+        "worst_conf_diff": round(worst_conf_diff, 4),
+        "mismatched_images": mismatched_images,
+        "latency": {name: summarize(values) for name, values in timings.items() if values},
+        "passed": agreement >= min_matched,
+    }
+
+
+def main(argv=None):
+    from app.model_registry import YOLO_WEIGHTS_PATH
+
+    parser = argparse.ArgumentParser(description='CPU inference backends for the YOLO detector')
+    parser.add_argument('command', choices=('export', 'parity'))
+    parser.add_argument('--weights', default=YOLO_WEIGHTS_PATH)
+    parser.add_argument('--backend', choices=BACKENDS[1:], default='onnx')
+    parser.add_argument('--int8', action='store_true', help='post-training INT8 quantization')
+    parser.add_argument('--calibration-dir', default=CALIBRATION_DIR)
+    parser.add_argument('--split', default='test', help='parity check images')
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--min-iou', type=float, default=0.9)
+    parser.add_argument('--max-conf-diff', type=float, default=0.05)
+    parser.add_argument('--min-matched', type=float, default=0.98)
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        print(export_yolo(args.weights, args.backend, args.int8, calibration_dir=args.calibration_dir))
+        return 0
+    report = parity_check(args.weights, args.backend, args.int8, args.split, args.limit,
+                          args.min_iou, args.max_conf_diff, args.min_matched)
+    print(json.dumps(report, indent=2))
+    return 0 if report["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
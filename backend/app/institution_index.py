@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+import unicodedata
+import numpy as np
+from app.logger import app_logger
+
+""" Trigram index over canonical institution names
+
+Build once (python -m app.institution_index build), then every process
+memory-maps the arrays instead of re-reading and re-indexing the list.
+Each line of the list is a canonical name optionally followed by its
+aliases, separated by '|'; every alias is indexed and resolves to the
+canonical name.
+"""
+
+INSTITUTIONS_PATH = os.environ.get('INSTITUTIONS_PATH', 'data/gazetteer/institutions.txt')
+INSTITUTION_INDEX_DIR = os.environ.get('INSTITUTION_INDEX_DIR', 'cache/institutions')
+# A string is only replaced by its canonical name when the best match
+# scores at least this, and beats the best different institution by the
+# margin; near-identical names of different institutions stay unresolved
+INSTITUTION_MATCH_MIN = float(os.environ.get('INSTITUTION_MATCH_MIN', 90))
+INSTITUTION_MATCH_MARGIN = float(os.environ.get('INSTITUTION_MATCH_MARGIN', 10))
+
+# Names are folded to this alphabet, so a trigram is an exact integer code
+# and its posting list is found by direct indexing
+ALPHABET = ' abcdefghijklmnopqrstuvwxyz0123456789'
+CHAR_CODES = {char: code for code, char in enumerate(ALPHABET)}
+BASE = len(ALPHABET)
+GRAM_SPACE = BASE ** 3
+# Digits OCR commonly reads in place of letters; institution names have none
+OCR_DIGIT_FOLD = str.maketrans('0156', 'oisb')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+    text = text.translate(OCR_DIGIT_FOLD)
+    text = ''.join(char if char in CHAR_CODES else ' ' for char in text)
+    return ' '.join(text.split())
+
+
+def trigram_codes(text):
+    padded = f"  {normalize(text)} "
+    codes = {CHAR_CODES[padded[i]] * BASE * BASE + CHAR_CODES[padded[i + 1]] * BASE + CHAR_CODES[padded[i + 2]]
+             for i in range(len(padded) - 2)}
+    return np.fromiter(codes, dtype=np.int32, count=len(codes))
+
+
+def gram_idf(document_frequency, count):
+    # Trigrams shared by most names ("uni", "ity") carry little evidence;
+    # unseen ones get the weight of the rarest
+    return np.log1p(count / np.maximum(document_frequency, 0.5)).astype(np.float32)
+
+
+def _source_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def build_index(source_path=INSTITUTIONS_PATH, index_dir=INSTITUTION_INDEX_DIR):
+    # (indexed string, canonical name) for every name and alias
+    entries = set()
+    with open(source_path, encoding='utf-8') as f:
+        for line in f:
+            variants = [variant.strip() for variant in line.split('|') if variant.strip()]
+            entries.update((variant, variants[0]) for variant in variants)
+    entries = sorted(entries)
+    names = [canonical for _, canonical in entries]
+
+    grams = [trigram_codes(variant) for variant, _ in entries]
+    gram_counts = np.array([len(codes) for codes in grams], dtype=np.int64)
+    all_codes = np.concatenate(grams) if grams else np.empty(0, dtype=np.int32)
+    owners = np.repeat(np.arange(len(names), dtype=np.int32), gram_counts)
+    order = np.argsort(all_codes, kind='stable')
+    postings = owners[order]
+    offsets = np.zeros(GRAM_SPACE + 1, dtype=np.int64)
+    np.cumsum(np.bincount(all_codes, minlength=GRAM_SPACE), out=offsets[1:])
+    # Per-name total IDF weight, the denominator of the weighted Dice score
+    idf = gram_idf(np.diff(offsets), len(names))
+    name_weights = np.array([idf[codes].sum() for codes in grams], dtype=np.float32)
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, 'offsets.npy'), offsets)
+    np.save(os.path.join(index_dir, 'postings.npy'), postings)
+    np.save(os.path.join(index_dir, 'name_weights.npy'), name_weights)
+    # One line per indexed string: the canonical name it resolves to
+    with open(os.path.join(index_dir, 'names.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(names))
+    with open(os.path.join(index_dir, 'meta.json'), 'w') as f:
+        json.dump({"source": source_path, "sha256": _source_digest(source_path),
+                   "count": len(set(names)), "aliases": len(entries) - len(set(names))}, f)
+    app_logger.info("Built institution index of %d names (%d aliases) in %s",
+                    len(set(names)), len(entries) - len(set(names)), index_dir)
+
+
+class InstitutionIndex:
+    def __init__(self, index_dir):
+        # Arrays stay on disk and are paged in on demand
+        self.offsets = np.load(os.path.join(index_dir, 'offsets.npy'), mmap_mode='r')
+        self.postings = np.load(os.path.join(index_dir, 'postings.npy'), mmap_mode='r')
+        self.name_weights = np.load(os.path.join(index_dir, 'name_weights.npy'), mmap_mode='r')
+        with open(os.path.join(index_dir, 'names.txt'), encoding='utf-8') as f:
+            self.names = f.read().split('\n') if len(self.name_weights) else []
+
+    def top_k(self, text, k=5):
+        # IDF-weighted Dice coefficient on trigram sets, scored 0-100. Only
+        # names sharing at least one trigram with the query are touched.
+        codes = trigram_codes(text)
+        if not len(codes) or not self.names:
+            return []
+        starts, ends = self.offsets[codes], self.offsets[codes + 1]
+        weights = gram_idf(ends - starts, len(self.names))
+        hits = [(self.postings[start:end], weight)
+                for start, end, weight in zip(starts, ends, weights) if end > start]
+        if not hits:
+            return []
+        candidates = np.concatenate([postings for postings, _ in hits])
+        candidate_weights = np.concatenate(
+            [np.full(len(postings), weight, dtype=np.float32) for postings, weight in hits])
+        ids, inverse = np.unique(candidates, return_inverse=True)
+        shared = np.bincount(inverse, weights=candidate_weights)
+        scores = 200.0 * shared / (weights.sum() + self.name_weights[ids])
+        # Best-scoring alias per institution
+        matches = {}
+        for i in np.argsort(-scores, kind='stable'):
+            name = self.names[ids[i]]
+            if name not in matches:
+                matches[name] = round(float(scores[i]), 2)
+                if len(matches) == k:
+                    break
+        return list(matches.items())
+
+    def canonical(self, text, min_score=INSTITUTION_MATCH_MIN, margin=INSTITUTION_MATCH_MARGIN):
+        matches = self.top_k(text, k=2)
+        if not matches or matches[0][1] < min_score:
+            return None
+        if len(matches) > 1 and matches[0][1] - matches[1][1] < margin:
+            return None
+        return matches[0][0]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _index_is_current(source_path, index_dir):
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return meta.get("sha256") == _source_digest(source_path)
+
+
+def get_institution_index():
+    # Loaded once per process; rebuilt only when the source list changed.
+    # Returns None when no institution list is configured.
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if not os.path.exists(INSTITUTIONS_PATH):
+                    return None
+                if not _index_is_current(INSTITUTIONS_PATH, INSTITUTION_INDEX_DIR):
+                    build_index(INSTITUTIONS_PATH, INSTITUTION_INDEX_DIR)
+                _index = InstitutionIndex(INSTITUTION_INDEX_DIR)
+    return _index
+
+
+def canonical_university(text):
+    index = get_institution_index()
+    if index is None or not text:
+        return None
+    return index.canonical(text)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'build':
+        build_index(*sys.argv[2:4])
+    else:
+        for match in get_institution_index().top_k(' '.join(sys.argv[1:])):
+            print(match)
@@ -0,0 +1,108 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from app.logger import app_logger
+
+""" Asynchronous jobs: submit now, poll or stream the result later """
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 256))
+JOB_MAX_STORED = int(os.environ.get('JOB_MAX_STORED', 10000))
+JOB_RESULT_TTL = float(os.environ.get('JOB_RESULT_TTL', 3600))
+
+FINISHED_STATES = ('done', 'failed')
+
+
+class QueueFull(Exception):
+    pass
+
+
+class InMemoryJobStore:
+    # Bounded store; oldest finished jobs are evicted first. Any object with
+    # the same create/get/update/count_pending methods can replace it.
+
+    def __init__(self, max_jobs=JOB_MAX_STORED, ttl=JOB_RESULT_TTL):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def create(self, job):
+        with self._lock:
+            self._expire()
+            if len(self._jobs) >= self.max_jobs:
+                raise QueueFull("Job store is full")
+            self._jobs[job["id"]] = job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id, **changes):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(changes, updated_at=time.time())
+                self._changed.notify_all()
+
+    def wait(self, job_id, since, timeout):
+        # Block until the job changes after `since` or the timeout expires
+        with self._lock:
+            self._changed.wait_for(
+                lambda: self._jobs.get(job_id, {}).get('updated_at', since) > since,
+                timeout=timeout)
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def count_pending(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values()
+                       if job["status"] not in FINISHED_STATES)
+
+    def _expire(self):
+        now = time.time()
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            finished = job["status"] in FINISHED_STATES
+            if finished and (now - job["updated_at"] > self.ttl or len(self._jobs) >= self.max_jobs):
+                del self._jobs[job_id]
+
+
+class JobManager:
+    def __init__(self, store, max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING):
+        self.store = store
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='job')
+
+    def submit(self, fn, **meta):
+        # Queue fn() and return its job id immediately
+        if self.store.count_pending() >= self.max_pending:
+            raise QueueFull("Too many pending jobs")
+        now = time.time()
+        job = dict(meta, id=uuid.uuid4().hex, status='queued', result=None,
+                   error=None, created_at=now, updated_at=now)
+        self.store.create(job)
+        self._executor.submit(self._run, job["id"], fn)
+        return job["id"]
+
+    def _run(self, job_id, fn):
+        self.store.update(job_id, status='running', started_at=time.time())
+        try:
+            result = fn()
+        except Exception as e:
+            app_logger.error("Job %s failed: %s", job_id, e)
+            self.store.update(job_id, status='failed', error=str(e))
+            return
+        self.store.update(job_id, status='done', result=result)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+job_manager = JobManager(InMemoryJobStore())
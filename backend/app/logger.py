@@ -1,23 +1,130 @@
 import os
+import json
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import contextvars
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
-if not os.path.exists('logs'):
-    os.makedirs('logs')
+""" Non-blocking logging
 
+Request threads only put the record on a queue; a listener thread formats
+it (JSON by default) and writes the rotating files. Records carry the
+request id, and arrays or huge values passed as arguments are summarized
+instead of stringified.
+"""
 
-def setup_logger(name, log_file, level=logging.INFO):
-    log_file_path = os.path.join('logs', log_file)
+LOG_DIR = os.environ.get('LOG_DIR', 'logs')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Longest argument (str/bytes repr) written as is; arrays are never written
+LOG_MAX_ARG_CHARS = int(os.environ.get('LOG_MAX_ARG_CHARS', 2000))
+
+if not os.path.exists(LOG_DIR):
+    os.makedirs(LOG_DIR)
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRS = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+
+def set_request_id(request_id):
+    return request_id_var.set(request_id)
+
+
+def safe_arg(value):
+    # Summarize what would be costly to turn into text
+    if hasattr(value, 'shape') and hasattr(value, 'dtype'):
+        return f"<{type(value).__name__} shape={tuple(value.shape)} dtype={value.dtype}>"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{type(value).__name__} len={len(value)}>"
+    if isinstance(value, str) and len(value) > LOG_MAX_ARG_CHARS:
+        return value[:LOG_MAX_ARG_CHARS] + f"... <{len(value) - LOG_MAX_ARG_CHARS} more chars>"
+    return value
+
+
+class ContextQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Runs on the calling thread, so it only attaches context and
+        # guards arguments; message formatting happens on the listener
+        record.request_id = request_id_var.get()
+        record.msg = safe_arg(record.msg)
+        if isinstance(record.args, tuple):
+            record.args = tuple(safe_arg(arg) for arg in record.args)
+        elif isinstance(record.args, dict):
+            record.args = {key: safe_arg(value) for key, value in record.args.items()}
+        if record.exc_info and not record.exc_text:
+            # The traceback is gone once the calling frame unwinds
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key not in entry and key != 'request_id':
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        request_id = getattr(record, 'request_id', None)
+        return f"{text} [request {request_id}]" if request_id else text
+
+
+def _file_handler(log_file, level):
     handler = RotatingFileHandler(
-        log_file_path, maxBytes=1000000, backupCount=5)
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        os.path.join(LOG_DIR, log_file), maxBytes=1000000, backupCount=5)
+    handler.setLevel(level)
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    return handler
+
+
+_log_queue = queue.SimpleQueue()
+# Every record goes to app.log, errors of any logger also to error.log
+_listener = QueueListener(
+    _log_queue,
+    _file_handler('app.log', logging.DEBUG),
+    _file_handler('error.log', logging.ERROR),
+    respect_handler_level=True)
+_listener.start()
+
+
+def stop_logging():
+    # Drains what is queued; registered at exit, safe to call twice
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+def setup_logger(name, level=LOG_LEVEL):
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    logger.addHandler(ContextQueueHandler(_log_queue))
+    logger.propagate = False
     return logger
 
 
-app_logger = setup_logger('app_logger', 'app.log')
-error_logger = setup_logger('error_logger', 'error.log', level=logging.ERROR)
+app_logger = setup_logger('app_logger')
@@ -0,0 +1,263 @@
+import time
+import bisect
+import functools
+import threading
+import contextvars
+
+""" In-process metrics, rendered in Prometheus text format """
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"]
+
+    def drain(self):
+        # Values recorded since the last drain, for a worker process to
+        # hand to the front process that renders /metrics
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def merge(self, values):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        # Optional callable returning {label-values tuple: value}, read at scrape time
+        self._collect = collect
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def drain(self):
+        # Collected gauges describe the process rendering them
+        return {} if self._collect is not None else super().drain()
+
+    def merge(self, values):
+        with self._lock:
+            self._values.update(values)
+
+    def render(self):
+        if self._collect is not None:
+            try:
+                collected = self._collect()
+            except Exception:
+                collected = {}
+            with self._lock:
+                self._values = dict(collected)
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def merge(self, values):
+        with self._lock:
+            for key, (counts, total, count) in values.items():
+                state = self._values.get(key)
+                if state is None:
+                    state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+
+    def _render_sample(self, key, state):
+        counts, total, count = state
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {total}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), collect=None):
+        return self._add(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def drain(self):
+        return {metric.name: values for metric in self._metrics for values in (metric.drain(),) if values}
+
+    def merge(self, drained):
+        # Adds another process's drained values: counters and histograms
+        # accumulate, gauges take the latest value
+        for metric in self._metrics:
+            if metric.name in drained:
+                metric.merge(drained[metric.name])
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+REQUESTS = metrics.counter(
+    'idcard_requests_total', 'HTTP requests by endpoint and status', ('endpoint', 'status'))
+REQUEST_ERRORS = metrics.counter(
+    'idcard_request_errors_total', 'HTTP requests that returned a 5xx', ('endpoint',))
+REQUEST_LATENCY = metrics.histogram(
+    'idcard_request_seconds', 'HTTP request latency', ('endpoint',))
+STAGE_LATENCY = metrics.histogram(
+    'idcard_stage_seconds', 'Pipeline stage latency', ('stage',))
+STAGE_ERRORS = metrics.counter(
+    'idcard_stage_errors_total', 'Pipeline stages that raised', ('stage',))
+OCR_BOXES = metrics.counter(
+    'idcard_ocr_boxes_total', 'Text boxes sent to or returned by OCR', ('pipeline',))
+OCR_CROPS_SKIPPED = metrics.counter(
+    'idcard_ocr_crops_skipped_total', 'YOLO boxes not sent to OCR, by reason', ('reason',))
+CASCADE_RUNS = metrics.counter(
+    'idcard_cascade_total', 'Auto-mode requests by the paths that ran', ('path',))
+ADMISSION_WAIT = metrics.histogram(
+    'idcard_admission_wait_seconds', 'Time requests waited for an admission slot', ('endpoint',))
+ADMISSION_REJECTED = metrics.counter(
+    'idcard_admission_rejected_total', 'Requests turned away before inference, by reason', ('endpoint', 'reason'))
+VIDEO_FRAMES = metrics.counter(
+    'idcard_video_frames_total', 'Video frames by gate outcome (duplicate, blurry, detected)', ('outcome',))
+MODEL_MEMORY = metrics.gauge(
+    'idcard_model_memory_bytes', 'Parameter memory of each loaded model', ('model',))
+MODEL_LOAD_SECONDS = metrics.gauge(
+    'idcard_model_load_seconds', 'Time to load and warm each model', ('model',))
+STARTUP_SECONDS = metrics.gauge(
+    'idcard_startup_seconds', 'Time spent in each startup phase', ('component',))
+
+
+# Per-request list of (stage, seconds); None outside a request
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def begin_request():
+    _request_timings.set([])
+
+
+def end_request():
+    timings = _request_timings.get()
+    _request_timings.set(None)
+    return timings or []
+
+
+def current_timings():
+    # The current request's timing list, which another thread (e.g. the one
+    # collecting worker results) may extend; None outside a request
+    return _request_timings.get()
+
+
+class span:
+    # Times a pipeline stage; a plain class rather than @contextmanager keeps
+    # the cost of a span to a couple of microseconds
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        STAGE_LATENCY.observe(elapsed, stage=self.stage)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(stage=self.stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.stage, elapsed))
+        return False
+
+
+def timed(stage):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing_header(timings):
+    # Server-Timing format, readable in browser dev tools
+    return ', '.join(f"{stage};dur={elapsed * 1000:.2f}" for stage, elapsed in timings)
@@ -0,0 +1,248 @@
+import os
+import hashlib
+import time
+import functools
+import threading
+from importlib import metadata
+from contextlib import contextmanager
+import numpy as np
+from app.logger import app_logger
+from app.inference_backend import load_yolo, backend_weights, YOLO_BACKEND, YOLO_INT8
+from app.metrics import MODEL_MEMORY, MODEL_LOAD_SECONDS
+
+""" Shared model registry: every model is loaded once per process
+
+torch, ultralytics, easyocr and spaCy are imported by the loaders, so a
+process only pays for the frameworks of the models it actually loads.
+"""
+
+YOLO_WEIGHTS_PATH = os.environ.get(
+    'YOLO_WEIGHTS_PATH', r'runs/detect/train2/weights/best.pt')
+OCR_LANGUAGES = ['en']
+SPACY_MODEL = os.environ.get('SPACY_MODEL', 'en_core_web_trf')
+SPACY_SMALL_MODEL = os.environ.get('SPACY_SMALL_MODEL', 'en_core_web_sm')
+# Only the entity recognizer is used, so the other pipes are never loaded
+SPACY_EXCLUDED_PIPES = ['tagger', 'parser', 'attribute_ruler', 'lemmatizer', 'senter']
+# Where a reload request may point each kind of model: YOLO weights under
+# MODEL_FOLDER, spaCy pipelines as an installed package name or a
+# directory under SPACY_MODEL_FOLDER, OCR as a list of language codes
+MODEL_FOLDER = os.environ.get('MODEL_FOLDER', 'runs')
+SPACY_MODEL_FOLDER = os.environ.get('SPACY_MODEL_FOLDER', 'models')
+
+
+_file_versions = {}
+
+
+def file_version(path):
+    # Short content hash so a hot-swapped weights file gets a new version;
+    # memoized on (size, mtime) so it is cheap to ask for on every request.
+    # Exported model directories (OpenVINO) hash their files together.
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, name) for name in os.listdir(path))
+        return hashlib.sha256(''.join(file_version(f) for f in files).encode()).hexdigest()[:12]
+    if not os.path.isfile(path):
+        return str(path)
+    stat = os.stat(path)
+    cached = _file_versions.get(path)
+    if cached is not None and cached[0] == (stat.st_size, stat.st_mtime):
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    version = digest.hexdigest()[:12]
+    _file_versions[path] = ((stat.st_size, stat.st_mtime), version)
+    return version
+
+
+@functools.lru_cache(maxsize=None)
+def package_version(name):
+    # Installed version, read from package metadata without importing it
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def _inside(folder, path):
+    return os.path.abspath(path).startswith(os.path.abspath(folder) + os.sep)
+
+
+def check_weights_source(source):
+    if not isinstance(source, str) or not _inside(MODEL_FOLDER, source):
+        raise ValueError(f"Model weights must live under {MODEL_FOLDER}/")
+    return source
+
+
+def check_spacy_source(source):
+    if isinstance(source, str) and (source.isidentifier() or _inside(SPACY_MODEL_FOLDER, source)):
+        return source
+    raise ValueError(f"spaCy model must be an installed package name or live under {SPACY_MODEL_FOLDER}/")
+
+
+def check_ocr_source(source):
+    languages = [source] if isinstance(source, str) else source
+    if (isinstance(languages, list) and languages
+            and all(isinstance(code, str) and code.replace('_', '').isalnum() for code in languages)):
+        return tuple(languages)
+    raise ValueError("OCR source must be a list of language codes, e.g. [\"en\", \"bn\"]")
+
+
+def model_memory_bytes(model):
+    # Parameter bytes of the torch modules behind YOLO and EasyOCR; spaCy
+    # pipelines expose no torch parameters and report 0
+    modules = [getattr(model, attr) for attr in ('model', 'detector', 'recognizer')
+               if hasattr(getattr(model, attr, None), 'parameters')]
+    return sum(p.numel() * p.element_size()
+               for module in modules for p in module.parameters())
+
+
+class _LoadedModel:
+    def __init__(self, model, source, version, load_seconds):
+        self.model = model
+        self.source = source
+        self.version = version
+        self.load_seconds = load_seconds
+        # Inference on a shared model instance is serialized per model
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._specs = {}
+        self._loaded = {}
+
+    def register(self, name, loader, source, warmup=None, version=None, check_source=check_weights_source):
+        self._specs[name] = {
+            "loader": loader,
+            "source": source,
+            "warmup": warmup,
+            "version": version or file_version,
+            "check_source": check_source,
+        }
+
+    def check_source(self, name, source):
+        # A reload source from a client, normalized for the loader; raises
+        # ValueError when it is not where this kind of model may come from
+        if name not in self._specs:
+            raise KeyError(f"Unknown model '{name}'")
+        return self._specs[name]["check_source"](source)
+
+    def _build(self, name, source):
+        spec = self._specs[name]
+        app_logger.info("Loading model '%s' from %s", name, source)
+        started = time.perf_counter()
+        model = spec["loader"](source)
+        if spec["warmup"] is not None:
+            spec["warmup"](model)
+            app_logger.info("Model '%s' warmed up", name)
+        load_seconds = round(time.perf_counter() - started, 3)
+        MODEL_LOAD_SECONDS.set(load_seconds, model=name)
+        MODEL_MEMORY.set(model_memory_bytes(model), model=name)
+        app_logger.info("Model '%s' ready in %ss", name, load_seconds)
+        return _LoadedModel(model, source, spec["version"](source), load_seconds)
+
+    def _entry(self, name):
+        entry = self._loaded.get(name)
+        if entry is not None:
+            return entry
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is None:
+                if name not in self._specs:
+                    raise KeyError(f"Unknown model '{name}'")
+                entry = self._build(name, self._specs[name]["source"])
+                self._loaded[name] = entry
+        return entry
+
+    def get(self, name):
+        return self._entry(name).model
+
+    @contextmanager
+    def use(self, name):
+        entry = self._entry(name)
+        with entry.lock:
+            yield entry.model
+
+    def version(self, name):
+        # Version of what is (or would be) served, without forcing a load
+        entry = self._loaded.get(name)
+        if entry is not None:
+            return entry.version
+        spec = self._specs[name]
+        return spec["version"](spec["source"])
+
+    def set_source(self, name, source):
+        # Point a model at new weights without loading them in this process
+        self._specs[name]["source"] = source
+
+    def preload(self, names=None):
+        for name in list(self._specs) if names is None else names:
+            self._entry(name)
+
+    def is_loaded(self, name):
+        return name in self._loaded
+
+    def reload(self, name, source=None):
+        # Build and warm the replacement first, then swap it in; requests
+        # already holding the old instance finish on it undisturbed.
+        if name not in self._specs:
+            raise KeyError(f"Unknown model '{name}'")
+        source = source or self._specs[name]["source"]
+        entry = self._build(name, source)
+        with self._lock:
+            self._specs[name]["source"] = source
+            self._loaded[name] = entry
+        app_logger.info(
+            "Model '%s' hot-swapped to %s (version %s)", name, source, entry.version)
+        return entry.version
+
+    def status(self):
+        return {name: {"source": entry.source, "version": entry.version,
+                       "load_seconds": entry.load_seconds}
+                for name, entry in self._loaded.items()}
+
+
+def _warmup_yolo(model):
+    model.predict(source=np.zeros((640, 640, 3), dtype=np.uint8),
+                  save=False, verbose=False)
+
+
+def _warmup_ocr(reader):
+    reader.readtext(np.full((64, 256, 3), 255, dtype=np.uint8), detail=0)
+
+
+def _warmup_nlp(nlp):
+    nlp("Student ID card issued by the University")
+
+
+registry = ModelRegistry()
+# The source stays the .pt path; YOLO_BACKEND/YOLO_INT8 pick which export of
+# it is served, and the version names the backend too
+registry.register('yolo', load_yolo, YOLO_WEIGHTS_PATH, warmup=_warmup_yolo,
+                  version=lambda weights: f"{YOLO_BACKEND}{'-int8' if YOLO_INT8 else ''}-"
+                                          f"{file_version(backend_weights(weights))}")
+
+
+def _load_ocr(languages):
+    import easyocr
+    return easyocr.Reader(list(languages))
+
+
+registry.register('ocr', _load_ocr, tuple(OCR_LANGUAGES), warmup=_warmup_ocr,
+                  version=lambda languages: f"easyocr-{package_version('easyocr')}",
+                  check_source=check_ocr_source)
+
+
+def _load_spacy(model_name):
+    import spacy
+    return spacy.load(model_name, exclude=SPACY_EXCLUDED_PIPES)
+
+
+registry.register('nlp', _load_spacy, SPACY_MODEL, warmup=_warmup_nlp,
+                  version=lambda model_name: f"{model_name}-{package_version('spacy')}",
+                  check_source=check_spacy_source)
+registry.register('nlp_small', _load_spacy, SPACY_SMALL_MODEL, warmup=_warmup_nlp,
+                  version=lambda model_name: f"{model_name}-{package_version('spacy')}",
+                  check_source=check_spacy_source)
@@ -1,32 +1,142 @@
-import spacy
+import os
 import re
 from app.ocr_service import clean_ocr_text_nlp
-nlp = spacy.load("en_core_web_trf")
+from app.model_registry import registry
+from app.metrics import timed
+from app.profiles import setting
 
+""" Tiered field extraction: rules and gazetteer, then small spaCy, then transformer """
 
-def extract_fields_nlp(lines):
-    name = university = expiration = None
-    merged_lines = " ".join(lines)
-    merged_lines = clean_ocr_text_nlp(merged_lines)
+# Tiers tried in order for the Name field; a later tier only runs when the
+# best candidate so far is below NER_CONFIDENCE_THRESHOLD
+NER_TIERS = os.environ.get('NER_TIERS', 'rules,statistical,transformer').split(',')
+NER_CONFIDENCE_THRESHOLD = float(os.environ.get('NER_CONFIDENCE_THRESHOLD', 0.8))
+NAME_GAZETTEER_PATH = os.environ.get(
+    'NAME_GAZETTEER_PATH', 'data/gazetteer/first_names.txt')
 
-    doc = nlp(merged_lines)
+# spaCy model registered for each model tier
+TIER_MODELS = {'statistical': 'nlp_small', 'transformer': 'nlp'}
+
+NAME_LABEL = re.compile(r"^\s*(?:student'?s?\s+)?name\s*[:\-.]?\s*(.+)$", re.I)
+NOT_A_NAME = re.compile(
+    r"universit|institut|college|school|student|card|\bid\b|valid|expir|issue|"
+    r"date|\bno\b|number|dept|department|program|faculty|session|semester|"
+    r"blood|phone|email|www|@|\d", re.I)
+NAME_TOKEN = re.compile(r"^[A-Za-z][A-Za-z.'\-]*$")
+
+
+def _load_gazetteer(path):
+    if not os.path.exists(path):
+        return frozenset()
+    with open(path, encoding='utf-8') as f:
+        return frozenset(line.strip().lower() for line in f if line.strip())
+
+
+NAME_GAZETTEER = _load_gazetteer(NAME_GAZETTEER_PATH)
 
-    for ent in doc.ents:
-        if ent.label_ == "PERSON":
-            name = ent.text
-            break
 
+def _looks_like_name(text):
+    tokens = text.split()
+    if not 2 <= len(tokens) <= 4 or NOT_A_NAME.search(text):
+        return False
+    return all(NAME_TOKEN.match(token) for token in tokens) and \
+        all(token[0].isupper() for token in tokens)
+
+
+def _in_gazetteer(text):
+    return any(token.strip(".'-").lower() in NAME_GAZETTEER for token in text.split())
+
+
+def name_from_rules(lines):
+    # Layout and lexical heuristics: an explicit "Name:" label, otherwise a
+    # name-shaped line, trusted more when it contains a known given name
+    best = (None, 0.0)
+    for line in lines:
+        line = clean_ocr_text_nlp(line).strip()
+        labelled = NAME_LABEL.match(line)
+        if labelled and _looks_like_name(labelled.group(1).strip()):
+            return labelled.group(1).strip(), 0.95
+        if _looks_like_name(line):
+            confidence = 0.85 if _in_gazetteer(line) else 0.5
+            if confidence > best[1]:
+                best = (line, confidence)
+    return best
+
+
+def _person_confidence(text, lines):
+    # A PERSON entity is more trustworthy when it is a whole name-shaped
+    # line or contains a known given name
+    whole_line = any(clean_ocr_text_nlp(line).strip() == text for line in lines)
+    if (whole_line and _looks_like_name(text)) or _in_gazetteer(text):
+        return 0.85
+    return 0.65
+
+
+def university_from_lines(lines):
     for line in lines:
         if re.search(r"University|Institute|College", line, re.I):
-            university = line
-            break
+            return line
+    return None
+
 
+def expiration_from_lines(lines):
     for line in lines:
         clean_line = clean_ocr_text_nlp(line)
         date_match = re.search(
             r"(\d{1,2}/\d{1,2}/\d{4}|\d{1,2}/\d{1,2}/\d{2})", clean_line)
         if date_match:
-            expiration = date_match.group(0)
+            return date_match.group(0)
+    return None
+
+
+@timed('extract_fields_nlp_batch')
+def extract_fields_nlp_batch(documents):
+    # documents: one list of OCR lines per card. Each model tier runs once
+    # over every card still unresolved, through nlp.pipe.
+    names = [(None, 0.0, None)] * len(documents)
+    texts = [clean_ocr_text_nlp(" ".join(lines)) for lines in documents]
+    threshold = setting('ner_confidence_threshold', NER_CONFIDENCE_THRESHOLD)
+
+    for tier in setting('ner_tiers', NER_TIERS):
+        pending = [index for index, (_, confidence, _) in enumerate(names)
+                   if confidence < threshold]
+        if not pending:
             break
+        if tier == 'rules':
+            for index in pending:
+                name, confidence = name_from_rules(documents[index])
+                if name and confidence > names[index][1]:
+                    names[index] = (name, confidence, tier)
+            continue
+
+        with registry.use(TIER_MODELS[tier]) as nlp:
+            docs = list(nlp.pipe([texts[index] for index in pending]))
+        for index, doc in zip(pending, docs):
+            person = next((ent.text for ent in doc.ents if ent.label_ == "PERSON"), None)
+            if person is None:
+                continue
+            # The transformer is the last resort, so its answer is taken as is
+            confidence = 1.0 if tier == 'transformer' else _person_confidence(person, documents[index])
+            if confidence > names[index][1]:
+                names[index] = (person, confidence, tier)
 
-    return {"Name": name, "University": university, "Expiration": expiration}
+    fields = []
+    for lines, (name, _, name_tier) in zip(documents, names):
+        university = university_from_lines(lines)
+        expiration = expiration_from_lines(lines)
+        fields.append({
+            "Name": name,
+            "University": university,
+            "Expiration": expiration,
+            "tiers": {
+                "Name": name_tier,
+                "University": 'rules' if university else None,
+                "Expiration": 'rules' if expiration else None,
+            },
+        })
+    return fields
+
+
+@timed('extract_fields_nlp')
+def extract_fields_nlp(lines):
+    return extract_fields_nlp_batch([lines])[0]
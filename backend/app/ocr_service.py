@@ -1,23 +1,37 @@
-import easyocr
 import re
-from app.image_preprocessing import preprocess_image_nlp
+import math
+import cv2
+from app.image_preprocessing import to_original_coordinates
 from app.logger import app_logger
-reader = easyocr.Reader(['en'])
+from app.model_registry import registry
+from app.metrics import timed, OCR_BOXES
+from app.profiles import setting
 
 """ OCR Service for NLP """
 
 
-def detect_text_regions_nlp(image):
+@timed('detect_text_regions_nlp')
+def detect_text_regions_nlp(image, transform=None):
+    # With the transform from preprocess_image_nlp, boxes come back in the
+    # coordinates of the original upload
     try:
-        app_logger.info(f"Detecting text regions in image: {image}")
-        result = reader.readtext(image, detail=1)
+        app_logger.info("Detecting text regions in image of shape %s", image.shape)
+        with registry.use('ocr') as reader:
+            result = reader.readtext(image, detail=1, decoder=setting('ocr_decoder', 'greedy'),
+                                     beamWidth=setting('ocr_beam_width', 5),
+                                     batch_size=setting('ocr_batch_size', 0) or 1)
+        OCR_BOXES.inc(len(result), pipeline='nlp')
+        if transform is not None:
+            result = [(to_original_coordinates(bbox, transform), text, prob)
+                      for bbox, text, prob in result]
         app_logger.info("Text detection completed successfully.")
         return result
     except Exception as e:
-        app_logger.error(f"Error during text detection: {str(e)}")
+        app_logger.error("Error during text detection: %s", e)
         raise
 
 
+@timed('extract_text_by_region_nlp')
 def extract_text_by_region_nlp(regions):
     # Group texts by their vertical position (y-coordinate) to treat them as lines
     line_dict = {}
@@ -38,3 +52,50 @@ def clean_ocr_text_nlp(text):
 
 
 """ OCR SERVICE FOR YOLO """
+
+# Input height of EasyOCR's recognition network
+RECOGNIZER_HEIGHT = 64
+
+
+@timed('yolo_crop_ocr')
+def recognize_crops(crops, decoder=None, beam_width=None):
+    # YOLO has already localized each field, so skip CRAFT detection and
+    # feed every crop (from one or many images) to the recognizer in a
+    # single batch. Returns one (text, confidence) pair per crop, in order.
+    decoder = decoder or setting('ocr_decoder', 'greedy')
+    beam_width = beam_width or setting('ocr_beam_width', 5)
+    from easyocr.recognition import get_text
+    from easyocr.utils import compute_ratio_and_resize
+
+    results = [("", 0.0)] * len(crops)
+    image_list = []
+    max_ratio = 1
+    for index, crop in enumerate(crops):
+        if crop is None or crop.size == 0:
+            continue
+        grey = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        height, width = grey.shape
+        resized, ratio = compute_ratio_and_resize(
+            grey, width, height, RECOGNIZER_HEIGHT)
+        max_ratio = max(max_ratio, ratio)
+        # get_text passes the first item through untouched, so the crop
+        # index is used to map predictions back
+        image_list.append((index, resized))
+
+    if not image_list:
+        return results
+
+    max_width = math.ceil(max_ratio) * RECOGNIZER_HEIGHT
+    with registry.use('ocr') as reader:
+        ignore_char = ''.join(set(reader.character) - set(reader.lang_char))
+        recognized = get_text(reader.character, RECOGNIZER_HEIGHT, int(max_width),
+                              reader.recognizer, reader.converter, image_list,
+                              ignore_char, decoder, beam_width,
+                              batch_size=setting('ocr_batch_size', 0) or len(image_list), workers=0,
+                              device=reader.device)
+
+    OCR_BOXES.inc(len(image_list), pipeline='yolo')
+    for index, text, confidence in recognized:
+        results[index] = (text, float(confidence))
+    app_logger.info("Recognized %d crops in one batch", len(image_list))
+    return results
@@ -0,0 +1,146 @@
+import os
+from datetime import datetime
+from app.image_preprocessing import preprocess_image_nlp
+from app.ocr_service import detect_text_regions_nlp, extract_text_by_region_nlp
+from app.ner_service import extract_fields_nlp, extract_fields_nlp_batch, TIER_MODELS
+from app.yolo_service import (extract_text_from_yolo, extract_text_from_yolo_batch,
+                              extract_text_from_yolo_scheduled, read_fields_yolo_batch,
+                              read_fields_yolo_scheduled)
+from app.metrics import CASCADE_RUNS, span
+from app.admission import check_deadline
+
+""" Field extraction entry points shared by the API and the workers """
+
+# Models whose output feeds each pipeline's extracted fields
+PIPELINE_MODELS = {
+    'yolo': ('yolo', 'ocr'),
+    'nlp': ('ocr', 'nlp_small', 'nlp'),
+    'auto': ('yolo', 'ocr', 'nlp_small', 'nlp'),
+}
+
+# Pipelines whose models are loaded and warmed at startup; the others load
+# on first use. Empty means everything is lazy.
+BOOT_PIPELINES = [name for name in os.environ.get('BOOT_PIPELINES', 'yolo,nlp').split(',') if name]
+# The transformer NER tier only runs for names the cheaper tiers are unsure
+# of, so it stays out of the boot set and loads on first use unless
+# BOOT_TRANSFORMER=1
+BOOT_TRANSFORMER = os.environ.get('BOOT_TRANSFORMER', '0') == '1'
+LAZY_MODELS = () if BOOT_TRANSFORMER else (TIER_MODELS['transformer'],)
+
+# A YOLO field is trusted by the auto cascade when both its detection and
+# its OCR reading clear these; otherwise the full-image NLP path runs
+AUTO_DETECTION_MIN = float(os.environ.get('AUTO_DETECTION_MIN', 0.5))
+AUTO_OCR_MIN = float(os.environ.get('AUTO_OCR_MIN', 0.5))
+FIELDS = ('Name', 'University', 'Expiration')
+
+
+def boot_models(pipelines=None):
+    pipelines = BOOT_PIPELINES if pipelines is None else pipelines
+    unknown = [name for name in pipelines if name not in PIPELINE_MODELS]
+    if unknown:
+        raise ValueError(f"Unknown pipeline(s) in BOOT_PIPELINES: {', '.join(unknown)}")
+    return list(dict.fromkeys(model for name in pipelines for model in PIPELINE_MODELS[name]
+                              if model not in LAZY_MODELS))
+
+
+def extract_fields_from_image_nlp(image):
+    ocr_image, transform = preprocess_image_nlp(image)
+    # Full-image OCR is the costliest stage; skip it for a client that is gone
+    check_deadline()
+    regions = detect_text_regions_nlp(ocr_image, transform)
+    lines = extract_text_by_region_nlp(regions)
+    return extract_fields_nlp(lines)
+
+
+def extract_fields_from_images_nlp(images):
+    # OCR runs per image; NER runs once for the whole batch through nlp.pipe
+    documents = []
+    for image in images:
+        ocr_image, transform = preprocess_image_nlp(image)
+        documents.append(extract_text_by_region_nlp(detect_text_regions_nlp(ocr_image, transform)))
+    return extract_fields_nlp_batch(documents)
+
+
+def _parses_as_date(text):
+    try:
+        datetime.strptime(text, "%m/%d/%Y")
+        return True
+    except ValueError:
+        return False
+
+
+def yolo_field_confidence(readings):
+    # Per field: the joined text and whether it is good enough to skip the
+    # NLP path. A field's confidence is that of its weakest reading.
+    fields = {}
+    for field in FIELDS:
+        field_readings = [reading for reading in readings if reading["field"] == field]
+        value = ' '.join(reading["text"] for reading in field_readings) or None
+        confident = bool(value) and all(
+            reading["detection"] >= AUTO_DETECTION_MIN and reading["ocr"] >= AUTO_OCR_MIN
+            for reading in field_readings)
+        if field == 'Expiration' and value:
+            confident = confident and _parses_as_date(value)
+        fields[field] = {
+            "value": value,
+            "confident": confident,
+            "confidence": round(min((min(reading["detection"], reading["ocr"])
+                                     for reading in field_readings), default=0.0), 4),
+        }
+    return fields
+
+
+def extract_fields_auto(image, save_image_path=None, scheduled=True):
+    # YOLO + crop OCR first; the full-image OCR + NER path only runs when a
+    # field is missing or unsure, and each field is taken from the path
+    # that is confident about it
+    if scheduled:
+        readings = read_fields_yolo_scheduled(image, save_image_path)
+    else:
+        readings = read_fields_yolo_batch([image], [save_image_path])[0]
+    yolo_fields = yolo_field_confidence(readings)
+
+    nlp_fields = None
+    if not all(field["confident"] for field in yolo_fields.values()):
+        with span('auto_fallback_nlp'):
+            nlp_fields = extract_fields_from_image_nlp(image)
+    CASCADE_RUNS.inc(path='yolo+nlp' if nlp_fields else 'yolo')
+
+    fields = {"sources": {}, "confidence": {}}
+    for field in FIELDS:
+        yolo_field = yolo_fields[field]
+        if yolo_field["confident"] or not (nlp_fields and nlp_fields.get(field)):
+            value, source = yolo_field["value"], 'yolo' if yolo_field["value"] else None
+        else:
+            value, source = nlp_fields[field], 'nlp'
+        fields[field] = value
+        fields["sources"][field] = source
+        fields["confidence"][field] = yolo_field["confidence"] if source == 'yolo' else None
+    if nlp_fields and nlp_fields.get("tiers"):
+        fields["tiers"] = {field: tier for field, tier in nlp_fields["tiers"].items()
+                           if fields["sources"][field] == 'nlp'}
+    return fields
+
+
+def extract_fields(pipeline, image, save_image_path=None, scheduled=True):
+    check_deadline()
+    if pipeline == 'yolo':
+        if scheduled:
+            return extract_text_from_yolo_scheduled(image, save_image_path)
+        return extract_text_from_yolo(image, save_image_path)
+    if pipeline == 'nlp':
+        return extract_fields_from_image_nlp(image)
+    if pipeline == 'auto':
+        return extract_fields_auto(image, save_image_path, scheduled)
+    raise ValueError(f"Unknown pipeline '{pipeline}'")
+
+
+def extract_fields_batch(pipeline, images):
+    # One batched pass over decoded images: a single YOLO predict, or one
+    # nlp.pipe over the OCR text of every image
+    check_deadline()
+    if pipeline == 'yolo':
+        return extract_text_from_yolo_batch(images)
+    if pipeline == 'nlp':
+        return extract_fields_from_images_nlp(images)
+    raise ValueError(f"Pipeline '{pipeline}' has no batched pass")
@@ -0,0 +1,91 @@
+import os
+import contextvars
+
+""" Named speed/accuracy profiles
+
+A profile bundles the knobs that trade latency against accuracy. The
+'balanced' profile is the deployment's own configuration (the YOLO_*,
+NLP_*, NER_* environment variables and their defaults); the others
+override some of those values. Code reads a knob with
+setting(key, default), where default is the module's own constant, so
+anything a profile leaves out keeps its usual value.
+
+Keys:
+    yolo_image_size          YOLO inference size (imgsz)
+    yolo_min_confidence      detection confidence a box needs to be read
+    ocr_decoder              EasyOCR decoder, 'greedy' or 'beamsearch'
+    ocr_beam_width           beams for 'beamsearch'
+    ocr_batch_size           recognizer batch size; 0 reads every crop at once
+    ner_tiers                NER tiers tried for the Name field, in order
+    ner_confidence_threshold confidence that stops the tier cascade
+    nlp_max_side             longest side before full-image OCR; 0 keeps it
+    name_threshold           name similarity needed for a valid card
+    university_threshold     university similarity needed for a valid card
+"""
+
+PROFILES = {
+    # Kiosk traffic: smaller YOLO input, no transformer, smaller OCR input
+    'fast': {
+        "yolo_image_size": 480,
+        "yolo_min_confidence": 0.35,
+        "ocr_decoder": 'greedy',
+        "ocr_batch_size": 0,
+        "ner_tiers": ('rules', 'statistical'),
+        "nlp_max_side": 1024,
+    },
+    'balanced': {},
+    # Back-office review: larger YOLO input, beam search, full resolution,
+    # the transformer confirms every uncertain name, stricter matching
+    'accurate': {
+        "yolo_image_size": 800,
+        "yolo_min_confidence": 0.15,
+        "ocr_decoder": 'beamsearch',
+        "ocr_beam_width": 5,
+        "ocr_batch_size": 8,
+        "ner_tiers": ('rules', 'statistical', 'transformer'),
+        "ner_confidence_threshold": 0.95,
+        "nlp_max_side": 0,
+        "name_threshold": 80,
+        "university_threshold": 80,
+    },
+}
+
+# Deployment default; requests can pick another with X-Profile or ?profile=
+PROFILE = os.environ.get('PROFILE', 'balanced')
+
+if PROFILE not in PROFILES:
+    raise ValueError(f"PROFILE must be one of {', '.join(PROFILES)}, not '{PROFILE}'")
+
+_active = contextvars.ContextVar('profile', default=None)
+
+
+def profile_name():
+    return _active.get() or PROFILE
+
+
+def set_profile(name):
+    if name not in PROFILES:
+        raise ValueError(f"Unknown profile '{name}'")
+    return _active.set(name)
+
+
+def setting(key, default):
+    return PROFILES[profile_name()].get(key, default)
+
+
+class use_profile:
+    # Runs a block under a profile, e.g. on a thread that did not receive
+    # the request's context; None keeps the current one
+    __slots__ = ('name', 'token')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.token = set_profile(self.name) if self.name else None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.token is not None:
+            _active.reset(self.token)
+        return False
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from app.logger import app_logger
+
+""" Content-hash cache for extracted fields (validation is never cached) """
+
+RESULT_CACHE_BACKEND = os.environ.get('RESULT_CACHE_BACKEND', 'memory')
+RESULT_CACHE_PATH = os.environ.get('RESULT_CACHE_PATH', 'cache/results.sqlite3')
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 24 * 3600))
+
+
+def cache_key(data, pipeline, model_version):
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{pipeline}:{model_version}:{digest}"
+
+
+class MemoryCache:
+    # LRU bounded by the serialized size of the stored values
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES, ttl=RESULT_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, expires = entry
+            if expires < time.time():
+                self._evict(key)
+                return None
+            self._entries.move_to_end(key)
+            return json.loads(value)
+
+    def set(self, key, value):
+        value = json.dumps(value)
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (value, size, time.time() + self.ttl)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    def _evict(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+    def stats(self):
+        return {"backend": "memory", "entries": len(self._entries), "bytes": self._size}
+
+
+class DiskCache:
+    # SQLite file, so entries survive restarts and are shared by every
+    # worker process on the host
+    def __init__(self, path=RESULT_CACHE_PATH, max_bytes=RESULT_CACHE_MAX_BYTES, ttl=RESULT_CACHE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, "
+                         "size INTEGER, expires REAL, used REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, expires FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            if row[1] < now:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE results SET used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        value = json.dumps(value)
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                         (key, value, len(key) + len(value), now + self.ttl, now))
+            conn.execute("DELETE FROM results WHERE expires < ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            # Drop least recently used rows until back under the bound
+            for old_key, size in conn.execute("SELECT key, size FROM results ORDER BY used").fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                total -= size
+
+    def stats(self):
+        entries, size = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"backend": "disk", "path": self.path, "entries": entries, "bytes": size}
+
+
+CACHE_BACKENDS = {"memory": MemoryCache, "disk": DiskCache}
+
+
+class ResultCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        # Request threads count concurrently
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            app_logger.error("Result cache read failed: %s", e)
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            app_logger.error("Result cache write failed: %s", e)
+
+    def stats(self):
+        stats = self.backend.stats()
+        with self._lock:
+            stats.update({"hits": self.hits, "misses": self.misses})
+        return stats
+
+
+result_cache = ResultCache(CACHE_BACKENDS[RESULT_CACHE_BACKEND]())
@@ -0,0 +1,222 @@
+import os
+import csv
+import threading
+from collections import Counter
+from app.institution_index import normalize, canonical_university
+from app.similarity import ratio_many
+from app.logger import app_logger
+
+""" Enrollment roster with a blocking index over student names
+
+Instead of scoring a card against every roster row, each name is filed
+under a few blocking keys (phonetic code per token, token pairs, token
+trigrams); a lookup only scores the rows that share keys with the query.
+"""
+
+ROSTER_PATH = os.environ.get('ROSTER_PATH')
+# Rows fully scored per lookup, taken in order of shared blocking keys
+ROSTER_CANDIDATES = int(os.environ.get('ROSTER_CANDIDATES', 50))
+# Blocks bigger than this (e.g. the trigram "ahm") say little about a name
+# and are skipped unless nothing else matches
+ROSTER_MAX_BLOCK = int(os.environ.get('ROSTER_MAX_BLOCK', 2000))
+ROSTER_MATCH_THRESHOLD = float(os.environ.get('ROSTER_MATCH_THRESHOLD', 70))
+# Candidates scoring below this are dropped without finishing their score
+ROSTER_MIN_SCORE = float(os.environ.get('ROSTER_MIN_SCORE', 50))
+
+ID_COLUMNS = ('id', 'student_id', 'studentid', 'roll')
+NAME_COLUMNS = ('name', 'student_name', 'full_name')
+UNIVERSITY_COLUMNS = ('university', 'institution', 'school')
+
+SOUNDEX_CODES = {char: str(code) for code, chars in enumerate(
+    ('aeiouyhw', 'bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r')) for char in chars}
+
+
+def soundex(token):
+    first, codes = token[0], []
+    previous = SOUNDEX_CODES.get(first)
+    for char in token[1:]:
+        code = SOUNDEX_CODES.get(char)
+        if code and code != '0' and code != previous:
+            codes.append(code)
+        # h and w don't separate repeated codes, vowels do
+        if char not in 'hw':
+            previous = code
+    return (first + ''.join(codes) + '000')[:4]
+
+
+def name_tokens(name):
+    return [token for token in normalize(name).split() if token.isalpha()]
+
+
+def blocking_keys(name):
+    tokens = name_tokens(name)
+    keys = {'p:' + soundex(token) for token in tokens}
+    # Token pairs are order-insensitive so "Hasan, Mirza" meets "Mirza Hasan"
+    keys.update('t:' + '|'.join(sorted((a, b)))
+                for i, a in enumerate(tokens) for b in tokens[i + 1:])
+    for token in tokens:
+        padded = f" {token} "
+        keys.update('g:' + padded[i:i + 3] for i in range(len(padded) - 2))
+    return keys
+
+
+def sorted_name(name):
+    return ' '.join(sorted(name_tokens(name)))
+
+
+def _column(fields, candidates):
+    lowered = {field.lower().strip(): field for field in fields}
+    return next((lowered[name] for name in candidates if name in lowered), None)
+
+
+def read_roster_rows(path):
+    # CSV natively; Parquet needs pandas with pyarrow or fastparquet
+    if path.lower().endswith('.parquet'):
+        import pandas as pd
+        return pd.read_parquet(path).astype(str).to_dict('records')
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return list(csv.DictReader(f))
+
+
+class Roster:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.entries = {}
+        self.blocks = {}
+        self._next_id = 1
+        self.source = None
+        # Canonical name per distinct roster university string
+        self._universities = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _canonical(self, university):
+        if not university:
+            return None
+        if university not in self._universities:
+            self._universities[university] = canonical_university(university) or university
+        return self._universities[university]
+
+    def load(self, path):
+        # Indexed aside and swapped in, so a file that fails to load leaves
+        # the current roster in place
+        fresh = Roster()
+        added = fresh.add_many(read_roster_rows(path))
+        with self._lock:
+            self.entries, self.blocks, self._next_id = fresh.entries, fresh.blocks, fresh._next_id
+            self._universities.update(fresh._universities)
+            self.source = path
+        app_logger.info("Loaded roster of %d entries from %s", len(added), path)
+        return len(added)
+
+    def add_many(self, rows):
+        rows = list(rows)
+        if not rows:
+            return []
+        fields = rows[0].keys()
+        id_column = _column(fields, ID_COLUMNS)
+        name_column = _column(fields, NAME_COLUMNS)
+        university_column = _column(fields, UNIVERSITY_COLUMNS)
+        if name_column is None:
+            raise ValueError(f"Roster needs a name column (one of {', '.join(NAME_COLUMNS)})")
+        with self._lock:
+            return [self.add(row.get(name_column, ''),
+                             row.get(university_column) if university_column else None,
+                             row.get(id_column) if id_column else None)
+                    for row in rows]
+
+    def add(self, name, university=None, entry_id=None):
+        # Re-adding an existing id replaces that entry
+        with self._lock:
+            if entry_id in (None, ''):
+                while str(self._next_id) in self.entries:
+                    self._next_id += 1
+                entry_id = str(self._next_id)
+            entry_id = str(entry_id)
+            if entry_id in self.entries:
+                self.remove(entry_id)
+            keys = blocking_keys(name)
+            self.entries[entry_id] = {
+                "id": entry_id,
+                "name": name,
+                "sorted_name": sorted_name(name),
+                "university": university or None,
+                "university_canonical": self._canonical(university),
+                "keys": keys,
+            }
+            for key in keys:
+                self.blocks.setdefault(key, set()).add(entry_id)
+            return entry_id
+
+    def remove(self, entry_id):
+        with self._lock:
+            entry = self.entries.pop(str(entry_id), None)
+            if entry is None:
+                return False
+            for key in entry["keys"]:
+                block = self.blocks.get(key)
+                if block is not None:
+                    block.discard(entry["id"])
+                    if not block:
+                        del self.blocks[key]
+            return True
+
+    def candidates(self, name, limit=ROSTER_CANDIDATES):
+        # Rows sharing the most blocking keys with the query
+        keys = blocking_keys(name)
+        with self._lock:
+            blocks = [self.blocks[key] for key in keys if key in self.blocks]
+            selective = [block for block in blocks if len(block) <= ROSTER_MAX_BLOCK]
+            shared = Counter()
+            for block in selective or blocks:
+                shared.update(block)
+            return [self.entries[entry_id] for entry_id, _ in shared.most_common(limit)]
+
+    def match(self, name, university=None, k=5):
+        if not name:
+            return []
+        university_canonical = canonical_university(university) if university else None
+        university_canonical = university_canonical or university
+        candidates = self.candidates(name)
+        # Same 0-100 scale as the validators, on normalized token-sorted
+        # names, every candidate scored in one call
+        scores = ratio_many(sorted_name(name), [entry["sorted_name"] for entry in candidates],
+                            ROSTER_MIN_SCORE)
+        matches = []
+        for entry, score in zip(candidates, scores):
+            if not score:
+                continue
+            university_match = None
+            if university_canonical and entry["university_canonical"]:
+                university_match = university_canonical.lower() == entry["university_canonical"].lower()
+            matches.append({
+                "id": entry["id"],
+                "name": entry["name"],
+                "university": entry["university"],
+                "name_match": round(float(score), 2),
+                "university_match": university_match,
+            })
+        # A university mismatch ranks below any row from the right university
+        matches.sort(key=lambda m: (m["university_match"] is not False, m["name_match"]), reverse=True)
+        return matches[:k]
+
+    def verify(self, name, university=None, k=5):
+        matches = self.match(name, university, k)
+        best = matches[0] if matches else None
+        verified = bool(best and best["name_match"] >= ROSTER_MATCH_THRESHOLD
+                        and best["university_match"] is not False)
+        return {"on_roster": verified, "best": best, "candidates": matches}
+
+    def stats(self):
+        with self._lock:
+            sizes = [len(block) for block in self.blocks.values()]
+            return {
+                "entries": len(self.entries),
+                "blocks": len(sizes),
+                "largest_block": max(sizes, default=0),
+                "source": self.source,
+            }
+
+
+roster = Roster()
@@ -0,0 +1,102 @@
+import threading
+import queue
+import time
+from concurrent.futures import Future
+from app.logger import app_logger
+
+""" Dynamic micro-batching of concurrent inference requests """
+
+
+class MicroBatcher:
+    # Queues single requests and hands them to batch_fn in groups: a batch is
+    # flushed once it holds max_batch_size items or the oldest item has
+    # waited max_wait_ms. batch_fn takes a list of items and returns a list
+    # of results in the same order.
+
+    def __init__(self, name, batch_fn, max_batch_size=8, max_wait_ms=10):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = {}
+        self._batches = 0
+        self._items = 0
+        self._wait_total = 0.0
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name=f"batcher-{self.name}", daemon=True)
+                self._worker.start()
+
+    def submit(self, item):
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            items = [item for item, _, _ in batch]
+            futures = [future for _, future, _ in batch]
+            self._record(len(batch), sum(started - queued for _, _, queued in batch))
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                app_logger.error("Batch of %d failed in %s, retrying singly: %s", len(items), self.name, e)
+                results = None
+            if results is not None:
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+                continue
+            # Retry one by one so each caller gets its own result or error
+            for item, future in zip(items, futures):
+                try:
+                    future.set_result(self.batch_fn([item])[0])
+                except Exception as e:
+                    future.set_exception(e)
+
+    def _record(self, size, waited):
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._wait_total += waited
+            self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "items": self._items,
+                "mean_batch_size": round(self._items / self._batches, 2) if self._batches else 0,
+                "mean_queue_wait_ms": round(self._wait_total * 1000 / self._items, 3) if self._items else 0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+            }
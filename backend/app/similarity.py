@@ -0,0 +1,114 @@
+import numpy as np
+
+""" String similarity on the 0-100 scale used by the validators
+
+ratio(a, b) is 2 * LCS(a, b) / (len(a) + len(b)) * 100, the normalized
+indel similarity. It is what difflib's ratio() approximates, so the
+70-point thresholds keep their meaning. Scores for one query against many
+candidates are computed together: rapidfuzz when installed, otherwise a
+NumPy kernel that runs the LCS recurrence for every candidate at once.
+"""
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    fuzz = process = None
+
+
+def _codes(texts):
+    # Candidates as a zero-padded matrix of code points, plus their lengths
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int32, count=len(texts))
+    matrix = np.zeros((len(texts), max(int(lengths.max(initial=0)), 1)), dtype=np.int32)
+    for row, text in enumerate(texts):
+        if text:
+            matrix[row, :len(text)] = np.frombuffer(text.encode('utf-32-le'), dtype=np.int32)
+    return matrix, lengths
+
+
+def _lcs_many(query, candidates, lengths, min_lcs):
+    # Row-wise LCS DP over the query, all candidates in parallel. With the
+    # previous row L, the next is the running max of
+    # max(L[j], L[j-1] + match[j]), since LCS rows never decrease along j.
+    # Candidates that can no longer reach min_lcs are dropped as we go.
+    count, width = candidates.shape
+    lcs = np.zeros(count, dtype=np.int32)
+    alive = np.flatnonzero(min_lcs <= np.minimum(lengths, len(query)))
+    rows = np.zeros((len(alive), width + 1), dtype=np.int32)
+    block = candidates[alive]
+    for position, char in enumerate(query):
+        match = block == char
+        step = np.maximum(rows[:, 1:], rows[:, :-1] + match)
+        np.maximum.accumulate(step, axis=1, out=rows[:, 1:])
+        reachable = rows[:, -1] + (len(query) - position - 1) >= min_lcs[alive]
+        if not reachable.all():
+            alive, rows, block = alive[reachable], rows[reachable], block[reachable]
+            if not len(alive):
+                break
+    lcs[alive] = rows[:, -1]
+    return lcs
+
+
+def ratio_many(query, candidates, score_cutoff=0):
+    # One score per candidate; anything under score_cutoff comes back as 0
+    query = query.lower()
+    candidates = [candidate.lower() for candidate in candidates]
+    if not candidates:
+        return np.zeros(0)
+    if process is not None:
+        return process.cdist([query], candidates, scorer=fuzz.ratio,
+                             score_cutoff=score_cutoff)[0].astype(np.float64)
+
+    matrix, lengths = _codes(candidates)
+    totals = lengths + len(query)
+    # Smallest LCS that still reaches the cutoff, for early exit
+    min_lcs = np.ceil(score_cutoff * totals / 200.0 - 1e-9).astype(np.int32)
+    query_codes = np.frombuffer(query.encode('utf-32-le'), dtype=np.int32)
+    lcs = _lcs_many(query_codes, matrix, lengths, min_lcs)
+    scores = np.where(totals > 0, 200.0 * lcs / np.maximum(totals, 1), 100.0)
+    scores[scores < score_cutoff] = 0
+    return scores
+
+
+def ratio(a, b):
+    return round(float(ratio_many(a, [b])[0]), 2)
+
+
+def _token_set_parts(query, candidate):
+    a, b = set(query.lower().split()), set(candidate.lower().split())
+    common = ' '.join(sorted(a & b))
+    only_a = ' '.join(filter(None, (common, ' '.join(sorted(a - b)))))
+    only_b = ' '.join(filter(None, (common, ' '.join(sorted(b - a)))))
+    return common, only_a, only_b
+
+
+def token_set_ratio_many(query, candidates, score_cutoff=0):
+    # Word order and repeated words are ignored, and a name that is a
+    # subset of the other ("Mirza Hasan" in "Mirza Mohibul Hasan") scores
+    # through the shared tokens
+    if not candidates:
+        return np.zeros(0)
+    if process is not None:
+        return process.cdist([query], candidates, scorer=fuzz.token_set_ratio,
+                             score_cutoff=score_cutoff, processor=str.lower)[0].astype(np.float64)
+
+    scores = np.zeros(len(candidates))
+    for index, candidate in enumerate(candidates):
+        common, only_a, only_b = _token_set_parts(query, candidate)
+        if not only_a or not only_b:
+            continue
+        if common and (common == only_a or common == only_b):
+            scores[index] = 100.0
+            continue
+        scores[index] = ratio_many(only_a, [only_b], score_cutoff)[0]
+        if common:
+            scores[index] = max(scores[index], ratio_many(common, [only_a, only_b], score_cutoff).max())
+    scores[scores < score_cutoff] = 0
+    return scores
+
+
+def extract(query, candidates, scorer=ratio_many, limit=5, score_cutoff=0):
+    # Best (index, score) pairs, highest first
+    scores = scorer(query, candidates, score_cutoff)
+    order = np.argsort(-scores, kind='stable')[:limit]
+    return [(int(index), round(float(scores[index]), 2))
+            for index in order if scores[index] > 0 or score_cutoff <= 0]
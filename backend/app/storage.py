@@ -0,0 +1,47 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from app.logger import app_logger
+
+""" Optional background persistence of uploads and annotated images """
+
+SAVE_UPLOADS = os.environ.get('SAVE_UPLOADS', '0') == '1'
+SAVE_ANNOTATED = os.environ.get('SAVE_ANNOTATED', '0') == '1'
+
+# A single writer thread keeps disk I/O off the request path and in order
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='storage')
+
+
+def _write_bytes(path, data):
+    try:
+        with open(path, 'wb') as f:
+            f.write(data)
+        app_logger.info("Image saved to %s", path)
+    except Exception as e:
+        app_logger.error("Failed to save upload %s: %s", path, e)
+
+
+def _write_annotated(path, image, boxes):
+    try:
+        annotated = image.copy()
+        for x1, y1, x2, y2 in boxes:
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.imwrite(path, annotated)
+        app_logger.info("Image saved with bounding boxes at %s", path)
+    except Exception as e:
+        app_logger.error("Failed to save annotated image %s: %s", path, e)
+
+
+def save_upload_async(path, data):
+    if SAVE_UPLOADS:
+        _writer.submit(_write_bytes, path, data)
+
+
+def save_annotated_async(path, image, boxes):
+    if SAVE_ANNOTATED and path:
+        _writer.submit(_write_annotated, path, image, list(boxes))
+
+
+def flush():
+    # Wait for pending writes, e.g. before the process exits
+    _writer.shutdown(wait=True)
@@ -0,0 +1,13 @@
+import os
+
+""" Helpers shared by the server, the offline tools and training """
+
+# Image files picked up from directories, archives and dataset splits
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+
+
+def label_path_for(image_path):
+    # YOLO dataset layout: <split>/images/x.jpg is labelled in <split>/labels/x.txt
+    image_dir = os.path.dirname(image_path)
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.join(os.path.dirname(image_dir), 'labels', stem + '.txt')
@@ -0,0 +1,169 @@
+from datetime import datetime
+from app.metrics import timed
+from app.profiles import setting
+from app.similarity import ratio
+from app.institution_index import canonical_university
+
+""" Validation of extracted fields against the user's input """
+
+
+def compare_universities(university_input, university_extracted, similarity):
+    # When both sides resolve to a known institution the canonical names are
+    # compared, so aliases and OCR noise don't sink the match; otherwise the
+    # raw strings are. Resolution is strict (see INSTITUTION_MATCH_MIN), so
+    # different institutions don't end up with the same canonical name.
+    university_canonical = canonical_university(university_extracted)
+    input_canonical = canonical_university(university_input)
+    if input_canonical and university_canonical:
+        return similarity(input_canonical, university_canonical), university_canonical
+    return similarity(university_input, university_extracted), university_canonical
+
+
+@timed('validation')
+def validate_data__nlp(extracted_fields, name_input, university_input):
+    name_extracted = extracted_fields.get('Name') or "Not Recognised"
+    university_extracted = extracted_fields.get(
+        'University') or "Not Recognised"
+    expiration_extracted = extracted_fields.get(
+        'Expiration') or "Not Recognised"
+
+    name_similarity = (
+        calculate_similarity_nlp(name_input, name_extracted)
+        if name_extracted != "Not Recognised" else "Not Recognised"
+    )
+    university_similarity, university_canonical = (
+        compare_universities(university_input, university_extracted, calculate_similarity_nlp)
+        if university_extracted != "Not Recognised" else ("Not Recognised", None)
+    )
+    expiration_status = check_expiration_nlp(expiration_extracted)
+
+    # Determine if the overall card is valid based on these results
+    results = {
+        "fields": {
+            "Name": name_extracted,
+            "University": university_extracted,
+            "Expiration": expiration_extracted
+        },
+        "name_match": name_similarity,
+        "university_match": university_similarity,
+        "university_canonical": university_canonical,
+        "is_expired": expiration_status,
+        "is_valid_card": determine_overall_validity_nlp({
+            "name_match": name_similarity,
+            "university_match": university_similarity,
+            "is_expired": expiration_status
+        })
+    }
+    # Which extraction tier, and in auto mode which pipeline, resolved each field
+    for key in ('tiers', 'sources', 'confidence'):
+        if extracted_fields.get(key):
+            results[key] = extracted_fields[key]
+    return results
+
+
+def calculate_similarity_nlp(input_text, extracted_text):
+    return ratio(input_text, extracted_text)
+
+
+def check_expiration_nlp(expiration_date_str):
+    if expiration_date_str == "Not Recognised":
+        return True
+    try:
+        expiration_date = datetime.strptime(expiration_date_str, "%m/%d/%Y")
+        return expiration_date < datetime.now()
+    except ValueError:
+        return True  # If the expiration date is invalid or unrecognized, mark as expired
+
+
+def determine_overall_validity_nlp(validation_results):
+    if validation_results['name_match'] == "Not Recognised" or validation_results['university_match'] == "Not Recognised" or validation_results['is_expired']:
+        return False
+
+    name_threshold = setting('name_threshold', 70)
+    university_threshold = setting('university_threshold', 70)
+
+    name_valid = validation_results['name_match'] >= name_threshold
+    university_valid = validation_results['university_match'] >= university_threshold
+    expiration_valid = not validation_results['is_expired']
+
+    return name_valid and university_valid and expiration_valid
+
+
+# YOLO
+
+
+@timed('validation')
+def validate_data_yolo(extracted_fields, name_input, university_input):
+    # Handle null values for extracted fields
+    name_extracted = ' '.join(
+        extracted_fields.get('Name', [])) or "Not Recognised"
+    university_extracted = ' '.join(
+        extracted_fields.get('University', [])) or "Not Recognised"
+    expiration_extracted = ' '.join(
+        extracted_fields.get('Expiration', [])) or "Not Recognised"
+
+    name_similarity = (
+        calculate_similarity_yolo(name_input, name_extracted)
+        if name_extracted != "Not Recognised" else "Not Recognised"
+    )
+    university_similarity, university_canonical = (
+        compare_universities(university_input, university_extracted, calculate_similarity_yolo)
+        if university_extracted != "Not Recognised" else ("Not Recognised", None)
+    )
+    expiration_status = check_expiration_yolo(expiration_extracted)
+
+    # Determine if the overall card is valid based on these results
+    results = {
+        "fields": {
+            "Name": name_extracted,
+            "University": university_extracted,
+            "Expiration": expiration_extracted
+        },
+        "name_match": name_similarity,
+        "university_match": university_similarity,
+        "university_canonical": university_canonical,
+        "is_expired": expiration_status,
+        "is_valid_card": determine_overall_validity_yolo({
+            "name_match": name_similarity,
+            "university_match": university_similarity,
+            "is_expired": expiration_status
+        })
+    }
+    return results
+
+
+def calculate_similarity_yolo(input_text, extracted_text):
+    if input_text and extracted_text != "Not Recognised":
+        return ratio(input_text, extracted_text)
+    return "Not Recognised"
+
+
+def check_expiration_yolo(expiration_date_str):
+    # Mark as expired (True) if expiration is "Not Recognised"
+    if expiration_date_str == "Not Recognised":
+        return True
+    try:
+        expiration_date = datetime.strptime(expiration_date_str, "%m/%d/%Y")
+        return expiration_date < datetime.now()
+    except ValueError:
+        return True  # If the expiration date is invalid or unrecognized, mark as expired
+
+
+def determine_overall_validity_yolo(validation_results):
+    # Mark the card as invalid if any field is "Not Recognised" or expired
+    if validation_results['name_match'] == "Not Recognised" or validation_results['university_match'] == "Not Recognised" or validation_results['is_expired']:
+        return False
+
+    # Define thresholds for name and university matching
+    name_threshold = setting('name_threshold', 70)
+    university_threshold = setting('university_threshold', 70)
+
+    name_valid = validation_results['name_match'] >= name_threshold
+    university_valid = validation_results['university_match'] >= university_threshold
+    expiration_valid = not validation_results['is_expired']
+
+    return name_valid and university_valid and expiration_valid
+
+
+# Auto mode returns NLP-shaped fields (one string per field)
+VALIDATORS = {'nlp': validate_data__nlp, 'yolo': validate_data_yolo, 'auto': validate_data__nlp}
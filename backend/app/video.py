@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import cv2
+import numpy as np
+from app.image_preprocessing import load_image
+from app.ocr_service import recognize_crops
+from app.yolo_service import detect_fields_yolo, crop_detections_yolo, read_crops_yolo, YOLO_CLASSES
+from app.similarity import ratio
+from app.metrics import timed, VIDEO_FRAMES
+from app.admission import check_deadline
+from app.utils import IMAGE_EXTENSIONS
+from app.logger import app_logger
+
+""" Field extraction from a video or a stream of camera frames
+
+Frames go through cheap gates before any model runs: a frame whose
+difference hash is close to the last detected frame adds nothing new, and
+a blurry frame is not worth reading. Frames that pass are detected with
+YOLO, and only sharp, confident crops of fields that are still undecided
+are sent to OCR. Readings vote per field (similar texts count as the same
+vote), and reading stops as soon as every field has FRAME_AGREE agreeing
+frames.
+
+Run from backend/:
+    python -m app.video clip.mp4
+"""
+
+# Frames whose 64-bit difference hash is within this many bits of the last
+# detected frame are skipped as near-duplicates
+FRAME_HASH_DISTANCE = int(os.environ.get('FRAME_HASH_DISTANCE', 6))
+# Variance of the Laplacian, on the frame scaled to FRAME_GATE_SIDE and on
+# each crop; lower means blurrier
+FRAME_MIN_SHARPNESS = float(os.environ.get('FRAME_MIN_SHARPNESS', 40))
+FRAME_MIN_CROP_SHARPNESS = float(os.environ.get('FRAME_MIN_CROP_SHARPNESS', 40))
+FRAME_GATE_SIDE = 640
+# Crops below this detection confidence are not read, and readings below
+# this OCR confidence do not vote
+FRAME_MIN_CONFIDENCE = float(os.environ.get('FRAME_MIN_CONFIDENCE', 0.5))
+FRAME_MIN_OCR = float(os.environ.get('FRAME_MIN_OCR', 0.4))
+# Agreeing frames needed to settle a field, and how similar two readings
+# must be (0-100) to agree
+FRAME_AGREE = int(os.environ.get('FRAME_AGREE', 3))
+FRAME_AGREE_SIMILARITY = float(os.environ.get('FRAME_AGREE_SIMILARITY', 90))
+# Frames read at most before giving up on agreement
+FRAME_MAX = int(os.environ.get('FRAME_MAX', 300))
+
+
+def _gate_image(frame):
+    # Grayscale, scaled down so the gates cost well under a millisecond
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    height, width = gray.shape
+    scale = FRAME_GATE_SIDE / max(height, width)
+    if scale < 1:
+        gray = cv2.resize(gray, (round(width * scale), round(height * scale)),
+                          interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def frame_hash(gray):
+    # Difference hash: is each pixel of a 9x8 thumbnail brighter than its
+    # left neighbour. Robust to small exposure changes and sensor noise.
+    thumbnail = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return (thumbnail[:, 1:] > thumbnail[:, :-1]).reshape(-1)
+
+
+def hash_distance(a, b):
+    return int(np.count_nonzero(a != b))
+
+
+def sharpness(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+class FieldVotes:
+    # Readings of one field, grouped with the first reading they are
+    # similar to; the largest group wins
+    def __init__(self):
+        self.groups = []
+
+    def add(self, text, confidence):
+        for group in self.groups:
+            if ratio(group[0][0], text) >= FRAME_AGREE_SIMILARITY:
+                group.append((text, confidence))
+                return len(group)
+        self.groups.append([(text, confidence)])
+        return 1
+
+    def best(self):
+        # The most confident reading of the winning group, and its votes
+        if not self.groups:
+            return None, 0
+        group = max(self.groups, key=lambda g: (len(g), sum(conf for _, conf in g)))
+        return max(group, key=lambda reading: reading[1])[0], len(group)
+
+
+class FrameVerifier:
+    # Feed frames in capture order with add(); returns True once every
+    # field has agreed across `agree` frames
+
+    def __init__(self, agree=FRAME_AGREE, max_frames=FRAME_MAX):
+        self.agree = agree
+        self.max_frames = max_frames
+        self.votes = {field: FieldVotes() for field in YOLO_CLASSES.values()}
+        self.stats = {"frames": 0, "duplicate": 0, "blurry": 0, "detected": 0, "ocr_crops": 0}
+        self._last_hash = None
+
+    def settled(self, field):
+        return self.votes[field].best()[1] >= self.agree
+
+    def done(self):
+        return all(self.settled(field) for field in self.votes) or self.stats["frames"] >= self.max_frames
+
+    @timed('video_gate')
+    def _passes_gates(self, frame):
+        gray = _gate_image(frame)
+        signature = frame_hash(gray)
+        if self._last_hash is not None and hash_distance(signature, self._last_hash) <= FRAME_HASH_DISTANCE:
+            return 'duplicate'
+        if sharpness(gray) < FRAME_MIN_SHARPNESS:
+            return 'blurry'
+        self._last_hash = signature
+        return 'detected'
+
+    def add(self, frame):
+        frame = load_image(frame)
+        self.stats["frames"] += 1
+        outcome = self._passes_gates(frame)
+        VIDEO_FRAMES.inc(outcome=outcome)
+        self.stats[outcome] += 1
+        if outcome != 'detected':
+            return self.done()
+
+        check_deadline()
+        result = detect_fields_yolo([frame])[0]
+        crops = [crop for crop in crop_detections_yolo(frame, result)
+                 if not self.settled(crop[0]) and crop[3] >= FRAME_MIN_CONFIDENCE
+                 and crop[1].size and sharpness(crop[1]) >= FRAME_MIN_CROP_SHARPNESS]
+        if crops:
+            self.stats["ocr_crops"] += len(crops)
+            readings = read_crops_yolo(crops, recognize_crops([crop for _, crop, _, _ in crops]))
+            # Multi-line fields (YOLO_TOP_K > 1) vote with their joined text
+            joined = {}
+            for reading in readings:
+                if reading["ocr"] >= FRAME_MIN_OCR:
+                    text, confidence = joined.get(reading["field"], ('', 1.0))
+                    joined[reading["field"]] = (
+                        ' '.join(filter(None, (text, reading["text"]))),
+                        min(confidence, reading["detection"], reading["ocr"]))
+            for field, (text, confidence) in joined.items():
+                self.votes[field].add(text, confidence)
+        return self.done()
+
+    def fields(self):
+        # Same shape as extract_text_from_yolo, so validate_data_yolo applies
+        return {field: [text] if text else [] for field, (text, _) in
+                ((field, votes.best()) for field, votes in self.votes.items())}
+
+    def summary(self):
+        return dict(self.stats,
+                    votes={field: votes.best()[1] for field, votes in self.votes.items()},
+                    agreed=all(self.settled(field) for field in self.votes))
+
+
+def extract_fields_from_frames(frames, agree=FRAME_AGREE, max_frames=FRAME_MAX):
+    # frames: any iterable of decoded frames or image paths. Stops pulling
+    # frames once the fields agree. Returns (fields, summary).
+    verifier = FrameVerifier(agree, max_frames)
+    try:
+        for frame in frames:
+            if verifier.add(frame):
+                break
+    finally:
+        if hasattr(frames, 'close'):
+            frames.close()
+    summary = verifier.summary()
+    app_logger.info("Detected on %d of %d frames (%d duplicate, %d blurry), %d OCR crops, agreed=%s",
+                    summary["detected"], summary["frames"], summary["duplicate"],
+                    summary["blurry"], summary["ocr_crops"], summary["agreed"])
+    return verifier.fields(), summary
+
+
+def read_video_frames(path):
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video {path}")
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            yield frame
+    finally:
+        capture.release()
+
+
+def extract_fields_from_video(path, agree=FRAME_AGREE, max_frames=FRAME_MAX):
+    return extract_fields_from_frames(read_video_frames(path), agree, max_frames)
+
+
+def extract_fields_from_video_bytes(data, agree=FRAME_AGREE, max_frames=FRAME_MAX):
+    # OpenCV only reads videos from a file; the container is probed from
+    # its content, so the name needs no extension
+    handle, path = tempfile.mkstemp(prefix='video_')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(data)
+        return extract_fields_from_video(path, agree, max_frames)
+    finally:
+        os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Field extraction from a video or a stream of camera frames')
+    parser.add_argument('video', help='video file, or a directory of frame images')
+    parser.add_argument('--agree', type=int, default=FRAME_AGREE)
+    parser.add_argument('--max-frames', type=int, default=FRAME_MAX)
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.video):
+        frames = (os.path.join(args.video, name) for name in sorted(os.listdir(args.video))
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+        fields, summary = extract_fields_from_frames(frames, args.agree, args.max_frames)
+    else:
+        fields, summary = extract_fields_from_video(args.video, args.agree, args.max_frames)
+    print(json.dumps({"fields": fields, "frames": summary}, indent=2))
+    return 0 if summary["agreed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
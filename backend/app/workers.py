@@ -0,0 +1,340 @@
+import os
+import time
+import queue
+import signal
+import itertools
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import Future
+from app.logger import app_logger
+from app.metrics import metrics, begin_request, end_request, current_timings
+from app.admission import DeadlineExceeded, current_deadline, set_deadline_at
+from app.profiles import profile_name, use_profile
+
+""" Pre-forked worker processes, each holding its own loaded models """
+
+WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', 0))
+# Intra-op threads per worker; 0 splits the available cores evenly
+WORKER_THREADS = int(os.environ.get('WORKER_THREADS', 0))
+WORKER_PIN_CPUS = os.environ.get('WORKER_PIN_CPUS', '1') == '1'
+WORKER_DRAIN_TIMEOUT = float(os.environ.get('WORKER_DRAIN_TIMEOUT', 30))
+
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+
+class PoolClosed(Exception):
+    pass
+
+
+class WorkerError(Exception):
+    pass
+
+
+def _limit_threads(threads, cpus):
+    # Must run before torch is imported, or its thread pool is already sized
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+
+def _read_shared(shm_name, size, read):
+    # The front process owns the block and unlinks it. Workers share its
+    # resource tracker, so attaching here registers nothing new.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        view = shm.buf[:size]
+        try:
+            return read(view)
+        finally:
+            view.release()
+    finally:
+        shm.close()
+
+
+def _read_shared_image(shm_name, size):
+    from app.image_preprocessing import decode_image_bytes
+    return _read_shared(shm_name, size, decode_image_bytes)
+
+
+def _read_shared_images(shm_name, sizes):
+    # Uploads laid end to end in one block; each entry is the decoded image
+    # or the message of one that did not decode
+    from app.image_preprocessing import decode_image_bytes
+
+    def read(view):
+        images, start = [], 0
+        for size in sizes:
+            try:
+                images.append(decode_image_bytes(view[start:start + size]))
+            except Exception as e:
+                images.append(str(e))
+            start += size
+        return images
+    return _read_shared(shm_name, sum(sizes), read)
+
+
+def _extract_batch(pipeline, images):
+    # One (error, fields) pair per image. Should the batched pass fail, each
+    # image is retried alone so a bad one only fails itself.
+    from app.pipelines import extract_fields, extract_fields_batch
+
+    decoded = [image for image in images if not isinstance(image, str)]
+    extracted = []
+    try:
+        if decoded:
+            extracted = [(None, fields) for fields in extract_fields_batch(pipeline, decoded)]
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        app_logger.error("Batch inference failed, retrying per image: %s", e)
+        for image in decoded:
+            try:
+                extracted.append((None, extract_fields(pipeline, image, scheduled=False)))
+            except DeadlineExceeded:
+                raise
+            except Exception as item_error:
+                extracted.append((str(item_error), None))
+    extracted = iter(extracted)
+    return [(image, None) if isinstance(image, str) else next(extracted) for image in images]
+
+
+def _worker_main(index, inbox, outbox, threads, cpus):
+    _limit_threads(threads, cpus)
+    # Shutdown is driven by the front process, not by terminal signals
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import torch
+    torch.set_num_threads(threads)
+    from app.model_registry import registry
+    from app.pipelines import extract_fields, boot_models
+
+    registry.preload(boot_models())
+    # Every message carries the metrics recorded since the last one, and
+    # task results their stage timings, since only the front process
+    # serves /metrics and Server-Timing
+    outbox.put(('ready', index, None, os.getpid(), ([], metrics.drain())))
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        kind, task_id = message[0], message[1]
+        begin_request()
+        try:
+            if kind == 'reload':
+                _, _, name, source = message
+                result = registry.reload(name, source)
+            elif kind == 'batch':
+                _, _, pipeline, shm_name, sizes, deadline, profile = message
+                set_deadline_at(deadline)
+                with use_profile(profile):
+                    result = _extract_batch(pipeline, _read_shared_images(shm_name, sizes))
+            else:
+                _, _, pipeline, shm_name, size, save_image_path, deadline, profile = message
+                # The request's deadline, so a task that waited too long in
+                # the inbox is dropped before OCR
+                set_deadline_at(deadline)
+                with use_profile(profile):
+                    if pipeline == 'video':
+                        from app.video import extract_fields_from_video_bytes
+                        result = extract_fields_from_video_bytes(_read_shared(shm_name, size, bytes))
+                    else:
+                        image = _read_shared_image(shm_name, size)
+                        result = extract_fields(
+                            pipeline, image, save_image_path, scheduled=False)
+            kind, payload = 'done', result
+        except DeadlineExceeded as e:
+            kind, payload = 'deadline', str(e)
+        except Exception as e:
+            kind, payload = 'error', str(e)
+        outbox.put((kind, index, task_id, payload, (end_request(), metrics.drain())))
+    outbox.put(('stopped', index, None, None, ([], metrics.drain())))
+
+
+class WorkerPool:
+    # Requests are dispatched to the least busy worker. The upload bytes go
+    # through a shared memory block; only its name crosses the queue.
+
+    def __init__(self, processes, threads=0, pin_cpus=True):
+        methods = mp.get_all_start_methods()
+        self._ctx = mp.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self._outbox = self._ctx.Queue()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._ids = itertools.count()
+        self._pending = {}
+        self._closed = False
+
+        if hasattr(os, 'sched_getaffinity'):
+            cpu_ids = sorted(os.sched_getaffinity(0))
+        else:
+            cpu_ids = list(range(os.cpu_count() or 1))
+        per_worker = max(1, len(cpu_ids) // processes)
+        self._threads = threads or per_worker
+        self._workers = []
+        for index in range(processes):
+            cpus = None
+            if pin_cpus and len(cpu_ids) >= processes:
+                cpus = cpu_ids[index * per_worker:(index + 1) * per_worker]
+            self._workers.append({"cpus": cpus, "inflight": 0, "ready": False})
+            self._spawn(index)
+
+        self._collector = threading.Thread(
+            target=self._collect, name='worker-results', daemon=True)
+        self._collector.start()
+        app_logger.info(
+            "Started %d workers with %d threads each", processes, self._threads)
+
+    def _spawn(self, index):
+        worker = self._workers[index]
+        worker["inbox"] = self._ctx.Queue()
+        worker["ready"] = False
+        worker["process"] = self._ctx.Process(
+            target=_worker_main, name=f"worker-{index}", daemon=True,
+            args=(index, worker["inbox"], self._outbox, self._threads, worker["cpus"]))
+        worker["process"].start()
+
+    def _dispatch(self, message_for, shm=None, index=None):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise PoolClosed("Worker pool is shutting down")
+            if index is None:
+                index = min(range(len(self._workers)),
+                            key=lambda i: self._workers[i]["inflight"])
+            task_id = next(self._ids)
+            self._pending[task_id] = (future, index, shm, current_timings())
+            self._workers[index]["inflight"] += 1
+            self._workers[index]["inbox"].put(message_for(task_id))
+        return future
+
+    def submit(self, pipeline, data, save_image_path=None):
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        shm.buf[:len(data)] = data
+        try:
+            return self._dispatch(
+                lambda task_id: ('task', task_id, pipeline, shm.name, len(data), save_image_path,
+                                 current_deadline(), profile_name()),
+                shm=shm)
+        except Exception:
+            self._release(shm)
+            raise
+
+    def submit_batch(self, pipeline, datas):
+        # Several uploads as one task, which the worker runs through one
+        # batched pass; the result has an (error, fields) pair per upload
+        sizes = [len(data) for data in datas]
+        shm = shared_memory.SharedMemory(create=True, size=max(1, sum(sizes)))
+        try:
+            start = 0
+            for data in datas:
+                shm.buf[start:start + len(data)] = data
+                start += len(data)
+            return self._dispatch(
+                lambda task_id: ('batch', task_id, pipeline, shm.name, sizes,
+                                 current_deadline(), profile_name()),
+                shm=shm)
+        except Exception:
+            self._release(shm)
+            raise
+
+    def run(self, pipeline, data, save_image_path=None, timeout=None):
+        return self.submit(pipeline, data, save_image_path).result(timeout=timeout)
+
+    def reload(self, name, source=None):
+        # Hot-swap in every worker; each keeps serving until its swap is done
+        futures = [self._dispatch(lambda task_id: ('reload', task_id, name, source), index=index)
+                   for index in range(len(self._workers))]
+        return [future.result() for future in futures]
+
+    def _release(self, shm):
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    def _collect(self):
+        while True:
+            try:
+                kind, index, task_id, payload, (timings, drained) = self._outbox.get(timeout=1)
+            except queue.Empty:
+                self._reap()
+                continue
+            metrics.merge(drained)
+            if kind == 'ready':
+                with self._lock:
+                    self._workers[index]["ready"] = True
+                app_logger.info("Worker %d (pid %s) ready", index, payload)
+                continue
+            if kind == 'stopped':
+                continue
+            with self._lock:
+                future, _, shm, request_timings = self._pending.pop(task_id)
+                self._workers[index]["inflight"] -= 1
+                self._idle.notify_all()
+            self._release(shm)
+            if request_timings is not None:
+                request_timings.extend(timings)
+            if kind == 'done':
+                future.set_result(payload)
+            elif kind == 'deadline':
+                future.set_exception(DeadlineExceeded(payload))
+            else:
+                future.set_exception(WorkerError(payload))
+
+    def _reap(self):
+        # Fail the requests of a crashed worker and start a replacement
+        with self._lock:
+            for index, worker in enumerate(self._workers):
+                if worker["process"].is_alive() or self._closed:
+                    continue
+                app_logger.error(
+                    "Worker %d exited with code %s, restarting", index, worker['process'].exitcode)
+                for task_id, (future, owner, shm, _) in list(self._pending.items()):
+                    if owner == index:
+                        del self._pending[task_id]
+                        self._release(shm)
+                        future.set_exception(WorkerError(f"Worker {index} crashed"))
+                worker["inflight"] = 0
+                self._spawn(index)
+            self._idle.notify_all()
+
+    def ready(self):
+        with self._lock:
+            return all(worker["ready"] for worker in self._workers)
+
+    def stats(self):
+        with self._lock:
+            return [{"pid": worker["process"].pid, "ready": worker["ready"],
+                     "inflight": worker["inflight"], "cpus": worker["cpus"]}
+                    for worker in self._workers]
+
+    def shutdown(self, timeout=WORKER_DRAIN_TIMEOUT):
+        # Graceful drain: refuse new work, let in-flight requests finish,
+        # then stop the workers
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._closed = True
+            while self._pending and time.monotonic() < deadline:
+                self._idle.wait(timeout=deadline - time.monotonic())
+            for worker in self._workers:
+                worker["inbox"].put(None)
+        for worker in self._workers:
+            worker["process"].join(max(0, deadline - time.monotonic()))
+            if worker["process"].is_alive():
+                worker["process"].terminate()
+        with self._lock:
+            for future, _, shm, _ in self._pending.values():
+                self._release(shm)
+                future.set_exception(PoolClosed("Worker pool shut down"))
+            self._pending.clear()
+        app_logger.info("Worker pool drained and stopped")
+
+
+worker_pool = None
+
+
+def start_worker_pool(processes=WORKER_PROCESSES, threads=WORKER_THREADS, pin_cpus=WORKER_PIN_CPUS):
+    global worker_pool
+    if worker_pool is None and processes > 0:
+        worker_pool = WorkerPool(processes, threads, pin_cpus)
+    return worker_pool
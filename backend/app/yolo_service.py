@@ -1,13 +1,213 @@
-import cv2
-from ultralytics import YOLO
+import os
+import re
+import numpy as np
+from app.image_preprocessing import load_image
+from app.ocr_service import recognize_crops
+from app.model_registry import registry
+from app.storage import save_annotated_async
+from app.scheduler import MicroBatcher
+from app.metrics import timed, span, OCR_CROPS_SKIPPED
+from app.inference_backend import YOLO_IMAGE_SIZE
+from app.profiles import setting, profile_name, use_profile
 
+""" YOLO + OCR field extraction """
 
-def extract_text_from_yolo(image_path, model_path):
-    # Ensure model_path is correctly formatted
-    # Use raw string or double slashes
-    model = YOLO(
-        r'I:\\ML Projects\\Brain House\\ID Verification\\backend\\models\\modelv1.pt')
-    results = model.predict(image_path)
+# Class ids as trained in data/data.yaml
+YOLO_CLASSES = {0: "Expiration", 1: "Name", 2: "University"}
 
-    # Assuming you want the pandas format for easier manipulation
-    return results.pandas().xyxy[0]
+YOLO_MAX_BATCH_SIZE = int(os.environ.get('YOLO_MAX_BATCH_SIZE', 8))
+YOLO_MAX_WAIT_MS = float(os.environ.get('YOLO_MAX_WAIT_MS', 10))
+
+# Box selection between detection and OCR: each field is read from its best
+# box (or top-k boxes for fields that span several lines)
+YOLO_MIN_CONFIDENCE = float(os.environ.get('YOLO_MIN_CONFIDENCE', 0.25))
+# Floor applied by predict itself; kept below every profile's threshold so
+# the selection stage applies the profile's own
+YOLO_PREDICT_CONFIDENCE = float(os.environ.get('YOLO_PREDICT_CONFIDENCE', 0.05))
+# ultralytics' default predict threshold: the original pipeline read every
+# box above it, so only weak boxes above it are OCR calls saved
+YOLO_BASELINE_CONFIDENCE = 0.25
+YOLO_MIN_BOX_SIZE = int(os.environ.get('YOLO_MIN_BOX_SIZE', 8))
+YOLO_DUPLICATE_IOU = float(os.environ.get('YOLO_DUPLICATE_IOU', 0.5))
+YOLO_TOP_K = int(os.environ.get('YOLO_TOP_K', 1))
+# Padding around each crop, as a fraction of the box height
+YOLO_CROP_PAD = float(os.environ.get('YOLO_CROP_PAD', 0.1))
+
+
+def remove_special_characters_yolo(text):
+    return re.sub(r'[^A-Za-z0-9\s/]', '', text)
+
+
+# Function to correct common OCR mistakes
+def correct_ocr_mistakes_yolo(text):
+    corrections = {'0': 'O', '1': 'I', '5': 'S'}
+    for incorrect, correct in corrections.items():
+        text = text.replace(incorrect, correct)
+    return text
+
+
+# Function to clean date formats
+def clean_date_format_yolo(text):
+    return re.sub(r'(\d{1,2})/(\d{1,2})/(\d{4})', lambda m: f'{int(m.group(1)):02}/{int(m.group(2)):02}/{m.group(3)}', text)
+
+
+# Function to clean OCR text (combining all steps)
+def clean_ocr_text_yolo(text, field=None):
+    text = remove_special_characters_yolo(text)
+    # Dates are digits; the letter corrections would turn 2026 into 2O26
+    if field != 'Expiration':
+        text = correct_ocr_mistakes_yolo(text)
+    text = clean_date_format_yolo(text)
+    return text
+
+
+@timed('yolo_predict')
+def detect_fields_yolo(images):
+    # One predict call for the whole list; ultralytics batches the arrays
+    with registry.use('yolo') as model:
+        return model.predict(source=list(images), imgsz=setting('yolo_image_size', YOLO_IMAGE_SIZE),
+                             conf=YOLO_PREDICT_CONFIDENCE, save=False, verbose=False)
+
+
+def _iou_one_to_many(box, boxes):
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union = (box[2] - box[0]) * (box[3] - box[1]) + areas - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def select_boxes_yolo(xyxy, classes, confidences, image_shape):
+    # Drop weak, tiny and overlapping boxes, keep the top-k per class, and
+    # pad and clamp what is left to the image. Returns
+    # [(class_name, (x1, y1, x2, y2), confidence)] in reading order per class.
+    height, width = image_shape[:2]
+    xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+    classes = np.asarray(classes).astype(int).reshape(-1)
+    confidences = np.asarray(confidences, dtype=np.float32).reshape(-1)
+    sizes = np.minimum(xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1])
+
+    weak = confidences < setting('yolo_min_confidence', YOLO_MIN_CONFIDENCE)
+    small = ~weak & (sizes < YOLO_MIN_BOX_SIZE)
+    OCR_CROPS_SKIPPED.inc(int((weak & (confidences >= YOLO_BASELINE_CONFIDENCE)).sum()), reason='low_confidence')
+    OCR_CROPS_SKIPPED.inc(int(small.sum()), reason='too_small')
+    candidates = ~weak & ~small & np.isin(classes, list(YOLO_CLASSES))
+
+    selected = []
+    for class_id in np.unique(classes[candidates]):
+        indices = np.flatnonzero(candidates & (classes == class_id))
+        indices = indices[np.argsort(-confidences[indices], kind='stable')]
+        # Per-class suppression: a box overlapping a better one of the same
+        # class is a duplicate read of the same text
+        kept = []
+        while len(indices):
+            best, indices = indices[0], indices[1:]
+            kept.append(best)
+            duplicates = _iou_one_to_many(xyxy[best], xyxy[indices]) >= YOLO_DUPLICATE_IOU
+            OCR_CROPS_SKIPPED.inc(int(duplicates.sum()), reason='duplicate')
+            indices = indices[~duplicates]
+        OCR_CROPS_SKIPPED.inc(max(0, len(kept) - YOLO_TOP_K), reason='top_k')
+        kept = sorted(kept[:YOLO_TOP_K], key=lambda i: (xyxy[i][1], xyxy[i][0]))
+
+        for index in kept:
+            x1, y1, x2, y2 = xyxy[index]
+            pad = YOLO_CROP_PAD * (y2 - y1)
+            box = (max(0, int(x1 - pad)), max(0, int(y1 - pad)),
+                   min(width, int(np.ceil(x2 + pad))), min(height, int(np.ceil(y2 + pad))))
+            selected.append((YOLO_CLASSES[int(class_id)], box, float(confidences[index])))
+    return selected
+
+
+def crop_detections_yolo(image, result):
+    # Crop the selected regions, keeping class, box and confidence
+    boxes = result.boxes.cpu().numpy()
+    return [(class_name, image[y1:y2, x1:x2], (x1, y1, x2, y2), confidence)
+            for class_name, (x1, y1, x2, y2), confidence
+            in select_boxes_yolo(boxes.xyxy, boxes.cls, boxes.conf, image.shape)]
+
+
+def read_crops_yolo(crops, recognized):
+    # One reading per recognized crop: cleaned text plus the detection and
+    # OCR confidences behind it
+    readings = []
+    for (class_name, _, _, detection), (text, ocr) in zip(crops, recognized):
+        if text:
+            readings.append({"field": class_name, "text": clean_ocr_text_yolo(text, class_name),
+                             "detection": detection, "ocr": ocr})
+    return readings
+
+
+def fields_from_readings_yolo(readings):
+    # Dictionary to store cleaned texts class-wise
+    detected_text = {name: [] for name in YOLO_CLASSES.values()}
+    for reading in readings:
+        detected_text[reading["field"]].append(reading["text"])
+    return detected_text
+
+
+def assemble_fields_yolo(crops, recognized):
+    return fields_from_readings_yolo(read_crops_yolo(crops, recognized))
+
+
+# Crop regions detected by YOLO for many images, OCR every crop in one
+# batched recognizer pass, and clean text
+def read_fields_yolo_batch(images, save_image_paths=None):
+    images = [load_image(image) for image in images]
+    save_image_paths = save_image_paths or [None] * len(images)
+    results = detect_fields_yolo(images)
+
+    # Gather every crop of every image so they share a single OCR pass
+    per_image_crops = [crop_detections_yolo(image, result)
+                       for image, result in zip(images, results)]
+    all_crops = [crop for crops in per_image_crops for _, crop, _, _ in crops]
+    recognized = iter(recognize_crops(all_crops))
+
+    readings = []
+    for image, crops, save_image_path in zip(images, per_image_crops, save_image_paths):
+        readings.append(read_crops_yolo(crops, [next(recognized) for _ in crops]))
+
+        # Save the image with bounding boxes off the request path, if enabled
+        save_annotated_async(save_image_path, image, [box for _, _, box, _ in crops])
+    return readings
+
+
+def extract_text_from_yolo_batch(images, save_image_paths=None):
+    return [fields_from_readings_yolo(readings)
+            for readings in read_fields_yolo_batch(images, save_image_paths)]
+
+
+def extract_text_from_yolo(image, save_image_path=None):
+    return extract_text_from_yolo_batch([image], [save_image_path])[0]
+
+
+def _run_yolo_requests(requests):
+    # The batcher thread has no request context; requests under different
+    # profiles need different model inputs, so each profile is one batch
+    results = [None] * len(requests)
+    for profile in dict.fromkeys(profile for _, _, profile in requests):
+        indices = [i for i, request in enumerate(requests) if request[2] == profile]
+        with use_profile(profile):
+            readings = read_fields_yolo_batch([requests[i][0] for i in indices],
+                                              [requests[i][1] for i in indices])
+        for index, reading in zip(indices, readings):
+            results[index] = reading
+    return results
+
+
+# Concurrent single-image requests share one detection + OCR forward pass
+yolo_batcher = MicroBatcher('yolo', _run_yolo_requests,
+                            max_batch_size=YOLO_MAX_BATCH_SIZE,
+                            max_wait_ms=YOLO_MAX_WAIT_MS)
+
+
+def read_fields_yolo_scheduled(image, save_image_path=None):
+    # Covers queueing plus the shared batch, as seen by this request
+    with span('yolo_scheduled'):
+        return yolo_batcher((load_image(image), save_image_path, profile_name()))
+
+
+def extract_text_from_yolo_scheduled(image, save_image_path=None):
+    return fields_from_readings_yolo(read_fields_yolo_scheduled(image, save_image_path))
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# Tests import the backend as the server does (from backend/), with logs
+# and the institution index kept out of the working tree
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_scratch = tempfile.mkdtemp(prefix='idcard-tests-')
+os.environ.setdefault('LOG_DIR', os.path.join(_scratch, 'logs'))
+os.environ.setdefault('INSTITUTIONS_PATH', os.path.join(BACKEND_DIR, 'data', 'gazetteer', 'institutions.txt'))
+os.environ.setdefault('INSTITUTION_INDEX_DIR', os.path.join(_scratch, 'institutions'))
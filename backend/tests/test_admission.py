@@ -0,0 +1,96 @@
+import time
+import threading
+import pytest
+from app.admission import (AdmissionLimiter, DeadlineExceeded, Overloaded, build_limiters,
+                           set_deadline, set_deadline_at)
+
+
+@pytest.fixture(autouse=True)
+def no_deadline():
+    set_deadline(None)
+    yield
+    set_deadline(None)
+
+
+def test_full_queue_is_rejected_with_429():
+    limiter = AdmissionLimiter('test', max_inflight=2, max_queue=0, max_wait=10)
+    limiter._service_time = 3.0
+    limiter.acquire()
+    limiter.acquire()
+    started = time.monotonic()
+    with pytest.raises(Overloaded) as error:
+        limiter.acquire()
+    # Turned away at once, not after max_wait
+    assert time.monotonic() - started < 1
+    assert error.value.status == 429
+    # Two in flight at 3 s each over two slots
+    assert error.value.retry_after == 3
+
+
+def test_wait_timeout_is_rejected_with_503():
+    limiter = AdmissionLimiter('test', max_inflight=1, max_queue=1, max_wait=0.05)
+    limiter.acquire()
+    started = time.monotonic()
+    with pytest.raises(Overloaded) as error:
+        limiter.acquire()
+    assert time.monotonic() - started >= 0.05
+    assert error.value.status == 503
+    assert error.value.retry_after == 1
+    assert limiter.stats()["waiting"] == 0
+
+
+def test_retry_after_is_capped():
+    limiter = AdmissionLimiter('test', max_inflight=1, max_queue=0)
+    limiter._service_time = 1000.0
+    limiter.acquire()
+    with pytest.raises(Overloaded) as error:
+        limiter.acquire()
+    assert error.value.retry_after == 60
+
+
+def test_queued_request_is_admitted_when_a_slot_frees():
+    limiter = AdmissionLimiter('test', max_inflight=1, max_queue=1, max_wait=5)
+    admitted_at = limiter.acquire()
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+    waiter.start()
+    while limiter.stats()["waiting"] == 0:
+        time.sleep(0.001)
+    limiter.release(admitted_at)
+    waiter.join(timeout=5)
+    assert len(results) == 1
+    assert limiter.stats()["inflight"] == 1
+
+
+def test_deadline_while_queued_raises_deadline_exceeded():
+    limiter = AdmissionLimiter('test', max_inflight=1, max_queue=1, max_wait=10)
+    limiter.acquire()
+    set_deadline(0.05)
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire()
+    # Gave up at the deadline rather than waiting out max_wait
+    assert time.monotonic() - started < 1
+
+
+def test_expired_deadline_gives_the_slot_back():
+    limiter = AdmissionLimiter('test', max_inflight=1, max_queue=0)
+    set_deadline_at(time.monotonic() - 1)
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire()
+    assert limiter.stats()["inflight"] == 0
+
+
+def test_admit_releases_on_error():
+    limiter = AdmissionLimiter('test', max_inflight=1, max_queue=0)
+    with pytest.raises(RuntimeError):
+        with limiter.admit():
+            raise RuntimeError("pipeline failed")
+    assert limiter.stats()["inflight"] == 0
+
+
+def test_build_limiters_overrides_and_scales():
+    limiters = build_limiters('nlp=3/5, yolo=4, custom=2/1', scale=2)
+    assert (limiters['nlp'].max_inflight, limiters['nlp'].max_queue) == (6, 10)
+    assert (limiters['yolo'].max_inflight, limiters['yolo'].max_queue) == (8, 64)
+    assert (limiters['custom'].max_inflight, limiters['custom'].max_queue) == (4, 2)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from app.image_preprocessing import downscale_image, preprocess_image_nlp, to_original_coordinates
+
+# A light card on a dark desk, with a red marker square in one corner of it
+CARD = (400, 300, 1600, 1100)
+MARKER = (1450, 950, 1500, 1000)
+
+
+def photo(height=1400, width=2000):
+    image = np.full((height, width, 3), 30, np.uint8)
+    x1, y1, x2, y2 = CARD
+    image[y1:y2, x1:x2] = 220
+    x1, y1, x2, y2 = MARKER
+    image[y1:y2, x1:x2] = (0, 0, 255)
+    return image
+
+
+def marker_corners(image):
+    # Top-left and bottom-right pixel corners of the red square
+    ys, xs = np.nonzero((image[:, :, 2] > 150) & (image[:, :, 1] < 100))
+    return [[xs.min(), ys.min()], [xs.max() + 1, ys.max() + 1]]
+
+
+def test_downscale_keeps_small_images():
+    image = photo(400, 600)
+    resized, scale = downscale_image(image, 1000)
+    assert resized is image and scale == 1.0
+    assert downscale_image(image, 0)[1] == 1.0
+
+
+def test_downscale_limits_the_longest_side():
+    resized, scale = downscale_image(photo(), 1000)
+    assert scale == 0.5
+    assert resized.shape == (700, 1000, 3)
+
+
+@pytest.mark.parametrize('max_side, card_crop', [(0, False), (1000, False), (0, True), (1000, True)])
+def test_coordinates_round_trip_to_the_upload(max_side, card_crop):
+    image, transform = preprocess_image_nlp(photo(), max_side=max_side, card_crop=card_crop)
+    if card_crop:
+        assert transform["offset"] != (0, 0)
+    points = to_original_coordinates(marker_corners(image), transform)
+    x1, y1, x2, y2 = MARKER
+    # Within a pixel of the downscaled grid
+    tolerance = 1 / transform["scale"] + 1
+    assert points == [[pytest.approx(x1, abs=tolerance), pytest.approx(y1, abs=tolerance)],
+                      [pytest.approx(x2, abs=tolerance), pytest.approx(y2, abs=tolerance)]]
@@ -0,0 +1,64 @@
+import pytest
+from app.institution_index import InstitutionIndex, build_index, normalize
+from app.similarity import ratio
+from app.validation import validate_data_yolo
+
+
+@pytest.fixture
+def index(tmp_path):
+    source = tmp_path / 'institutions.txt'
+    source.write_text('University of Dhaka | Dhaka University\n'
+                      'University of Michigan\n'
+                      'United International University\n'
+                      'Daffodil International University\n'
+                      'Stanford University\n', encoding='utf-8')
+    build_index(str(source), str(tmp_path / 'index'))
+    return InstitutionIndex(str(tmp_path / 'index'))
+
+
+def card(university):
+    return {'Name': ['John Doe'], 'University': [university], 'Expiration': ['12/31/2099']}
+
+
+def test_normalize_folds_ocr_digits_and_accents():
+    assert normalize('  St4nf0rd   Univ-ersity ') == 'st4nford univ ersity'
+    assert normalize('Zürich') == 'zurich'
+
+
+def test_alias_resolves_to_canonical_name(index):
+    assert index.canonical('Dhaka University') == 'University of Dhaka'
+    assert index.canonical('UNIVERSITY 0F DHAKA') == 'University of Dhaka'
+    # The alias and the canonical name are one institution in the ranking
+    names = [name for name, _ in index.top_k('Dhaka University', k=5)]
+    assert names.count('University of Dhaka') == 1
+
+
+def test_weak_or_ambiguous_matches_stay_unresolved(index):
+    assert index.canonical('Michigan State University') is None
+    assert index.canonical('Dhaka International University') is None
+    assert index.canonical('') is None
+
+
+def test_top_k_is_sorted(index):
+    scores = [score for _, score in index.top_k('Stanf0rd Univers1ty', k=3)]
+    assert scores == sorted(scores, reverse=True)
+    assert index.top_k('Stanf0rd Univers1ty', k=1)[0] == ('Stanford University', 100.0)
+
+
+def test_different_institutions_do_not_match():
+    result = validate_data_yolo(card('Michigan State University'), 'John Doe', 'University of Michigan')
+    assert result["university_match"] < 70
+    assert not result["is_valid_card"]
+
+
+def test_aliases_and_ocr_noise_match_through_canonical_names():
+    result = validate_data_yolo(card('UNIVERSITY 0F DHAKA'), 'John Doe', 'Dhaka University')
+    assert result["university_canonical"] == 'University of Dhaka'
+    assert result["university_match"] == 100.0
+    assert result["is_valid_card"]
+
+
+def test_unresolved_side_falls_back_to_raw_similarity():
+    result = validate_data_yolo(card('Harvard Universty'), 'John Doe', 'Harvard University')
+    assert result["university_canonical"] is None
+    assert result["university_match"] == ratio('Harvard University', 'Harvard Universty')
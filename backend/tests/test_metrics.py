@@ -0,0 +1,85 @@
+import pytest
+from app.metrics import MetricsRegistry
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+def sample_lines(registry):
+    return [line for line in registry.render().splitlines() if not line.startswith('#')]
+
+
+def test_counter_renders_per_label_set(registry):
+    requests = registry.counter('requests_total', 'Requests', ('endpoint', 'status'))
+    requests.inc(endpoint='/process', status=200)
+    requests.inc(2, endpoint='/process', status=200)
+    requests.inc(endpoint='/process', status=500)
+    text = registry.render()
+    assert '# HELP requests_total Requests\n# TYPE requests_total counter\n' in text
+    assert sample_lines(registry) == ['requests_total{endpoint="/process",status="200"} 3',
+                                      'requests_total{endpoint="/process",status="500"} 1']
+
+
+def test_label_values_are_escaped(registry):
+    errors = registry.counter('errors_total', 'Errors', ('reason',))
+    errors.inc(reason='bad "quote"\\\n')
+    assert sample_lines(registry) == ['errors_total{reason="bad \\"quote\\"\\\\\\n"} 1']
+
+
+def test_histogram_renders_cumulative_buckets(registry):
+    latency = registry.histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, stage='ocr')
+    assert sample_lines(registry) == ['latency_seconds_bucket{stage="ocr",le="0.1"} 2',
+                                      'latency_seconds_bucket{stage="ocr",le="1.0"} 3',
+                                      'latency_seconds_bucket{stage="ocr",le="+Inf"} 4',
+                                      'latency_seconds_sum{stage="ocr"} 3.65',
+                                      'latency_seconds_count{stage="ocr"} 4']
+
+
+def test_collected_gauge_reads_at_render(registry):
+    inflight = {'nlp': 1}
+    registry.gauge('inflight', 'In flight', ('endpoint',),
+                   collect=lambda: {(name,): value for name, value in inflight.items()})
+    assert sample_lines(registry) == ['inflight{endpoint="nlp"} 1']
+    inflight['nlp'] = 3
+    assert sample_lines(registry) == ['inflight{endpoint="nlp"} 3']
+
+
+def make_metrics(registry):
+    return (registry.counter('requests_total', 'Requests', ('endpoint',)),
+            registry.gauge('memory_bytes', 'Memory', ('model',)),
+            registry.histogram('latency_seconds', 'Latency', (), buckets=(1.0,)))
+
+
+def test_drain_and_merge_combine_worker_metrics():
+    front, worker = MetricsRegistry(), MetricsRegistry()
+    requests, memory, latency = make_metrics(front)
+    worker_requests, worker_memory, worker_latency = make_metrics(worker)
+    requests.inc(endpoint='/process')
+    latency.observe(0.5)
+    memory.set(10, model='yolo')
+    for _ in range(2):
+        worker_requests.inc(endpoint='/process')
+        worker_latency.observe(2.0)
+    worker_memory.set(20, model='yolo')
+
+    front.merge(worker.drain())
+    assert sample_lines(front) == ['requests_total{endpoint="/process"} 3',
+                                   'memory_bytes{model="yolo"} 20',
+                                   'latency_seconds_bucket{le="1.0"} 1',
+                                   'latency_seconds_bucket{le="+Inf"} 3',
+                                   'latency_seconds_sum 4.5',
+                                   'latency_seconds_count 3']
+    # Draining hands values over once, so merging again adds nothing
+    assert worker.drain() == {}
+    front.merge(worker.drain())
+    assert 'requests_total{endpoint="/process"} 3' in sample_lines(front)
+
+
+def test_collected_gauges_are_not_drained(registry):
+    registry.gauge('inflight', 'In flight', (), collect=lambda: {(): 1})
+    registry.render()
+    assert registry.drain() == {}
@@ -0,0 +1,33 @@
+import os
+import pytest
+from app.model_registry import registry
+
+
+@pytest.mark.parametrize('name, source, expected', [
+    ('yolo', os.path.join('runs', 'detect', 'train3', 'weights', 'best.pt'), None),
+    ('nlp', 'en_core_web_md', None),
+    ('nlp_small', os.path.join('models', 'ner'), None),
+    ('ocr', ['en', 'bn'], ('en', 'bn')),
+    ('ocr', 'en', ('en',)),
+])
+def test_reload_sources_allowed_per_model_kind(name, source, expected):
+    assert registry.check_source(name, source) == (source if expected is None else expected)
+
+
+@pytest.mark.parametrize('name, source', [
+    ('yolo', '/etc/passwd'),
+    ('yolo', os.path.join('runs', '..', 'app.py')),
+    ('yolo', 'en_core_web_md'),
+    ('nlp', os.path.join('..', 'elsewhere')),
+    ('ocr', []),
+    ('ocr', ['en', '../x']),
+    ('ocr', 5),
+])
+def test_reload_sources_refused(name, source):
+    with pytest.raises(ValueError):
+        registry.check_source(name, source)
+
+
+def test_unknown_model():
+    with pytest.raises(KeyError):
+        registry.check_source('missing', 'x')
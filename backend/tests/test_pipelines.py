@@ -0,0 +1,18 @@
+import pytest
+from app import pipelines
+from app.pipelines import boot_models
+
+
+def test_transformer_tier_is_not_loaded_at_boot():
+    assert boot_models(['yolo', 'nlp']) == ['yolo', 'ocr', 'nlp_small']
+    assert 'nlp' not in boot_models(['auto'])
+
+
+def test_boot_transformer_loads_it_at_startup(monkeypatch):
+    monkeypatch.setattr(pipelines, 'LAZY_MODELS', ())
+    assert boot_models(['nlp']) == ['ocr', 'nlp_small', 'nlp']
+
+
+def test_unknown_boot_pipeline():
+    with pytest.raises(ValueError):
+        boot_models(['yolo', 'ocr-only'])
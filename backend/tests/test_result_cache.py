@@ -0,0 +1,130 @@
+import threading
+import pytest
+from app import result_cache
+from app.result_cache import DiskCache, MemoryCache, ResultCache
+
+
+class Clock:
+    # Stands in for the time module so expiry and LRU order are deterministic
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def tick(self, seconds=1.0):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'disk'])
+def make_cache(request, tmp_path):
+    def make(max_bytes=10_000, ttl=60):
+        if request.param == 'memory':
+            return MemoryCache(max_bytes=max_bytes, ttl=ttl)
+        return DiskCache(str(tmp_path / 'results.sqlite3'), max_bytes=max_bytes, ttl=ttl)
+    return make
+
+
+def entry_size(key, value):
+    return len(key) + len(result_cache.json.dumps(value))
+
+
+def test_round_trip(make_cache, clock):
+    cache = make_cache()
+    cache.set('k', {"Name": ["John Doe"]})
+    assert cache.get('k') == {"Name": ["John Doe"]}
+    assert cache.get('missing') is None
+
+
+def test_least_recently_used_entry_is_evicted_first(make_cache, clock):
+    cache = make_cache(max_bytes=3 * entry_size('a', 'x' * 10))
+    for key in 'abc':
+        cache.set(key, 'x' * 10)
+        clock.tick()
+    # Reading 'a' makes 'b' the least recently used
+    assert cache.get('a') == 'x' * 10
+    clock.tick()
+    cache.set('d', 'x' * 10)
+    assert cache.get('b') is None
+    assert [cache.get(key) is not None for key in 'acd'] == [True, True, True]
+
+
+def test_byte_limit_is_respected(make_cache, clock):
+    limit = 5 * entry_size('k00', 'x' * 20)
+    cache = make_cache(max_bytes=limit)
+    for i in range(20):
+        cache.set(f'k{i:02d}', 'x' * 20)
+        clock.tick()
+    stats = cache.stats()
+    assert stats["bytes"] <= limit
+    assert stats["entries"] == 5
+    assert cache.get('k19') is not None
+    assert cache.get('k00') is None
+
+
+def test_replacing_a_key_does_not_double_count(make_cache, clock):
+    cache = make_cache()
+    cache.set('k', 'x' * 10)
+    cache.set('k', 'y' * 10)
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"]) == (1, entry_size('k', 'y' * 10))
+    assert cache.get('k') == 'y' * 10
+
+
+def test_entries_expire_after_ttl(make_cache, clock):
+    cache = make_cache(ttl=60)
+    cache.set('k', 1)
+    clock.tick(59)
+    assert cache.get('k') == 1
+    clock.tick(2)
+    assert cache.get('k') is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_memory_cache_skips_values_larger_than_the_limit(clock):
+    cache = MemoryCache(max_bytes=10, ttl=60)
+    cache.set('k', 'x' * 50)
+    assert cache.get('k') is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_result_cache_counts_hits_and_misses_across_threads(clock):
+    cache = ResultCache(MemoryCache(max_bytes=10_000, ttl=60))
+    cache.set('hit', 1)
+
+    def lookup():
+        for _ in range(500):
+            cache.get('hit')
+            cache.get('miss')
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (4000, 4000)
+
+
+def test_result_cache_treats_backend_errors_as_misses():
+    class Broken:
+        def get(self, key):
+            raise OSError("disk gone")
+
+        def set(self, key, value):
+            raise OSError("disk gone")
+
+        def stats(self):
+            return {}
+
+    cache = ResultCache(Broken())
+    cache.set('k', 1)
+    assert cache.get('k') is None
+    assert cache.stats() == {"hits": 0, "misses": 1}
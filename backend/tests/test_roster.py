@@ -0,0 +1,90 @@
+import pytest
+from app.roster import Roster, blocking_keys, soundex
+
+
+@pytest.fixture
+def roster():
+    roster = Roster()
+    roster.add('Mirza Mohibul Hasan', 'University of Dhaka', 's1')
+    roster.add('Ayesha Rahman', 'BRAC University', 's2')
+    roster.add('John Smith', 'Stanford University', 's3')
+    return roster
+
+
+def write_csv(path, text):
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_soundex():
+    assert soundex('robert') == soundex('rupert') == 'r163'
+    assert soundex('ashcraft') == 'a261'
+    assert soundex('tymczak') == 't522'
+
+
+def test_blocking_keys_ignore_token_order():
+    assert blocking_keys('Hasan, Mirza') == blocking_keys('Mirza Hasan')
+
+
+def test_verify_finds_noisy_name(roster):
+    result = roster.verify('MIRZA M0HIBUL HASAN', 'University of Dhaka')
+    assert result["on_roster"]
+    assert result["best"]["id"] == 's1'
+    assert result["best"]["university_match"] is True
+
+
+def test_verify_rejects_other_university(roster):
+    result = roster.verify('John Smith', 'University of Dhaka')
+    assert not result["on_roster"]
+    assert result["best"]["university_match"] is False
+
+
+def test_verify_unknown_name(roster):
+    assert not roster.verify('Zed Quux')["on_roster"]
+    assert roster.verify('')["candidates"] == []
+
+
+def test_add_with_same_id_replaces_entry(roster):
+    roster.add('Ayesha Siddiqua', 'BRAC University', 's2')
+    assert len(roster) == 3
+    assert roster.entries['s2']["name"] == 'Ayesha Siddiqua'
+    assert not any('s2' in block for key, block in roster.blocks.items()
+                   if key not in blocking_keys('Ayesha Siddiqua'))
+
+
+def test_add_without_id_assigns_unused_ids():
+    roster = Roster()
+    roster.add('A Person', entry_id='1')
+    assert roster.add('B Person') == '2'
+    assert roster.add('C Person') == '3'
+
+
+def test_remove_drops_entry_and_empty_blocks(roster):
+    keys = roster.entries['s3']["keys"]
+    assert roster.remove('s3')
+    assert not roster.remove('s3')
+    assert 's3' not in roster.entries
+    assert all('s3' not in roster.blocks.get(key, ()) for key in keys)
+    assert all(roster.blocks.values())
+    assert not roster.verify('John Smith')["on_roster"]
+
+
+def test_load_replaces_roster(roster, tmp_path):
+    path = write_csv(tmp_path / 'roster.csv', 'student_id,full_name,institution\n9,Karim Ahmed,North South University\n')
+    assert roster.load(path) == 1
+    assert list(roster.entries) == ['9']
+    assert roster.verify('Karim Ahmed', 'North South University')["on_roster"]
+    assert roster.source == path
+
+
+def test_failed_load_keeps_current_roster(roster, tmp_path):
+    path = write_csv(tmp_path / 'roster.csv', 'student,school\nKarim Ahmed,North South University\n')
+    with pytest.raises(ValueError):
+        roster.load(path)
+    assert len(roster) == 3
+    assert roster.verify('Ayesha Rahman', 'BRAC University')["on_roster"]
+
+
+def test_add_many_requires_name_column():
+    with pytest.raises(ValueError):
+        Roster().add_many([{'id': '1', 'university': 'BRAC University'}])
@@ -0,0 +1,67 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.scheduler import MicroBatcher
+
+
+class RecordingBatch:
+    # batch_fn doubling each item, remembering the batches it saw; any
+    # item equal to `bad` makes the whole call fail
+    def __init__(self, bad=None):
+        self.bad = bad
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def __call__(self, items):
+        with self._lock:
+            self.batches.append(list(items))
+        if self.bad in items:
+            raise ValueError(f"bad item {self.bad}")
+        return [item * 2 for item in items]
+
+
+def test_flushes_when_the_batch_is_full():
+    batch_fn = RecordingBatch()
+    batcher = MicroBatcher('full', batch_fn, max_batch_size=4, max_wait_ms=10_000)
+    futures = [batcher.submit(item) for item in range(4)]
+    started = time.monotonic()
+    assert [future.result(timeout=2) for future in futures] == [0, 2, 4, 6]
+    # Well before the 10 s wait runs out
+    assert time.monotonic() - started < 2
+    assert batch_fn.batches == [[0, 1, 2, 3]]
+
+
+def test_flushes_a_partial_batch_after_max_wait():
+    batch_fn = RecordingBatch()
+    batcher = MicroBatcher('wait', batch_fn, max_batch_size=100, max_wait_ms=50)
+    started = time.monotonic()
+    assert batcher(21, timeout=2) == 42
+    assert 0.04 <= time.monotonic() - started < 2
+    assert batch_fn.batches == [[21]]
+    assert batcher.stats()["batch_size_histogram"] == {1: 1}
+
+
+def test_a_failing_item_does_not_fail_the_others():
+    batch_fn = RecordingBatch(bad=3)
+    batcher = MicroBatcher('retry', batch_fn, max_batch_size=5, max_wait_ms=10_000)
+    futures = {item: batcher.submit(item) for item in range(5)}
+    for item, future in futures.items():
+        if item == 3:
+            with pytest.raises(ValueError):
+                future.result(timeout=2)
+        else:
+            assert future.result(timeout=2) == item * 2
+    # One batched call, then one call per item
+    assert batch_fn.batches[0] == [0, 1, 2, 3, 4]
+    assert batch_fn.batches[1:] == [[item] for item in range(5)]
+
+
+def test_concurrent_callers_get_their_own_results():
+    batcher = MicroBatcher('callers', RecordingBatch(), max_batch_size=8, max_wait_ms=5)
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(lambda item: batcher(item, timeout=5), range(200)))
+    assert results == [item * 2 for item in range(200)]
+    stats = batcher.stats()
+    assert stats["items"] == 200
+    assert max(stats["batch_size_histogram"]) <= 8
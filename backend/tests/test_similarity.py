@@ -0,0 +1,106 @@
+import random
+import pytest
+from app import similarity
+
+NAME_WORDS = ('mirza', 'hasan', 'mohibul', 'ali', 'khan', 'rahman', 'md', 'abdul', 'karim', 'ahmed')
+
+
+def reference_lcs(a, b):
+    previous = [0] * (len(b) + 1)
+    for char in a:
+        current = [0]
+        for j, other in enumerate(b):
+            current.append(previous[j] + 1 if char == other else max(previous[j + 1], current[j]))
+        previous = current
+    return previous[-1]
+
+
+def reference_ratio(a, b):
+    a, b = a.lower(), b.lower()
+    if not a and not b:
+        return 100.0
+    return 200.0 * reference_lcs(a, b) / (len(a) + len(b))
+
+
+def random_text(rng, alphabet='abcde ', max_length=12):
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, max_length)))
+
+
+def random_name(rng):
+    return ' '.join(rng.choice(NAME_WORDS) for _ in range(rng.randint(0, 4)))
+
+
+@pytest.fixture
+def numpy_only(monkeypatch):
+    # Force the NumPy kernel even when rapidfuzz is installed
+    monkeypatch.setattr(similarity, 'process', None)
+
+
+def test_numpy_kernel_matches_reference_lcs(numpy_only):
+    rng = random.Random(0)
+    for _ in range(300):
+        query = random_text(rng)
+        candidates = [random_text(rng) for _ in range(rng.randint(1, 8))]
+        scores = similarity.ratio_many(query, candidates)
+        for candidate, score in zip(candidates, scores):
+            assert score == pytest.approx(reference_ratio(query, candidate))
+
+
+def test_numpy_kernel_early_exit_keeps_scores_above_cutoff(numpy_only):
+    rng = random.Random(1)
+    for cutoff in (30, 50, 70, 90):
+        for _ in range(100):
+            query = random_text(rng, 'abc')
+            candidates = [random_text(rng, 'abc') for _ in range(6)]
+            scores = similarity.ratio_many(query, candidates, cutoff)
+            for candidate, score in zip(candidates, scores):
+                expected = reference_ratio(query, candidate)
+                assert score == (pytest.approx(expected) if expected >= cutoff else 0)
+
+
+def test_numpy_kernel_edge_cases(numpy_only):
+    assert list(similarity.ratio_many('', ['', 'a'])) == [100.0, 0.0]
+    assert len(similarity.ratio_many('abc', [])) == 0
+    assert similarity.ratio('John Doe', 'JOHN DOE') == 100.0
+    # Non-ASCII code points compare as whole characters
+    assert similarity.ratio('Zürich', 'Zurich') == pytest.approx(reference_ratio('Zürich', 'Zurich'), abs=0.01)
+
+
+def test_token_set_fallback_cases(numpy_only):
+    scores = similarity.token_set_ratio_many('Mirza Hasan', ['Hasan Mirza', 'Mirza Mohibul Hasan', 'Karim Ali'])
+    assert scores[0] == 100.0
+    assert scores[1] == 100.0
+    assert scores[2] < 50
+
+
+def test_numpy_and_rapidfuzz_ratio_agree(monkeypatch):
+    pytest.importorskip('rapidfuzz')
+    rng = random.Random(2)
+    for _ in range(200):
+        query = random_text(rng, 'abcdefg ', 20)
+        candidates = [random_text(rng, 'abcdefg ', 20) for _ in range(5)]
+        cutoff = rng.choice((0, 50, 70))
+        expected = similarity.ratio_many(query, candidates, cutoff)
+        monkeypatch.setattr(similarity, 'process', None)
+        actual = similarity.ratio_many(query, candidates, cutoff)
+        monkeypatch.undo()
+        assert actual == pytest.approx(expected)
+
+
+def test_numpy_and_rapidfuzz_token_set_ratio_agree(monkeypatch):
+    pytest.importorskip('rapidfuzz')
+    rng = random.Random(3)
+    for _ in range(500):
+        query = random_name(rng)
+        candidates = [random_name(rng) for _ in range(3)]
+        expected = similarity.token_set_ratio_many(query, candidates)
+        monkeypatch.setattr(similarity, 'process', None)
+        actual = similarity.token_set_ratio_many(query, candidates)
+        monkeypatch.undo()
+        assert actual == pytest.approx(expected)
+
+
+def test_extract_orders_by_score():
+    matches = similarity.extract('Jon Smith', ['Jane Doe', 'John Smith', 'Jon Smyth'], limit=2)
+    assert [index for index, _ in matches] == [1, 2]
+    assert matches[0][1] >= matches[1][1]
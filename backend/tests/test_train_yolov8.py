@@ -0,0 +1,63 @@
+import os
+import pytest
+from train_yolov8 import validate_labels
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    # add(split, image name, label text or None for no label file)
+    def add(split, name, label):
+        for folder in ('images', 'labels'):
+            os.makedirs(tmp_path / split / folder, exist_ok=True)
+        (tmp_path / split / 'images' / name).write_bytes(b'')
+        if label is not None:
+            stem = os.path.splitext(name)[0]
+            (tmp_path / split / 'labels' / f'{stem}.txt').write_text(label)
+    add.path = str(tmp_path)
+    return add
+
+
+def test_clean_dataset(dataset):
+    dataset('train', 'a.jpg', '0 0.5 0.5 0.2 0.1\n1 0.3 0.3 0.1 0.1\n\n')
+    dataset('valid', 'b.png', '2 0.1 0.1 0.2 0.1 0.2 0.2 0.1 0.2\n')
+    report = validate_labels(dataset.path, num_classes=3)
+    assert report == {"images": 2, "boxes": 3, "errors": [], "warnings": [],
+                      "per_class": {0: 1, 1: 1, 2: 1}}
+
+
+def test_bad_lines_are_errors(dataset):
+    dataset('train', 'a.jpg', '\n'.join([
+        'x 0.5 0.5 0.2 0.1',
+        '3 0.5 0.5 0.2 0.1',
+        '0 0.5 0.5 0.2',
+        '0 0.5 0.5 1.2 0.1',
+        '0 0.5 0.5 0.0 0.1',
+        '0 0.5 0.5 0.2 0.1',
+    ]))
+    report = validate_labels(dataset.path, num_classes=3)
+    label = os.path.join('train', 'labels', 'a.txt')
+    assert report["errors"] == [f"{label}:1: not numeric",
+                                f"{label}:2: class 3 out of range",
+                                f"{label}:3: 3 coordinates",
+                                f"{label}:4: coordinates outside 0-1",
+                                f"{label}:5: empty box"]
+    assert report["boxes"] == 1
+
+
+def test_missing_labels_and_duplicates_are_warnings(dataset):
+    dataset('train', 'a.jpg', None)
+    dataset('train', 'b.jpg', '0 0.5 0.5 0.2 0.1\n0 0.50001 0.5 0.2 0.1\n')
+    dataset('train', 'notes.txt', None)
+    report = validate_labels(dataset.path, num_classes=1)
+    assert report["images"] == 2
+    assert report["boxes"] == 1
+    assert report["errors"] == []
+    assert report["warnings"] == [f"{os.path.join('train', 'labels', 'a.txt')}: missing, image trains as background",
+                                  f"{os.path.join('train', 'labels', 'b.txt')}:2: duplicate box"]
+
+
+def test_only_requested_splits_are_read(dataset):
+    dataset('train', 'a.jpg', '0 0.5 0.5 0.2 0.1\n')
+    dataset('test', 'b.jpg', '5 0.5 0.5 0.2 0.1\n')
+    report = validate_labels(dataset.path, num_classes=1, splits=('train', 'valid'))
+    assert (report["images"], report["errors"]) == (1, [])
@@ -0,0 +1,112 @@
+import cv2
+import numpy as np
+import pytest
+from app import video
+from app.video import (FieldVotes, FrameVerifier, extract_fields_from_frames, frame_hash,
+                       hash_distance, sharpness, _gate_image)
+
+
+def card(seed):
+    # Blocky synthetic frame: sharp edges, and a hash that differs per seed
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, (8, 9, 3)).astype(np.uint8)
+    return cv2.resize(blocks, (640, 480), interpolation=cv2.INTER_NEAREST)
+
+
+def noisy(frame, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.clip(frame.astype(np.int16) + rng.integers(-4, 5, frame.shape), 0, 255).astype(np.uint8)
+
+
+def blurred(frame):
+    return cv2.GaussianBlur(frame, (0, 0), 12)
+
+
+class FakeModels:
+    # Stands in for YOLO and OCR: every detected frame has all three fields,
+    # read as the next entry of `readings`
+    def __init__(self, readings):
+        self.readings = list(readings)
+        self.detected = 0
+        self.ocr_batches = []
+
+    def detect(self, frames):
+        self.detected += len(frames)
+        return [self.readings.pop(0)]
+
+    def crop(self, frame, result):
+        crops = [(field, frame[10:110, 10:210].copy(), (10, 10, 210, 110), 0.9) for field in result]
+        # Crop arrays in, texts out: remember which field each array is
+        self._texts = {id(image): result[field] for field, image, _, _ in crops}
+        return crops
+
+    def recognize(self, images):
+        self.ocr_batches.append(len(images))
+        return [(self._texts[id(image)], 0.9) for image in images]
+
+
+@pytest.fixture
+def models(monkeypatch):
+    def install(readings):
+        fake = FakeModels(readings)
+        monkeypatch.setattr(video, 'detect_fields_yolo', fake.detect)
+        monkeypatch.setattr(video, 'crop_detections_yolo', fake.crop)
+        monkeypatch.setattr(video, 'recognize_crops', fake.recognize)
+        return fake
+    return install
+
+
+def reading(name='John Doe', university='Stanford University', expiration='12/31/2099'):
+    return {"Expiration": expiration, "Name": name, "University": university}
+
+
+def test_near_duplicate_frames_hash_close_and_distinct_frames_far():
+    first = frame_hash(_gate_image(card(1)))
+    assert hash_distance(first, frame_hash(_gate_image(noisy(card(1))))) <= video.FRAME_HASH_DISTANCE
+    assert hash_distance(first, frame_hash(_gate_image(card(2)))) > video.FRAME_HASH_DISTANCE
+
+
+def test_blur_lowers_sharpness_below_the_gate():
+    assert sharpness(_gate_image(card(1))) >= video.FRAME_MIN_SHARPNESS
+    assert sharpness(_gate_image(blurred(card(1)))) < video.FRAME_MIN_SHARPNESS
+
+
+def test_field_votes_group_similar_readings():
+    votes = FieldVotes()
+    assert votes.add('John Doe', 0.6) == 1
+    assert votes.add('Jane Roe', 0.99) == 1
+    # 'Jon Doe' is close enough to agree with 'John Doe'
+    assert votes.add('Jon Doe', 0.9) == 2
+    assert votes.best() == ('Jon Doe', 2)
+    assert FieldVotes().best() == (None, 0)
+
+
+def test_duplicate_and_blurry_frames_skip_detection(models):
+    fake = models([reading(), reading()])
+    verifier = FrameVerifier(agree=3)
+    for frame in (card(1), noisy(card(1)), blurred(card(5)), card(2)):
+        verifier.add(frame)
+    assert fake.detected == 2
+    assert {key: verifier.stats[key] for key in ('frames', 'duplicate', 'blurry', 'detected')} == \
+        {"frames": 4, "duplicate": 1, "blurry": 1, "detected": 2}
+
+
+def test_votes_converge_and_settled_fields_are_not_read_again(models):
+    fake = models([reading(name='Jane Roe'), reading(), reading(), reading(), reading()])
+    frames = (card(seed) for seed in range(1, 20))
+    fields, summary = extract_fields_from_frames(frames, agree=3)
+    assert fields == {"Expiration": ['12/31/2099'], "Name": ['John Doe'], "University": ['Stanford University']}
+    assert summary["agreed"]
+    # The outlier name costs one extra frame, on which only Name is read
+    assert summary["detected"] == 4
+    assert fake.ocr_batches == [3, 3, 3, 1]
+    assert summary["ocr_crops"] == 10
+    assert summary["votes"] == {"Expiration": 3, "Name": 3, "University": 3}
+
+
+def test_gives_up_after_max_frames(models):
+    models([reading(name=name) for name in ('Ann Lee', 'Bob Ray', 'Cid Moe')])
+    fields, summary = extract_fields_from_frames([card(seed) for seed in range(1, 4)], agree=3, max_frames=3)
+    assert not summary["agreed"]
+    assert summary["frames"] == 3
+    assert fields["Expiration"] == ['12/31/2099']
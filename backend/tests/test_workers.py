@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+import pytest
+from multiprocessing import shared_memory
+from app import pipelines
+from app.admission import DeadlineExceeded
+from app.workers import _extract_batch, _read_shared_images
+
+
+def encoded(value):
+    return cv2.imencode('.png', np.full((20, 30, 3), value, np.uint8))[1].tobytes()
+
+
+@pytest.fixture
+def shared():
+    blocks = []
+
+    def write(datas):
+        block = shared_memory.SharedMemory(create=True, size=max(1, sum(map(len, datas))))
+        start = 0
+        for data in datas:
+            block.buf[start:start + len(data)] = data
+            start += len(data)
+        blocks.append(block)
+        return block.name, [len(data) for data in datas]
+    yield write
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def test_read_shared_images_decodes_each_upload(shared):
+    # The pixel-count check reads image headers with Pillow
+    pytest.importorskip('PIL')
+    images = _read_shared_images(*shared([encoded(10), b'not an image', encoded(200)]))
+    assert [image[0, 0, 0] for image in (images[0], images[2])] == [10, 200]
+    assert isinstance(images[1], str)
+
+
+class FakePipelines:
+    def __init__(self, monkeypatch, fail_batch=False, bad=None):
+        self.batches = []
+        self.fail_batch = fail_batch
+        self.bad = bad
+        monkeypatch.setattr(pipelines, 'extract_fields_batch', self.batch)
+        monkeypatch.setattr(pipelines, 'extract_fields', self.single)
+
+    def batch(self, pipeline, images):
+        self.batches.append(len(images))
+        if self.fail_batch:
+            raise RuntimeError("batch failed")
+        return [self.single(pipeline, image) for image in images]
+
+    def single(self, pipeline, image, save_image_path=None, scheduled=True):
+        if int(image[0, 0, 0]) == self.bad:
+            raise ValueError("bad image")
+        return {"value": int(image[0, 0, 0])}
+
+
+def image(value):
+    return np.full((2, 2, 3), value, np.uint8)
+
+
+def test_extract_batch_runs_one_pass_and_keeps_decode_errors(monkeypatch):
+    fake = FakePipelines(monkeypatch)
+    results = _extract_batch('yolo', [image(1), 'not decodable', image(2)])
+    assert results == [(None, {"value": 1}), ('not decodable', None), (None, {"value": 2})]
+    assert fake.batches == [2]
+
+
+def test_extract_batch_retries_alone_when_the_batch_fails(monkeypatch):
+    FakePipelines(monkeypatch, fail_batch=True, bad=2)
+    results = _extract_batch('yolo', [image(1), image(2), image(3)])
+    assert results == [(None, {"value": 1}), ('bad image', None), (None, {"value": 3})]
+
+
+def test_extract_batch_skips_the_model_when_nothing_decoded(monkeypatch):
+    fake = FakePipelines(monkeypatch)
+    assert _extract_batch('yolo', ['broken']) == [('broken', None)]
+    assert fake.batches == []
+
+
+def test_extract_batch_passes_deadlines_on(monkeypatch):
+    def expired(pipeline, images):
+        raise DeadlineExceeded("Request deadline exceeded")
+    monkeypatch.setattr(pipelines, 'extract_fields_batch', expired)
+    with pytest.raises(DeadlineExceeded):
+        _extract_batch('yolo', [image(1)])
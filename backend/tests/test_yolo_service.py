@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from app import yolo_service
+from app.yolo_service import select_boxes_yolo, _iou_one_to_many
+
+EXPIRATION, NAME, UNIVERSITY = 0, 1, 2
+SHAPE = (400, 600, 3)
+
+
+@pytest.fixture(autouse=True)
+def no_padding(monkeypatch):
+    monkeypatch.setattr(yolo_service, 'YOLO_CROP_PAD', 0.0)
+
+
+def select(boxes, shape=SHAPE):
+    xyxy = [box for box, _, _ in boxes]
+    classes = [class_id for _, class_id, _ in boxes]
+    confidences = [confidence for _, _, confidence in boxes]
+    return select_boxes_yolo(xyxy, classes, confidences, shape)
+
+
+def test_iou_one_to_many():
+    boxes = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30], [0, 0, 0, 0]], dtype=np.float32)
+    ious = _iou_one_to_many(np.array([0, 0, 10, 10], dtype=np.float32), boxes)
+    assert ious == pytest.approx([1.0, 50 / 150, 0.0, 0.0])
+
+
+def test_overlapping_boxes_of_one_class_keep_the_best():
+    selected = select([((10, 10, 110, 40), NAME, 0.6),
+                       ((12, 11, 112, 41), NAME, 0.9)])
+    assert selected == [("Name", (12, 11, 112, 41), pytest.approx(0.9))]
+
+
+def test_overlapping_boxes_of_different_classes_are_both_kept():
+    selected = select([((10, 10, 110, 40), NAME, 0.6),
+                       ((12, 11, 112, 41), UNIVERSITY, 0.9)])
+    assert sorted(name for name, _, _ in selected) == ["Name", "University"]
+
+
+def test_weak_small_and_unknown_boxes_are_dropped():
+    selected = select([((10, 10, 110, 40), NAME, 0.1),
+                       ((10, 100, 14, 140), UNIVERSITY, 0.9),
+                       ((10, 200, 110, 240), 7, 0.9),
+                       ((10, 300, 110, 340), EXPIRATION, 0.8)])
+    assert [name for name, _, _ in selected] == ["Expiration"]
+
+
+def test_top_k_keeps_the_most_confident_in_reading_order(monkeypatch):
+    monkeypatch.setattr(yolo_service, 'YOLO_TOP_K', 2)
+    selected = select([((10, 200, 110, 230), UNIVERSITY, 0.7),
+                       ((10, 100, 110, 130), UNIVERSITY, 0.8),
+                       ((10, 300, 110, 330), UNIVERSITY, 0.5)])
+    # The two best boxes, top to bottom
+    assert [box for _, box, _ in selected] == [(10, 100, 110, 130), (10, 200, 110, 230)]
+
+
+def test_padding_is_clamped_to_the_image(monkeypatch):
+    monkeypatch.setattr(yolo_service, 'YOLO_CROP_PAD', 0.5)
+    selected = select([((2, 3, 100, 43), NAME, 0.9),
+                       ((500, 350, 598, 398), UNIVERSITY, 0.9)])
+    boxes = dict((name, box) for name, box, _ in selected)
+    assert boxes["Name"] == (0, 0, 120, 63)
+    assert boxes["University"] == (476, 326, 600, 400)
+
+
+def test_no_boxes():
+    assert select([]) == []
+
@@ -1,21 +1,286 @@
-from ultralytics import YOLO
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from app.utils import IMAGE_EXTENSIONS, label_path_for
 
+""" Field detector training for CPU-only hosts
 
-def train_yolov8():
-    epochs = 100
-    image_size = 640
-    batch_size = 8
-    dataset_path = r"I:\ML Projects\Brain House\ID Verification\backend\data\data.yaml"
-    model_path = "yolov8s.pt"  # Adjust model as necessary
-    model = YOLO(model_path)
-    model.train(data=dataset_path,
-                imgsz=image_size,
-                batch=batch_size,
-                epochs=epochs,
-                device=0,
-                amp=False,
-                plots=True)
+Run from backend/:
+    python train_yolov8.py                  # train, resume the last run, or publish it if finished
+    python train_yolov8.py --check          # only validate the labels
+    python train_yolov8.py --restart --model yolov8n.pt --hours 6
+
+Labels are validated before any epoch runs. Images are decoded once into
+a .npy cache next to each image (or into RAM with --cache ram), so later
+epochs and later experiments skip JPEG decoding. An interrupted run
+resumes from its last.pt. By default training fine-tunes the weights
+being served instead of starting from COCO, which converges in a fraction
+of the epochs. The best weights are then published to YOLO_WEIGHTS_PATH
+with a version record, and exported for YOLO_BACKEND when that is not
+torch.
+"""
+
+DATA_DIR = 'data'
+PROJECT_DIR = os.path.join('runs', 'detect')
+SPLITS = ('train', 'valid', 'test')
+# A trained model that scores this much lower than the published one is
+# not published without --force
+MAX_MAP_DROP = 0.01
+
+
+def dataset_yaml(data_dir=DATA_DIR):
+    # data/data.yaml points at the machine the first model was trained on;
+    # write a copy with this checkout's absolute path
+    import yaml
+
+    with open(os.path.join(data_dir, 'data.yaml')) as f:
+        config = yaml.safe_load(f)
+    config['path'] = os.path.abspath(data_dir)
+    for split, key in (('train', 'train'), ('valid', 'val'), ('test', 'test')):
+        config[key] = os.path.join(split, 'images')
+    os.makedirs('cache', exist_ok=True)
+    path = os.path.join('cache', 'train_data.yaml')
+    with open(path, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return path, config['names']
+
+
+def _split_files(data_dir, split):
+    image_dir = os.path.join(data_dir, split, 'images')
+    if not os.path.isdir(image_dir):
+        return []
+    return sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def validate_labels(data_dir, num_classes, splits=SPLITS):
+    # Errors would make ultralytics drop the image (or the whole label
+    # file) silently; warnings are worth a look but train fine
+    report = {"images": 0, "boxes": 0, "errors": [], "warnings": [], "per_class": {}}
+    for split in splits:
+        for image_path in _split_files(data_dir, split):
+            report["images"] += 1
+            label_path = label_path_for(image_path)
+            name = os.path.relpath(label_path, data_dir)
+            if not os.path.exists(label_path):
+                report["warnings"].append(f"{name}: missing, image trains as background")
+                continue
+            seen = set()
+            with open(label_path) as f:
+                for number, line in enumerate(f, 1):
+                    values = line.split()
+                    if not values:
+                        continue
+                    where = f"{name}:{number}"
+                    try:
+                        class_id, coords = int(values[0]), [float(v) for v in values[1:]]
+                    except ValueError:
+                        report["errors"].append(f"{where}: not numeric")
+                        continue
+                    if not 0 <= class_id < num_classes:
+                        report["errors"].append(f"{where}: class {class_id} out of range")
+                        continue
+                    if len(coords) != 4 and (len(coords) < 6 or len(coords) % 2):
+                        report["errors"].append(f"{where}: {len(coords)} coordinates")
+                        continue
+                    if any(v < 0 or v > 1 for v in coords):
+                        report["errors"].append(f"{where}: coordinates outside 0-1")
+                        continue
+                    if len(coords) == 4:
+                        width, height = coords[2], coords[3]
+                    else:
+                        width = max(coords[0::2]) - min(coords[0::2])
+                        height = max(coords[1::2]) - min(coords[1::2])
+                    if width <= 0 or height <= 0:
+                        report["errors"].append(f"{where}: empty box")
+                        continue
+                    key = (class_id, tuple(round(v, 4) for v in coords))
+                    if key in seen:
+                        report["warnings"].append(f"{where}: duplicate box")
+                        continue
+                    seen.add(key)
+                    report["boxes"] += 1
+                    report["per_class"][class_id] = report["per_class"].get(class_id, 0) + 1
+    return report
+
+
+def dataset_version(data_dir=DATA_DIR, splits=SPLITS):
+    # Label contents plus image names and sizes; changes when the data does
+    digest = hashlib.sha256()
+    for split in splits:
+        for image_path in _split_files(data_dir, split):
+            digest.update(f"{os.path.relpath(image_path, data_dir)}:{os.path.getsize(image_path)}".encode())
+            label_path = label_path_for(image_path)
+            if os.path.exists(label_path):
+                with open(label_path, 'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def final_metrics(run_dir):
+    # Validation metrics of the best epoch, from ultralytics' results.csv
+    path = os.path.join(run_dir, 'results.csv')
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline='') as f:
+        rows = [{key.strip(): value.strip() for key, value in row.items()} for row in csv.DictReader(f)]
+    best = max(rows, key=lambda row: float(row.get('metrics/mAP50-95(B)') or 0), default=None)
+    if best is None:
+        return {}
+    return {
+        "epoch": int(best['epoch']),
+        "epochs": len(rows),
+        "precision": float(best['metrics/precision(B)']),
+        "recall": float(best['metrics/recall(B)']),
+        "map50": float(best['metrics/mAP50(B)']),
+        "map50_95": float(best['metrics/mAP50-95(B)']),
+    }
+
+
+def publish(weights, run_dir, record, force=False):
+    # Copy the trained weights over what the server loads, next to a JSON
+    # record of their version, data and metrics; the previous weights are
+    # kept under their own version
+    from app.model_registry import YOLO_WEIGHTS_PATH, file_version
+    from app.inference_backend import YOLO_BACKEND, YOLO_INT8, export_yolo
+    from app.logger import app_logger
+
+    target = YOLO_WEIGHTS_PATH
+    record_path = os.path.splitext(target)[0] + '.json'
+    if os.path.exists(record_path) and not force:
+        with open(record_path) as f:
+            published = json.load(f).get("metrics", {}).get("map50_95")
+        new = record["metrics"].get("map50_95")
+        if published is not None and new is not None and new < published - MAX_MAP_DROP:
+            print(f"Not publishing: mAP50-95 {new:.4f} is below the published {published:.4f} "
+                  f"(use --force to publish anyway)", file=sys.stderr)
+            return None
+
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    if os.path.exists(target):
+        backup = f"{os.path.splitext(target)[0]}.{file_version(target)}.pt"
+        shutil.copy2(target, backup)
+    shutil.copy2(weights, target + '.tmp')
+    os.replace(target + '.tmp', target)
+    record = dict(record, version=file_version(target), weights=target, run=run_dir)
+    if YOLO_BACKEND != 'torch':
+        record["export"] = export_yolo(target, YOLO_BACKEND, YOLO_INT8)
+    with open(record_path, 'w') as f:
+        json.dump(record, f, indent=2)
+    app_logger.info("Published %s to %s as version %s", weights, target, record['version'])
+    return record
+
+
+def run_finished(checkpoint):
+    # ultralytics strips the optimizer from last.pt and sets its epoch to -1
+    # when a run ends; such a run can't be resumed, only published
+    import torch
+
+    state = torch.load(checkpoint, map_location='cpu', weights_only=False)
+    return state.get('optimizer') is None or state.get('epoch', -1) == -1
+
+
+def train_yolov8(name='cpu', model_path=None, epochs=60, image_size=640, batch_size=16,
+                 hours=None, cache='disk', workers=None, restart=False, strict=False,
+                 force=False, data_dir=DATA_DIR):
+    from app.model_registry import YOLO_WEIGHTS_PATH
+    from app.yolo_service import YOLO_CLASSES
+
+    data_yaml, names = dataset_yaml(data_dir)
+    # The server maps class ids to fields with YOLO_CLASSES
+    if {int(k): v for k, v in names.items()} != YOLO_CLASSES:
+        raise SystemExit(f"Classes in data.yaml {names} do not match the served {YOLO_CLASSES}")
+
+    report = validate_labels(data_dir, len(names))
+    os.makedirs('cache', exist_ok=True)
+    with open(os.path.join('cache', 'label_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Labels: {report['images']} images, {report['boxes']} boxes, "
+          f"{len(report['errors'])} errors, {len(report['warnings'])} warnings "
+          f"(details in cache/label_report.json)", file=sys.stderr)
+    if report["errors"] or (strict and report["warnings"]):
+        for problem in (report["errors"] + report["warnings"])[:20]:
+            print(f"  {problem}", file=sys.stderr)
+        raise SystemExit("Fix the labels above before training")
+
+    cpus = os.cpu_count() or 1
+    import torch
+    torch.set_num_threads(cpus)
+    from ultralytics import YOLO
+
+    run_dir = os.path.join(PROJECT_DIR, name)
+    last = os.path.join(run_dir, 'weights', 'last.pt')
+    started, train_hours = time.time(), None
+    if os.path.exists(last) and not restart:
+        import yaml
+        with open(os.path.join(run_dir, 'args.yaml')) as f:
+            model_path = yaml.safe_load(f).get('model')
+        if run_finished(last):
+            # e.g. training completed but publishing or export failed
+            print(f"{run_dir} already finished training; publishing its weights", file=sys.stderr)
+        else:
+            # Optimizer state, epoch and hyperparameters all come from the checkpoint
+            print(f"Resuming {last}", file=sys.stderr)
+            YOLO(last).train(resume=True)
+            train_hours = round((time.time() - started) / 3600, 2)
+    else:
+        # Fine-tune what is being served when there is one
+        model_path = model_path or (YOLO_WEIGHTS_PATH if os.path.exists(YOLO_WEIGHTS_PATH) else 'yolov8s.pt')
+        YOLO(model_path).train(
+            data=data_yaml, imgsz=image_size, batch=batch_size, epochs=epochs, time=hours,
+            device='cpu', workers=workers if workers is not None else min(8, cpus),
+            cache=False if cache == 'none' else cache, amp=False, plots=True,
+            patience=15, cos_lr=True, close_mosaic=10, save_period=5,
+            project=PROJECT_DIR, name=name, exist_ok=True)
+        train_hours = round((time.time() - started) / 3600, 2)
+
+    best = os.path.join(run_dir, 'weights', 'best.pt')
+    record = {
+        "dataset": dataset_version(data_dir),
+        "base": model_path,
+        "metrics": final_metrics(run_dir),
+        "trained_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "train_hours": train_hours,
+    }
+    return publish(best, run_dir, record, force)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Field detector training for CPU-only hosts')
+    parser.add_argument('--name', default='cpu', help=f'run directory under {PROJECT_DIR}')
+    parser.add_argument('--model', default=None,
+                        help='starting weights (default: the served weights, else yolov8s.pt)')
+    parser.add_argument('--epochs', type=int, default=60)
+    parser.add_argument('--hours', type=float, default=None, help='time budget; overrides --epochs')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--batch', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=None, help='data loader processes')
+    parser.add_argument('--cache', choices=('disk', 'ram', 'none'), default='disk',
+                        help='where decoded images are kept between epochs')
+    parser.add_argument('--restart', action='store_true', help='ignore last.pt and start over')
+    parser.add_argument('--strict', action='store_true', help='treat label warnings as errors')
+    parser.add_argument('--force', action='store_true', help='publish even if mAP dropped')
+    parser.add_argument('--check', action='store_true', help='only validate the labels')
+    args = parser.parse_args(argv)
+
+    if args.check:
+        _, names = dataset_yaml()
+        report = validate_labels(DATA_DIR, len(names))
+        print(json.dumps(report, indent=2))
+        return 1 if report["errors"] or (args.strict and report["warnings"]) else 0
+
+    record = train_yolov8(args.name, args.model, args.epochs, args.imgsz, args.batch, args.hours,
+                          args.cache, args.workers, args.restart, args.strict, args.force)
+    if record is None:
+        return 1
+    print(json.dumps(record, indent=2))
+    return 0
 
 
 if __name__ == "__main__":
-    train_yolov8()
+    sys.exit(main())